@@ -0,0 +1,6 @@
+""" Entry point for `python -m LNG_AI` """
+import sys
+
+from LNG_AI import cli
+
+sys.exit(cli.main())
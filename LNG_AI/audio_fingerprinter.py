@@ -0,0 +1,328 @@
+""" Perceptual audio fingerprints (spectral peak hashing) to detect duplicate content """
+import json
+import os
+
+import numpy as np
+
+from LNG_AI import constants
+from LNG_AI import work_lease
+
+# Spectrogram
+FINGERPRINT_SAMPLE_RATE = 8000
+FFT_WINDOW_SIZE = 1024
+FFT_HOP_SIZE = 512
+NUM_OF_FREQUENCY_BINS = 512  # rfft gives 513 bins, the Nyquist bin is dropped
+
+# Peak picking: local maxima within (2 * neighborhood + 1) frames/bins
+PEAK_TIME_NEIGHBORHOOD = 10
+PEAK_FREQUENCY_NEIGHBORHOOD = 10
+PEAK_MIN_LOG_MAGNITUDE_ABOVE_MEDIAN = 2.0
+
+# Hashing: each anchor peak is paired with the next FAN_OUT peaks in its target zone
+FAN_OUT = 5
+MAX_TIME_DELTA_IN_FRAMES = 63
+
+# A chuck is a duplicate when enough of its hashes line up (same time offset)
+# with a single already-indexed chuck, over a long enough contiguous stretch, so
+# a shared intro jingle or ad does not mark a whole chuck
+MIN_ALIGNED_MATCHES = 30
+MIN_ALIGNED_MATCH_RATIO = 0.3
+MIN_ALIGNED_DURATION_IN_SECONDS = 120
+MAX_ALIGNED_GAP_IN_SECONDS = 10
+
+INDEX_FILE_NAME = "index.npz"
+CHUCKS_FILE_NAME = "chucks.json"
+
+
+def frame_in_milliseconds() -> float:
+    """Duration of a spectrogram frame"""
+    return 1000 * FFT_HOP_SIZE / FINGERPRINT_SAMPLE_RATE
+
+
+def compute_fingerprint(samples: np.ndarray) -> tuple:
+    """Hash spectral peak pairs of mono samples at FINGERPRINT_SAMPLE_RATE
+
+    Returns:
+        (hashes, anchor_frames): uint32 hashes and the frame index of their anchor peaks
+    """
+    if len(samples) < FFT_WINDOW_SIZE:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int32)
+
+    # Log-magnitude spectrogram
+    samples = samples.astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(
+        samples, FFT_WINDOW_SIZE)[::FFT_HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(
+        frames * np.hanning(FFT_WINDOW_SIZE).astype(np.float32), axis=1))
+    log_spectrum = np.log1p(spectrum[:, :NUM_OF_FREQUENCY_BINS])
+
+    # Peaks are local maxima (separable max filter) and loud enough
+    neighborhood_max = _max_filter(
+        log_spectrum, PEAK_TIME_NEIGHBORHOOD, axis=0)
+    neighborhood_max = _max_filter(
+        neighborhood_max, PEAK_FREQUENCY_NEIGHBORHOOD, axis=1)
+    is_peak = (log_spectrum == neighborhood_max) & (
+        log_spectrum > np.median(log_spectrum) + PEAK_MIN_LOG_MAGNITUDE_ABOVE_MEDIAN)
+    peak_frames, peak_bins = np.nonzero(is_peak)  # sorted by frame
+
+    # Pair each anchor with the following peaks
+    hashes = []
+    anchor_frames = []
+    for distance in range(1, FAN_OUT + 1):
+        anchor_frame = peak_frames[:-distance]
+        time_delta = peak_frames[distance:] - anchor_frame
+        valid = (time_delta > 0) & (time_delta <= MAX_TIME_DELTA_IN_FRAMES)
+        hashes.append((peak_bins[:-distance][valid].astype(np.uint32) << 15) |
+                      (peak_bins[distance:][valid].astype(np.uint32) << 6) |
+                      time_delta[valid].astype(np.uint32))
+        anchor_frames.append(anchor_frame[valid].astype(np.int32))
+
+    return np.concatenate(hashes), np.concatenate(anchor_frames)
+
+
+def compute_audio_segment_fingerprint(audio) -> tuple:
+    """compute_fingerprint for a pydub AudioSegment"""
+    audio = audio.set_frame_rate(
+        FINGERPRINT_SAMPLE_RATE).set_channels(1)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return compute_fingerprint(samples)
+
+
+def get_covering_duplicate_chucks(duplicates: dict, chuck_keyword: constants.AudioFileKeyword,
+                                  num_of_chucks: int) -> dict:
+    """Longer chucks (e.g., half hour chucks for transcribing) all of whose chucks are duplicates
+
+    Args:
+        duplicates: duplicate chucks of chuck_keyword, chuck name -> matched chuck info
+        num_of_chucks: number of chuck_keyword chucks of the episode
+
+    Returns:
+        chuck name -> matched info of its first chuck, with the names of all its chucks
+    """
+    chuck_in_minutes = constants.CHUCK_KEYWORD_TO_MINUTES[chuck_keyword]
+    covering_duplicates = {}
+    for covering_keyword, covering_in_minutes in constants.CHUCK_KEYWORD_TO_MINUTES.items():
+        if covering_in_minutes <= chuck_in_minutes or covering_in_minutes % chuck_in_minutes:
+            continue
+        num_of_covered_chucks = covering_in_minutes // chuck_in_minutes
+        for covering_idx in range(-(-num_of_chucks // num_of_covered_chucks)):
+            covered_chuck_names = [f"{idx + 1}{chuck_keyword.value}" for idx in range(
+                covering_idx * num_of_covered_chucks,
+                min((covering_idx + 1) * num_of_covered_chucks, num_of_chucks))]
+            if all(name in duplicates for name in covered_chuck_names):
+                covering_duplicates[f"{covering_idx + 1}{covering_keyword.value}"] = dict(
+                    duplicates[covered_chuck_names[0]], covered_chucks=covered_chuck_names)
+    return covering_duplicates
+
+
+def _max_filter(values: np.ndarray, neighborhood: int,
+                axis: int) -> np.ndarray:
+    pad_width = [(0, 0), (0, 0)]
+    pad_width[axis] = (neighborhood, neighborhood)
+    padded = np.pad(values, pad_width, mode="constant",
+                    constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        padded, 2 * neighborhood + 1, axis=axis)
+    return windows.max(axis=-1)
+
+
+def _get_longest_contiguous_duration_in_seconds(
+        frames: np.ndarray, max_gap_in_seconds: float = MAX_ALIGNED_GAP_IN_SECONDS) -> float:
+    """Longest stretch of the frames with no gap above max_gap_in_seconds"""
+    if len(frames) == 0:
+        return 0
+    frames = np.sort(frames)
+    max_gap_in_frames = max_gap_in_seconds * 1000 / frame_in_milliseconds()
+    run_starts = np.concatenate(
+        [[0], np.nonzero(np.diff(frames) > max_gap_in_frames)[0] + 1])
+    run_ends = np.concatenate([run_starts[1:], [len(frames)]]) - 1
+    longest_in_frames = int((frames[run_ends] - frames[run_starts]).max())
+    return longest_in_frames * frame_in_milliseconds() / 1000
+
+
+class AudioFingerprintIndex():
+    """On-disk index of fingerprint hashes of all processed chucks
+
+    Layout:
+        {root}/index.npz: hashes (sorted) with their chuck ids and anchor frames
+        {root}/chucks.json: chuck id -> {"audio_file_dir":..., "chuck_name":...}
+    """
+
+    def __init__(self, index_root: str = None):
+        if index_root is None:
+            index_root = constants.RootDirectory.FINGERPRINT_INDEX_ROOT.value
+        self.index_root = index_root
+        self.reload()
+
+    def reload(self):
+        """Re-read the index from disk (e.g., updated by another worker)"""
+        self.chucks = []
+        self.hashes = np.empty(0, dtype=np.uint32)
+        self.chuck_ids = np.empty(0, dtype=np.int32)
+        self.anchor_frames = np.empty(0, dtype=np.int32)
+        self._load()
+
+    def is_indexed(self, audio_file_dir: str) -> bool:
+        """Whether chucks of the given episode are already in the index"""
+        return any(chuck["audio_file_dir"] ==
+                   audio_file_dir for chuck in self.chucks)
+
+    def index_episode(self, audio, audio_file_dir: str,
+                      chuck_keyword: constants.AudioFileKeyword) -> dict:
+        """Fingerprint an episode, mark its chucks overlapping indexed audio, then index it
+
+        Args:
+            audio: pydub AudioSegment of the whole episode
+            audio_file_dir: directory of the episode
+            chuck_keyword: chucks to judge (e.g., FIVE_MINUTES_CHUCK)
+
+        Returns:
+            duplicate chucks found, chuck name -> matched chuck info, including longer
+            chucks (e.g., half hour chucks for transcribing) made of duplicate chucks only
+        """
+        # fingerprint chuck by chuck to bound the spectrogram size
+        audio = audio.set_frame_rate(FINGERPRINT_SAMPLE_RATE).set_channels(1)
+        chuck_in_milliseconds = constants.CHUCK_KEYWORD_TO_MINUTES[chuck_keyword] * \
+            constants.ONE_MINUTE_IN_MILLISECONDS
+        num_of_chucks = max(1, -(-len(audio) // chuck_in_milliseconds))
+
+        duplicates = {}
+        batch_hashes, batch_chuck_ids, batch_anchor_frames = [], [], []
+        for idx in range(num_of_chucks):
+            chuck_name = f"{idx + 1}{chuck_keyword.value}"
+            hashes, anchor_frames = compute_audio_segment_fingerprint(
+                audio[idx * chuck_in_milliseconds:(idx + 1) * chuck_in_milliseconds])
+
+            # chucks of the same episode are excluded, so hashes are added once at the end
+            matched = self.find_overlap(
+                hashes, anchor_frames, exclude_audio_file_dir=audio_file_dir)
+            if matched is not None:
+                duplicates[chuck_name] = matched
+
+            self.chucks.append(
+                {"audio_file_dir": audio_file_dir, "chuck_name": chuck_name})
+            batch_hashes.append(hashes)
+            batch_chuck_ids.append(
+                np.full(len(hashes), len(self.chucks) - 1, dtype=np.int32))
+            batch_anchor_frames.append(anchor_frames)
+
+        self._add(np.concatenate(batch_hashes), np.concatenate(batch_chuck_ids),
+                  np.concatenate(batch_anchor_frames))
+        duplicates.update(get_covering_duplicate_chucks(
+            duplicates, chuck_keyword, num_of_chucks))
+        return duplicates
+
+    def find_overlap(self, hashes: np.ndarray, anchor_frames: np.ndarray,
+                     exclude_audio_file_dir: str = None) -> dict:
+        """Find the indexed chuck best aligned with the given hashes
+
+        Returns:
+            None if no chuck overlaps, otherwise
+            {"audio_file_dir":..., "chuck_name":..., "offset_in_seconds":..., "aligned_match_ratio":...}
+        """
+        if len(hashes) == 0 or len(self.hashes) == 0:
+            return None
+
+        # All (query, index) pairs sharing a hash, without python loops
+        lefts = np.searchsorted(self.hashes, hashes, side="left")
+        rights = np.searchsorted(self.hashes, hashes, side="right")
+        counts = rights - lefts
+        if counts.sum() == 0:
+            return None
+        query_positions = np.repeat(np.arange(len(hashes)), counts)
+        index_positions = np.repeat(lefts - np.cumsum(counts) + counts, counts) + \
+            np.arange(counts.sum())
+
+        matched_chuck_ids = self.chuck_ids[index_positions]
+        if exclude_audio_file_dir is not None:
+            excluded_ids = [idx for idx, chuck in enumerate(self.chucks)
+                            if chuck["audio_file_dir"] == exclude_audio_file_dir]
+            keep = ~np.isin(matched_chuck_ids, excluded_ids)
+            matched_chuck_ids = matched_chuck_ids[keep]
+            query_positions = query_positions[keep]
+            index_positions = index_positions[keep]
+            if len(matched_chuck_ids) == 0:
+                return None
+
+        # Matches of real overlaps agree on the time offset
+        offsets = self.anchor_frames[index_positions].astype(
+            np.int64) - anchor_frames[query_positions]
+        pairs, pair_counts = np.unique(
+            np.stack([matched_chuck_ids.astype(np.int64), offsets]), axis=1, return_counts=True)
+
+        # audio not cut on the same hop grid lands on adjacent offsets, count them too
+        # (pairs are sorted by chuck id then offset)
+        aligned_counts = pair_counts.copy()
+        is_adjacent = (pairs[0, 1:] == pairs[0, :-1]) & (
+            pairs[1, 1:] - pairs[1, :-1] == 1)
+        aligned_counts[:-1] += np.where(is_adjacent, pair_counts[1:], 0)
+        aligned_counts[1:] += np.where(is_adjacent, pair_counts[:-1], 0)
+
+        best = int(np.argmax(aligned_counts))
+        aligned_matches = int(aligned_counts[best])
+        aligned_match_ratio = aligned_matches / len(hashes)
+        if aligned_matches < MIN_ALIGNED_MATCHES or aligned_match_ratio < MIN_ALIGNED_MATCH_RATIO:
+            return None
+
+        # the aligned matches must cover a long enough stretch of the query without gaps
+        # (at most half of a short query, e.g., the last chuck of an episode)
+        (best_chuck_id, best_offset) = (int(pairs[0, best]), int(pairs[1, best]))
+        is_aligned = (matched_chuck_ids == best_chuck_id) & (
+            np.abs(offsets - best_offset) <= 1)
+        aligned_duration_in_seconds = _get_longest_contiguous_duration_in_seconds(
+            anchor_frames[query_positions[is_aligned]])
+        query_duration_in_seconds = _get_longest_contiguous_duration_in_seconds(
+            anchor_frames, max_gap_in_seconds=np.inf)
+        if aligned_duration_in_seconds < min(MIN_ALIGNED_DURATION_IN_SECONDS, query_duration_in_seconds / 2):
+            return None
+
+        chuck = self.chucks[best_chuck_id]
+        return {
+            "audio_file_dir": chuck["audio_file_dir"],
+            "chuck_name": chuck["chuck_name"],
+            "offset_in_seconds": round(best_offset * frame_in_milliseconds() / 1000, 2),
+            "aligned_match_ratio": round(aligned_match_ratio, 4),
+            "aligned_duration_in_seconds": round(aligned_duration_in_seconds, 2),
+        }
+
+    def save(self):
+        """Store the index to disk
+
+        Each file is replaced atomically, chucks (append-only) first, so readers
+        never see hashes of unknown chucks.
+        """
+        os.makedirs(self.index_root, exist_ok=True)
+        with work_lease.atomic_output_path(os.path.join(self.index_root, CHUCKS_FILE_NAME)) as tmp_path:
+            with open(tmp_path, "w") as chucks_file:
+                json.dump(self.chucks, chucks_file)
+        with work_lease.atomic_output_path(os.path.join(self.index_root, INDEX_FILE_NAME)) as tmp_path:
+            # file object, np.savez would append .npz to the temporary path
+            with open(tmp_path, "wb") as index_file:
+                np.savez(index_file, hashes=self.hashes,
+                         chuck_ids=self.chuck_ids, anchor_frames=self.anchor_frames)
+
+    def _add(self, hashes: np.ndarray, chuck_ids: np.ndarray,
+             anchor_frames: np.ndarray):
+        # keep hashes sorted for searchsorted lookups: sort the batch only, then merge
+        # it into the sorted index in one linear pass
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        insert_positions = np.searchsorted(self.hashes, hashes, side="right")
+        self.hashes = np.insert(self.hashes, insert_positions, hashes)
+        self.chuck_ids = np.insert(
+            self.chuck_ids, insert_positions, chuck_ids[order])
+        self.anchor_frames = np.insert(
+            self.anchor_frames, insert_positions, anchor_frames[order])
+
+    def _load(self):
+        index_path = os.path.join(self.index_root, INDEX_FILE_NAME)
+        chucks_path = os.path.join(self.index_root, CHUCKS_FILE_NAME)
+        if not (os.path.isfile(index_path) and os.path.isfile(chucks_path)):
+            return
+
+        with np.load(index_path) as index:
+            self.hashes = index["hashes"]
+            self.chuck_ids = index["chuck_ids"]
+            self.anchor_frames = index["anchor_frames"]
+        with open(chucks_path, "r") as chucks_file:
+            self.chucks = json.load(chucks_file)
@@ -0,0 +1,59 @@
+""" Pack short audio files into shared Whisper requests & split transcripts back
+
+Only plain computations on lengths & segments, no audio or openai dependency.
+"""
+import bisect
+
+from LNG_AI import constants
+
+# files shorter than this (previews, final chucks) are packed into shared Whisper requests
+PACKABLE_AUDIO_MAX_IN_MILLISECONDS = 2 * constants.ONE_MINUTE_IN_MILLISECONDS
+# silence between packed files, so Whisper segments do not span two files
+PACK_SILENCE_GAP_IN_MILLISECONDS = 2000
+# margin below the Whisper API file size limit, for mp3 headers & bitrate overshoot
+PACK_SIZE_MARGIN = 0.9
+
+
+def get_max_pack_in_milliseconds(
+        export_profile: constants.AudioExportProfile = constants.AudioExportProfile.SPEECH) -> float:
+    """Longest pack fitting one Whisper request once exported with the given profile"""
+    bitrate_in_kbps = constants.AUDIO_EXPORT_PROFILE_PARAMETERS[export_profile]["bitrate_in_kbps"]
+    return PACK_SIZE_MARGIN * constants.WHISPER_API_FILE_SIZE_LIMIT_IN_BYTES * 8 / bitrate_in_kbps
+
+
+def group_into_packs(audio_lengths: list, max_pack_in_milliseconds: float) -> list:
+    """Group (audio path, length in milliseconds) pairs into packs, in the given order
+
+    Packs are at most max_pack_in_milliseconds long, silence gaps included. Files longer
+    than PACKABLE_AUDIO_MAX_IN_MILLISECONDS are left out, they are sent on their own.
+    """
+    packs = []
+    pack, pack_in_milliseconds = [], 0
+    for audio_path, audio_in_milliseconds in audio_lengths:
+        if audio_in_milliseconds > PACKABLE_AUDIO_MAX_IN_MILLISECONDS:
+            continue
+
+        # pack_in_milliseconds already counts the gap after the last packed file
+        if pack and pack_in_milliseconds + audio_in_milliseconds > max_pack_in_milliseconds:
+            packs.append(pack)
+            pack, pack_in_milliseconds = [], 0
+        pack.append(audio_path)
+        pack_in_milliseconds += audio_in_milliseconds + PACK_SILENCE_GAP_IN_MILLISECONDS
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def split_packed_segments(segments: list, begins_in_milliseconds: list) -> list:
+    """Split Whisper segments of a pack back into per-file transcripts
+
+    Every segment goes to the file containing its midpoint. A file without any
+    segment (or only blank ones) gets None, it has to be transcribed on its own.
+    """
+    texts = [[] for _ in begins_in_milliseconds]
+    for segment in segments:
+        midpoint_in_milliseconds = 500 * (segment["start"] + segment["end"])
+        idx = max(0, bisect.bisect_right(
+            begins_in_milliseconds, midpoint_in_milliseconds) - 1)
+        texts[idx].append(segment["text"])
+    return ["".join(text).strip() or None for text in texts]
@@ -1,15 +1,29 @@
 """ Transcribe audio files by AI """
+import contextlib
+import logging
 import os
+import tempfile
 
 import openai
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
 
+from LNG_AI import audio_packing
 from LNG_AI import constants
-
+from LNG_AI import rate_limiter
+from LNG_AI import utils
+from LNG_AI import work_lease
 
 class AudioTranscriber():
     """Transcribe audio files by AI"""
 
-    def __init__(self, mode: constants.TranscribeMode, keys: dict):
+    def __init__(self, mode: constants.TranscribeMode, keys: dict,
+                 lease_manager=None):
+        """
+        Args:
+            lease_manager: work_lease.LeaseManager, if given, chucks are claimed before
+                being transcribed, so several workers can share the storage root
+        """
         if mode == constants.TranscribeMode.WHISPER:
             if not "openai_api_key" in keys:
                 raise KeyError("open_ai_key not exists")
@@ -17,9 +31,53 @@ class AudioTranscriber():
 
         self.mode = mode
         self.key = keys
-
-    def transcribe_dir(self, audio_file_dir: str, is_preview_only: bool):
-        """Transcribe eligible mp3 files in the given directory"""
+        self.lease_manager = lease_manager
+
+    def transcribe_dir(self, audio_file_dir: str, is_preview_only: bool,
+                       chuck_keyword=constants.AudioFileKeyword.FIVE_MINUTES_CHUCK):
+        """Transcribe eligible mp3 files in the given directory
+
+        chuck_keyword: constants.AudioFileKeyword or str for re-chunked granularities (e.g., '_10_mins_chuck')
+        """
+        for audio_path in self._get_eligible_audio_paths(
+                audio_file_dir, is_preview_only, chuck_keyword):
+            self._transcribe_file(audio_path)
+
+    def transcribe_dirs(self, audio_file_dirs: list, is_preview_only: bool,
+                        chuck_keyword=constants.AudioFileKeyword.FIVE_MINUTES_CHUCK,
+                        pack_short_audios: bool = True):
+        """Transcribe eligible mp3 files in the given directories
+
+        With pack_short_audios, short files (previews & final chucks) of all directories are
+        concatenated into packs up to the Whisper API file size limit, each pack is transcribed
+        by one request with timestamps, then split back into per-file transcripts.
+        """
+        audio_paths = []
+        for audio_file_dir in audio_file_dirs:
+            audio_paths.extend(self._get_eligible_audio_paths(
+                audio_file_dir, is_preview_only, chuck_keyword))
+
+        if pack_short_audios and self.mode == constants.TranscribeMode.WHISPER:
+            for pack in self._pack_short_audios(audio_paths):
+                try:
+                    self._transcribe_pack(pack)
+                except (rate_limiter.RetryableRequestError, openai.error.OpenAIError,
+                        CouldntDecodeError) as err:
+                    # e.g., retries exhausted, the pack rejected (invalid file) or a file
+                    # not decodable, files of the pack are transcribed one by one below
+                    logging.warning(
+                        f"packed transcribing of {len(pack)} files failed ({err!r}), fall back")
+
+        # packed files already have their transcripts, so they are ignored here
+        for audio_path in audio_paths:
+            self._transcribe_file(audio_path)
+
+    def _get_eligible_audio_paths(self, audio_file_dir: str, is_preview_only: bool,
+                                  chuck_keyword) -> list:
+        audio_paths = []
+        chuck_keyword_value = chuck_keyword.value if isinstance(
+            chuck_keyword, constants.AudioFileKeyword) else chuck_keyword
+        duplicate_chucks = utils.FileUtils.get_duplicate_chucks(audio_file_dir)
         file_names = os.listdir(audio_file_dir)
         for file_name in file_names:
             file_path = f"{audio_file_dir}/{file_name}"
@@ -30,45 +88,155 @@ class AudioTranscriber():
                 continue
 
             preview_condition = constants.AudioFileKeyword.PREVIEW.value in file_name
-            five_minutes_chuck_condition = (
-                constants.AudioFileKeyword.FIVE_MINUTES_CHUCK.value in file_name) and (not is_preview_only)
+            chuck_condition = (
+                chuck_keyword_value in file_name) and (not is_preview_only)
 
-            if not (preview_condition or five_minutes_chuck_condition):
+            if not (preview_condition or chuck_condition):
                 print(f"not applicable file path: {file_path}",
                       f"(is_preview_only={is_preview_only})")
                 continue
 
-            self._transcribe_file(file_path)
+            if utils.FileUtils.is_duplicate_chuck(file_path, duplicate_chucks):
+                print(f"skip duplicate chuck: {file_path}",
+                      f"(overlaps {duplicate_chucks[os.path.splitext(file_name)[0]]['audio_file_dir']})")
+                continue
+
+            audio_paths.append(file_path)
+        return audio_paths
 
-    def _transcribe_file(self, audio_path: str):
-        # Compute output path
+    def _get_output_txt_path(self, audio_path: str) -> str:
         (path_wo_ext, _) = os.path.splitext(audio_path)
         path_items = path_wo_ext.split('/')
         output_txt_dir = "/".join(path_items[:-1]) + "/" + self.mode.value
-        output_txt_path = output_txt_dir + "/" + path_items[-1] + ".txt"
+        return output_txt_dir + "/" + path_items[-1] + ".txt"
+
+    def _pack_short_audios(self, audio_paths: list) -> list:
+        """Group not yet transcribed short files into packs fitting one Whisper request"""
+        audio_lengths = [(audio_path, utils.AudioUtils.get_audio_length_in_milliseconds(audio_path))
+                         for audio_path in audio_paths
+                         if not os.path.isfile(self._get_output_txt_path(audio_path))]
+        return audio_packing.group_into_packs(
+            audio_lengths, audio_packing.get_max_pack_in_milliseconds(constants.AudioExportProfile.SPEECH))
+
+    def _transcribe_pack(self, audio_paths: list):
+        with contextlib.ExitStack() as leases:
+            claimed_audio_paths = []
+            for audio_path in audio_paths:
+                lease = self._try_claim_chuck(os.path.splitext(audio_path)[0])
+                if lease is None:
+                    continue
+                leases.enter_context(lease)
+                # another worker may have finished it right before the claim
+                if not os.path.isfile(self._get_output_txt_path(audio_path)):
+                    claimed_audio_paths.append(audio_path)
+            if not claimed_audio_paths:
+                return
+
+            # concatenate files with silence gaps, remembering where each file starts
+            packed_audio = AudioSegment.empty()
+            begins_in_milliseconds = []
+            for audio_path in claimed_audio_paths:
+                if begins_in_milliseconds:
+                    packed_audio += AudioSegment.silent(
+                        audio_packing.PACK_SILENCE_GAP_IN_MILLISECONDS)
+                begins_in_milliseconds.append(len(packed_audio))
+                packed_audio += AudioSegment.from_file(audio_path)
+
+            print(f"==> start transcribing {len(claimed_audio_paths)} packed files",
+                  f"({len(packed_audio) / 1000:.0f} seconds)")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                packed_audio_path = f"{tmp_dir}/packed.mp3"
+                utils.AudioUtils.export_audio(
+                    packed_audio, packed_audio_path, constants.AudioExportProfile.SPEECH)
+                segments = self._whisper_transribe_file_segments(
+                    packed_audio_path)
+
+            texts = audio_packing.split_packed_segments(segments, begins_in_milliseconds)
+            for audio_path, text in zip(claimed_audio_paths, texts):
+                # left without transcript, so transcribe_dirs sends it on its own
+                if text is None:
+                    print(f"no packed segment for {audio_path}, fall back")
+                    continue
+                output_txt_path = self._get_output_txt_path(audio_path)
+                os.makedirs(os.path.dirname(output_txt_path), exist_ok=True)
+                print(f"store packed transcript to {output_txt_path}")
+                self._whisper_parse_and_store_transcribe_result(
+                    text, output_txt_path)
+
+    def transcribe_file(self, audio_path: str, overwrite: bool = False,
+                        transcribe_parameters: dict = None):
+        """Transcribe a single mp3 file
+
+        Args:
+            overwrite: transcribe again even if the transcript exists (e.g., repetitive transcript)
+            transcribe_parameters: extra Whisper API parameters (e.g., {"temperature": 0.2})
+        """
+        self._transcribe_file(audio_path, overwrite, transcribe_parameters)
+
+    def _transcribe_file(self, audio_path: str, overwrite: bool = False,
+                         transcribe_parameters: dict = None):
+        # Compute output path
+        (path_wo_ext, _) = os.path.splitext(audio_path)
+        output_txt_path = self._get_output_txt_path(audio_path)
+        output_txt_dir = os.path.dirname(output_txt_path)
 
         if not os.path.exists(output_txt_dir):
             os.makedirs(output_txt_dir)
 
-        if os.path.isfile(output_txt_path):
+        if os.path.isfile(output_txt_path) and not overwrite:
             print("ignore transcribe requirement",
                   f", since {output_txt_path} already exists")
             return
 
-        # Transcribe & Parse
-        print(f"==> start transcribing {audio_path} to",
-              f"{output_txt_path} (not yet exist)")
-        if self.mode == constants.TranscribeMode.WHISPER:
-            raw_result_str = self._whisper_transribe_file(audio_path)
-            self._whisper_parse_and_store_transcribe_result(
-                raw_result_str, output_txt_path)
-
-    def _whisper_transribe_file(self, audio_path: str) -> str:
-        audio_file = open(audio_path, "rb")
-        transcript = openai.Audio.transcribe("whisper-1", audio_file)
+        lease = self._try_claim_chuck(path_wo_ext)
+        if lease is None:
+            print(f"{audio_path} is claimed by another worker, skip it")
+            return
+
+        with lease:
+            # another worker may have finished it right before the claim
+            if os.path.isfile(output_txt_path) and not overwrite:
+                return
+
+            # Transcribe & Parse
+            print(f"==> start transcribing {audio_path} to",
+                  f"{output_txt_path} (overwrite={overwrite})")
+            if self.mode == constants.TranscribeMode.WHISPER:
+                raw_result_str = self._whisper_transribe_file(
+                    audio_path, transcribe_parameters)
+                self._whisper_parse_and_store_transcribe_result(
+                    raw_result_str, output_txt_path)
+
+    def _try_claim_chuck(self, path_wo_ext: str):
+        if self.lease_manager is None:
+            return contextlib.nullcontext()
+        # e.g., {video id}/3_5_mins_chuck/whisper
+        chuck_key = "/".join(path_wo_ext.split('/')[-2:] + [self.mode.value])
+        return self.lease_manager.try_claim(constants.LeaseKind.CHUCK, chuck_key)
+
+    def _whisper_transribe_file(self, audio_path: str,
+                                transcribe_parameters: dict = None) -> str:
+        def transcribe():
+            # re-open on every attempt, a failed upload consumes the file object
+            with open(audio_path, "rb") as audio_file:
+                return openai.Audio.transcribe(
+                    "whisper-1", audio_file, **(transcribe_parameters or {}))
+
+        transcript = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_WHISPER, transcribe)
         return transcript['text']
 
+    def _whisper_transribe_file_segments(self, audio_path: str) -> list:
+        """Timestamped segments, e.g., [{"start": 0.0, "end": 4.2, "text": ...}, ...]"""
+        def transcribe():
+            with open(audio_path, "rb") as audio_file:
+                return openai.Audio.transcribe(
+                    "whisper-1", audio_file, response_format="verbose_json")
+
+        transcript = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_WHISPER, transcribe)
+        return transcript['segments']
+
     def _whisper_parse_and_store_transcribe_result(
             self, raw_result_str: str, output_txt_path: str):
-        with open(output_txt_path, "w", encoding="utf-8") as text_file:
-            text_file.write(raw_result_str)
+        work_lease.write_text_atomically(output_txt_path, raw_result_str)
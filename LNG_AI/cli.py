@@ -0,0 +1,387 @@
+""" Single entry point for all LNG_AI commands
+
+Heavy dependencies (openai, pydub, pytube, requests...) are only imported by the
+sub-command which needs them, so e.g. `--help`, `check` or `dataset` start instantly.
+
+The top-level scripts (e.g., prepare_dataset.py) run the same sub-commands through
+run_command, so both entry points share one set of arguments.
+
+Usage:
+    python -m LNG_AI <fetch|transcribe|check|repair|dataset|finetune|sweep|generate|status> [args]
+    python -m LNG_AI --profile_imports <sub-command> [args]
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+# only enums & values, cheap to import
+from LNG_AI import constants
+
+START_TIME = time.perf_counter()
+
+# (module name, seconds) of every lazy import, reported by --profile_imports
+_import_profile = []
+
+
+def _lazy_import(module_name: str):
+    start_time = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _import_profile.append((module_name, time.perf_counter() - start_time))
+    return module
+
+
+def _load_env():
+    dotenv = _lazy_import("dotenv")
+    dotenv.load_dotenv()
+
+
+def _set_openai_api_key():
+    openai = _lazy_import("openai")
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+
+
+def fetch(args):
+    """Download latest audio files of the given channels"""
+    _load_env()
+    audio_fingerprinter = _lazy_import("LNG_AI.audio_fingerprinter")
+    utils = _lazy_import("LNG_AI.utils")
+    work_lease = _lazy_import("LNG_AI.work_lease")
+    youtube_audio_fetecher = _lazy_import("LNG_AI.youtube_audio_fetecher")
+
+    fetcher = youtube_audio_fetecher.YoutubeAudioFetcher(
+        os.getenv("yt_api_key"), transcribe_chuck_keyword=constants.AudioFileKeyword[
+            args.transcribe_chuck_keyword],
+        fingerprint_index=audio_fingerprinter.AudioFingerprintIndex(),
+        lease_manager=work_lease.LeaseManager())
+    audio_infos = []
+    for channel_id in args.channel_ids:
+        audio_infos.extend(fetcher.obtain_audio_infos(
+            channel_id, args.num_of_request_results))
+    utils.FileUtils.store_as_html(audio_infos, "audio_infos.md")
+    utils.FileUtils.store_as_csv(audio_infos, "audio_infos.csv")
+
+
+def transcribe(args):
+    """Transcribe downloaded audio files"""
+    _load_env()
+    audio_transcriber = _lazy_import("LNG_AI.audio_transcriber")
+    utils = _lazy_import("LNG_AI.utils")
+    work_lease = _lazy_import("LNG_AI.work_lease")
+
+    transcriber = audio_transcriber.AudioTranscriber(
+        constants.TranscribeMode.WHISPER, {
+            "openai_api_key": os.getenv("OPENAI_API_KEY")},
+        lease_manager=work_lease.LeaseManager())
+    transcriber.transcribe_dirs(utils.FileUtils.get_audio_file_directories(),
+                                args.preview_only, chuck_keyword=args.chuck_keyword,
+                                pack_short_audios=not args.disable_packing)
+
+
+def check(args):
+    """Check data integrity of audio files & transcripts, store a repair plan of failures"""
+    data_integrity_checker = _lazy_import("LNG_AI.data_integrity_checker")
+    checker = data_integrity_checker.DataIntegrityChecker()
+    checker.check_audio_files_creation()
+    checker.check_transcripts_creation()
+    checker.check_transcripts_repetitive_word_occurance()
+    checker.repair_plan.save(args.repair_plan_path)
+    print(
+        f"Repair plan ({checker.repair_plan}) stored to {args.repair_plan_path}")
+
+
+def repair(args):
+    """Repair only the failures listed in a repair plan"""
+    _load_env()
+    audio_transcriber = _lazy_import("LNG_AI.audio_transcriber")
+    repair_plan = _lazy_import("LNG_AI.repair_plan")
+    work_lease = _lazy_import("LNG_AI.work_lease")
+    youtube_audio_fetecher = _lazy_import("LNG_AI.youtube_audio_fetecher")
+
+    plan = repair_plan.RepairPlan.load(args.repair_plan_path)
+    print(f"Repair plan: {plan}")
+    if plan.is_empty():
+        return
+    lease_manager = work_lease.LeaseManager()
+    transcriber = audio_transcriber.AudioTranscriber(
+        constants.TranscribeMode.WHISPER, {
+            "openai_api_key": os.getenv("OPENAI_API_KEY")},
+        lease_manager=lease_manager)
+    fetcher = youtube_audio_fetecher.YoutubeAudioFetcher(
+        os.getenv("yt_api_key"), lease_manager=lease_manager)
+    repair_plan.RepairExecutor(transcriber, fetcher).execute(plan)
+
+
+def dataset(args):
+    """Create jsonl dataset portions from transcripts"""
+    assert 0 <= args.repetitive_word_threshold <= 1
+    utils = _lazy_import("LNG_AI.utils")
+    utils.JsonlUtils.create_jsonl_database(
+        repetitive_word_threshold=args.repetitive_word_threshold, debug=False,
+        chuck_keyword=args.chuck_keyword, seed=args.seed, stratified=args.stratified, portions=args.portions)
+
+
+def finetune(args):
+    """Fine-tune a model on a jsonl dataset"""
+    _load_env()
+    _set_openai_api_key()
+    utils = _lazy_import("LNG_AI.utils")
+    utils.OpenaiUtils.fine_tune(jsonl_dataset_path=args.jsonl_dataset_path)
+
+
+def sweep(args):
+    """Fine-tune & evaluate one model per jsonl dataset portion"""
+    _load_env()
+    _set_openai_api_key()
+    fine_tune_sweep = _lazy_import("LNG_AI.fine_tune_sweep")
+    utils = _lazy_import("LNG_AI.utils")
+
+    # unset options keep the defaults of fine_tune_sweep, which is only imported here
+    options = {option: getattr(args, option) for option in [
+        "base_model", "max_concurrent_uploads", "poll_interval_in_seconds", "num_of_sentences_generated"]
+        if getattr(args, option) is not None}
+    portion_sweep = fine_tune_sweep.FineTuneSweep(args.portions, **options)
+
+    # one permission for the whole sweep, the rest runs unattended
+    print(f"Estimated cost: ${portion_sweep.estimate_cost()}")
+    if not utils.InteractionUtils.request_continue_permission():
+        return
+    portion_sweep.run()
+
+
+def generate(args):
+    """Generate sentences with a fine-tuned model"""
+    _load_env()
+    _set_openai_api_key()
+    utils = _lazy_import("LNG_AI.utils")
+    utils.OpenaiUtils.test_fine_tune_model(
+        model_name=args.model_name, num_of_sentences_generated=args.num_of_sentences_generated)
+
+
+def status(args):
+    """View fine-tuned models, or the training process of one of them"""
+    _load_env()
+    _set_openai_api_key()
+    utils = _lazy_import("LNG_AI.utils")
+    if args.model_id is None:
+        utils.OpenaiUtils.view_fine_tune_models()
+    else:
+        utils.OpenaiUtils.view_training_process(model_id=args.model_id)
+
+
+def _chuck_keyword(value: str):
+    # enum name (e.g., HALF_HOUR_CHUCK), or a re-chunked granularity (e.g., _10_mins_chuck)
+    if value in constants.AudioFileKeyword.__members__:
+        return constants.AudioFileKeyword[value]
+    return value
+
+
+def _add_global_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile_imports",
+        action="store_true",
+        help="report time spent importing modules of the sub-command")
+    parser.add_argument(
+        "--storage_root",
+        type=str,
+        help="directory shared by all workers (e.g., an NFS mount)",
+        default=".")
+
+
+def _add_fetch_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--channel_ids",
+        type=str,
+        nargs="+",
+        help=f"youtube channel IDs (e.g., {constants.LNG_CHANNEL_ID} for LNG)",
+        default=[constants.LNG_CHANNEL_ID])
+    parser.add_argument(
+        "--num_of_request_results",
+        type=int,
+        help="number of latest videos per channel (maximum 50)",
+        default=10)
+    parser.add_argument(
+        "--transcribe_chuck_keyword",
+        type=str,
+        # 1-hour chucks are archival copies of full.mp3, too large for Whisper API
+        choices=[keyword.name for keyword in constants.CHUCK_KEYWORD_TO_MINUTES
+                 if keyword != constants.AudioFileKeyword.HOUR_CHUCK],
+        help="chuck granularity exported for transcribing",
+        default=constants.AudioFileKeyword.FIVE_MINUTES_CHUCK.name)
+
+
+def _add_chuck_keyword_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--chuck_keyword",
+        type=_chuck_keyword,
+        help="chuck granularity of the transcripts (e.g., FIVE_MINUTES_CHUCK, HALF_HOUR_CHUCK "
+        "or _10_mins_chuck re-chunked by rechunk_audio_files.py)",
+        default=constants.AudioFileKeyword.FIVE_MINUTES_CHUCK)
+
+
+def _add_transcribe_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--preview_only", action="store_true")
+    parser.add_argument(
+        "--disable_packing",
+        action="store_true",
+        help="send every file in its own request, instead of packing previews & final chucks")
+    _add_chuck_keyword_argument(parser)
+
+
+def _add_repair_plan_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--repair_plan_path",
+        type=str,
+        help="path of the repair plan json",
+        default="repair_plan.json")
+
+
+def _add_dataset_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--repetitive_word_threshold", type=float, default=0.1)
+    _add_chuck_keyword_argument(parser)
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="sampling seed, same seed & transcripts give the same portions",
+        default=0)
+    parser.add_argument(
+        "--stratified",
+        action="store_true",
+        help="every episode contributes its share of windows to every portion")
+    parser.add_argument(
+        "--portions",
+        type=float,
+        nargs="+",
+        help="portions to create (e.g., 0.1 0.5 1), all of constants.DATASET_PORTIONS if not given",
+        default=None)
+
+
+def _add_finetune_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--jsonl_dataset_path",
+        type=str,
+        help="jsonl dataset path (e.g., jsonl_dataset/jsonl_dataset_0_percent_297.jsonl)",
+        required=True)
+
+
+def _add_sweep_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--portions",
+        type=float,
+        nargs="+",
+        help="jsonl dataset portions (e.g., 0.1 0.5 1), created by the dataset sub-command",
+        required=True)
+    parser.add_argument("--base_model", type=str,
+                        help="default: babbage", default=None)
+    parser.add_argument("--max_concurrent_uploads", type=int,
+                        help="default: 2", default=None)
+    parser.add_argument("--poll_interval_in_seconds", type=float,
+                        help="default: 60", default=None)
+    parser.add_argument(
+        "--num_of_sentences_generated",
+        type=int,
+        help="number of sentences generated to evaluate every model (default: 30)",
+        default=None)
+
+
+def _add_generate_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        help="model name (e.g., babbage:ft-personal-2023-03-31-16-53-00)",
+        required=True)
+    parser.add_argument("--num_of_sentences_generated", type=int, default=10)
+
+
+def _add_status_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--model_id",
+        type=str,
+        help="model id (e.g., ft-KmDSzIzE92iea4FWRgc9Ya5o), list all models if not given",
+        default=None)
+
+
+# sub-command -> (function, arguments)
+COMMANDS = {
+    "fetch": (fetch, _add_fetch_arguments),
+    "transcribe": (transcribe, _add_transcribe_arguments),
+    "check": (check, _add_repair_plan_arguments),
+    "repair": (repair, _add_repair_plan_arguments),
+    "dataset": (dataset, _add_dataset_arguments),
+    "finetune": (finetune, _add_finetune_arguments),
+    "sweep": (sweep, _add_sweep_arguments),
+    "generate": (generate, _add_generate_arguments),
+    "status": (status, _add_status_arguments),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Parser of all sub-commands"""
+    parser = argparse.ArgumentParser(prog="lng_ai")
+    _add_global_arguments(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, (func, add_arguments) in COMMANDS.items():
+        command_parser = subparsers.add_parser(command, help=func.__doc__)
+        add_arguments(command_parser)
+        command_parser.set_defaults(func=func)
+    return parser
+
+
+def build_command_parser(command: str) -> argparse.ArgumentParser:
+    """Parser of a single sub-command, global options included"""
+    (func, add_arguments) = COMMANDS[command]
+    parser = argparse.ArgumentParser(description=func.__doc__)
+    _add_global_arguments(parser)
+    add_arguments(parser)
+    parser.set_defaults(func=func)
+    return parser
+
+
+def print_import_profile():
+    """Print lazy imports of the run, slowest first"""
+    print("==> Import profile (cumulative, includes dependencies)")
+    for module_name, seconds in sorted(
+            _import_profile, key=lambda item: item[1], reverse=True):
+        print(f"{1000 * seconds:10.1f} ms  {module_name}")
+    print(f"{1000 * sum(seconds for _, seconds in _import_profile):10.1f} ms  total lazy imports")
+
+
+def print_request_metrics():
+    """Print per-service request metrics of the run, if any request was sent"""
+    # only loaded by sub-commands sending requests
+    rate_limiter = sys.modules.get("LNG_AI.rate_limiter")
+    if rate_limiter is None:
+        return
+    metrics = {service: service_metrics for service, service_metrics in
+               rate_limiter.get_scheduler().metrics().items() if service_metrics["total_cnt"] > 0}
+    if not metrics:
+        return
+    print("==> Request metrics")
+    for service, service_metrics in metrics.items():
+        print(f"{service}: {service_metrics}")
+
+
+def main(argv: list = None):
+    """Parse arguments & run the sub-command"""
+    return _run(build_parser().parse_args(argv))
+
+
+def run_command(command: str, argv: list = None):
+    """Run a single sub-command, e.g., `python3 prepare_dataset.py --seed 42` runs `dataset --seed 42`"""
+    return _run(build_command_parser(command).parse_args(argv))
+
+
+def _run(args) -> int:
+    startup_in_milliseconds = 1000 * (time.perf_counter() - START_TIME)
+    os.chdir(args.storage_root)
+
+    try:
+        args.func(args)
+    finally:
+        print_request_metrics()
+        if args.profile_imports:
+            print(
+                f"==> Startup before sub-command: {startup_in_milliseconds:.1f} ms")
+            print_import_profile()
+    return 0
@@ -3,10 +3,20 @@
 import enum
 
 ONE_MINUTE_IN_MILLISECONDS = 1 * 60 * 1000
+# Reference: https://platform.openai.com/docs/guides/speech-to-text
+WHISPER_API_FILE_SIZE_LIMIT_IN_BYTES = 25 * 1000 * 1000
 AVG_NUM_OF_TOKENS_PER_GENERATED_SENTENCE = 18
 
+LNG_CHANNEL_ID = "UCKngQgSGHd3Hp3nkPs15YSA"
 SEPARRATOR = "/!"
 PROMPT_SENTENCES = ["早安早安", "開了!", "欸我跟你們說"]
+NUM_OF_SENTENCES_PER_PROMPT = 3
+DATASET_PORTIONS = [0.005, 0.01, 0.1, 0.2, 0.3,
+                    0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]
+
+UPLOAD_REGISTRY_FILE_NAME = "upload_registry.json"
+DUPLICATE_CHUCKS_FILE_NAME = "duplicate_chucks.json"
+FINE_TUNE_STATUS_CACHE_FILE_NAME = "fine_tune_status.json"
 
 
 class OpenaiBabbageModelInteractionMode(enum.Enum):
@@ -29,6 +39,11 @@ class RootDirectory(enum.Enum):
     RAW_3GG_FILE_ROOT = "raw_3gg_files"
     JSONL_DATASET_ROOT = "jsonl_dataset"
     GENERATED_FILE_ROOT = "generated_files"
+    FINGERPRINT_INDEX_ROOT = "fingerprint_index"
+    TRANSCRIPT_INDEX_ROOT = "transcript_index"
+    MEMORIZATION_INDEX_ROOT = "memorization_index"
+    LEASE_ROOT = "leases"
+    FINE_TUNE_ROOT = "fine_tunes"
 
 
 class AudioFileKeyword(enum.Enum):
@@ -36,9 +51,55 @@ class AudioFileKeyword(enum.Enum):
     FULL = "full"
     PREVIEW = "one_minute_preview"
     HOUR_CHUCK = "_hour_chuck"
+    HALF_HOUR_CHUCK = "_30_mins_chuck"
     FIVE_MINUTES_CHUCK = "_5_mins_chuck"
 
 
+CHUCK_KEYWORD_TO_MINUTES = {
+    AudioFileKeyword.HOUR_CHUCK: 60,
+    AudioFileKeyword.HALF_HOUR_CHUCK: 30,
+    AudioFileKeyword.FIVE_MINUTES_CHUCK: 5,
+}
+
+
+class AudioExportProfile(enum.Enum):
+    """Enum for mp3 export profiles"""
+    # pydub/ffmpeg defaults: source sample rate & channels, 128 kbps
+    ARCHIVAL = "archival"
+    # 16 kHz mono low-bitrate, enough for speech recognition
+    SPEECH = "speech"
+
+
+AUDIO_EXPORT_PROFILE_PARAMETERS = {
+    AudioExportProfile.ARCHIVAL: {
+        "frame_rate": None,
+        "channels": None,
+        "bitrate_in_kbps": 128,
+    },
+    AudioExportProfile.SPEECH: {
+        "frame_rate": 16000,
+        "channels": 1,
+        "bitrate_in_kbps": 32,
+    },
+}
+
+
 class TranscribeMode(enum.Enum):
     """Enum for available AI transcribing"""
     WHISPER = "whisper"
+
+
+class RequestService(enum.Enum):
+    """Enum for external services going through the shared request scheduler"""
+    YOUTUBE_DATA_API = "youtube_data_api"
+    OPENAI_WHISPER = "openai_whisper"
+    OPENAI_COMPLETION = "openai_completion"
+    OPENAI_FILES = "openai_files"
+    OPENAI_FINE_TUNES = "openai_fine_tunes"
+
+
+class LeaseKind(enum.Enum):
+    """Enum for units of work claimed by workers sharing a storage root"""
+    VIDEO = "video"
+    CHUCK = "chuck"
+    FINGERPRINT_INDEX = "fingerprint_index"
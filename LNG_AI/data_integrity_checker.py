@@ -4,6 +4,7 @@ import logging
 
 from LNG_AI import utils
 from LNG_AI import constants
+from LNG_AI import repair_plan
 
 
 def record_failure_success(func):
@@ -15,14 +16,19 @@ def record_failure_success(func):
             args[0]._success_cnt += 1
         else:
             args[0]._failure_cnt += 1
+        return result
     return wrapper
 
 
 class DataIntegrityChecker():
-    """Class for checking data integrity"""
+    """Class for checking data integrity
+
+    Failures of all checks are recorded into repair_plan (see repair_plan.RepairExecutor)
+    """
 
     def __init__(self) -> None:
         self._init_cnt()
+        self.repair_plan = repair_plan.RepairPlan()
 
     def _init_cnt(self):
         self._failure_cnt = 0
@@ -38,61 +44,100 @@ class DataIntegrityChecker():
     @record_failure_success
     def _check_file_exist(self, file_path: str) -> None:
         if not os.path.isfile(file_path):
-            logging.error(file_path, "is not exist")
+            logging.error(f"{file_path} is not exist")
             return False
 
         return True
 
+    def _check_full_audio_exist(self, audio_file_dir: str) -> bool:
+        # chucks are listed by the length of full.mp3, nothing else can be checked without it
+        if not os.path.isfile(
+                f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3"):
+            self.repair_plan.add_refetch_video(audio_file_dir)
+            return False
+        return True
+
+    def _print_success_rate(self, title: str) -> None:
+        # an empty storage root has nothing to check, which is not a failure
+        success_rate = 100 * self._success_cnt / \
+            self._total_cnt if self._total_cnt else 100
+        print(f"{title}: {success_rate}%",
+              f"({self._success_cnt}/{self._total_cnt})")
+        self._init_cnt()
+
+    @staticmethod
+    def _get_chuck_name(chuck_path: str) -> str:
+        return os.path.splitext(os.path.basename(chuck_path))[0]
+
     def check_transcripts_creation(self) -> None:
         """Check if transcripts are created successfully"""
         audio_file_dirs = utils.FileUtils.get_audio_file_directories()
         for audio_file_dir in audio_file_dirs:
-            # 1-minute transcripit preview
-            self._check_file_exist(
-                f"{audio_file_dir}/whisper/{constants.AudioFileKeyword.PREVIEW.value}.txt")
+            if not self._check_full_audio_exist(audio_file_dir):
+                continue
 
-            # 5-minutes transcripts
+            # 1-minute transcripit preview
+            if not self._check_file_exist(
+                    f"{audio_file_dir}/whisper/{constants.AudioFileKeyword.PREVIEW.value}.txt"):
+                self.repair_plan.add_retranscribe_chuck(
+                    audio_file_dir, constants.AudioFileKeyword.PREVIEW.value, reason="missing")
+
+            # 5-minutes transcripts (duplicate chucks are not transcribed)
+            duplicate_chucks = utils.FileUtils.get_duplicate_chucks(
+                audio_file_dir)
             for five_minutes_transcript_path in utils.FileUtils.get_five_minutes_chuck_transcript_paths(
                     audio_file_dir):
-                self._check_file_exist(five_minutes_transcript_path)
+                if utils.FileUtils.is_duplicate_chuck(
+                        five_minutes_transcript_path, duplicate_chucks):
+                    continue
+                if not self._check_file_exist(five_minutes_transcript_path):
+                    self.repair_plan.add_retranscribe_chuck(
+                        audio_file_dir, self._get_chuck_name(five_minutes_transcript_path), reason="missing")
 
-        print(f"Transcripts created successfully: {100 * self._success_cnt/self._total_cnt}%",
-              f"({self._success_cnt}/{self._total_cnt})")
-        self._init_cnt()
+        self._print_success_rate("Transcripts created successfully")
 
     def check_transcripts_repetitive_word_occurance(self) -> None:
         """Check if transcripts have not reptitive word occurance"""
         audio_file_dirs = utils.FileUtils.get_audio_file_directories()
         for audio_file_dir in audio_file_dirs:
-            # 5-minutes transcripts
+            if not self._check_full_audio_exist(audio_file_dir):
+                continue
+
+            # 5-minutes transcripts (duplicate chucks are not transcribed)
+            duplicate_chucks = utils.FileUtils.get_duplicate_chucks(
+                audio_file_dir)
             for five_minutes_transcript_path in utils.FileUtils.get_five_minutes_chuck_transcript_paths(
                     audio_file_dir):
-                self._check_transcript_repetitive_word_occurance(
-                    five_minutes_transcript_path)
-
-        print(f"Transcripts AI-transcribed successfully: {100 * self._success_cnt/self._total_cnt}%",
-              f"({self._success_cnt}/{self._total_cnt})")
-        self._init_cnt()
+                if utils.FileUtils.is_duplicate_chuck(
+                        five_minutes_transcript_path, duplicate_chucks):
+                    continue
+                # missing transcripts are reported by check_transcripts_creation
+                if not os.path.isfile(five_minutes_transcript_path):
+                    continue
+                if not self._check_transcript_repetitive_word_occurance(
+                        five_minutes_transcript_path):
+                    self.repair_plan.add_retranscribe_chuck(
+                        audio_file_dir, self._get_chuck_name(five_minutes_transcript_path),
+                        reason="repetitive", transcribe_parameters=repair_plan.REPETITIVE_TRANSCRIPT_PARAMETERS)
+
+        self._print_success_rate("Transcripts AI-transcribed successfully")
 
     def check_audio_files_creation(self) -> None:
         """Check if audio files are created successfully"""
         audio_file_dirs = utils.FileUtils.get_audio_file_directories()
         for audio_file_dir in audio_file_dirs:
-            self._check_file_exist(
-                f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3")
-            self._check_file_exist(
-                f"{audio_file_dir}/{constants.AudioFileKeyword.PREVIEW.value}.mp3")
-
-            # 1-hour audios
-            for one_hour_audio_path in utils.FileUtils.get_one_hour_chuck_audio_paths(
-                    audio_file_dir):
-                self._check_file_exist(one_hour_audio_path)
-
-            # 5-minutes audios
-            for five_minutes_audio_path in utils.FileUtils.get_five_minutes_chuck_audio_paths(
-                    audio_file_dir):
-                self._check_file_exist(five_minutes_audio_path)
-
-        print(f"Audio files created successfully: {100 * self._success_cnt/self._total_cnt}%",
-              f"({self._success_cnt}/{self._total_cnt})")
-        self._init_cnt()
+            if not self._check_file_exist(
+                    f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3"):
+                self.repair_plan.add_refetch_video(audio_file_dir)
+                continue
+
+            # 1-minute preview, 1-hour audios & 5-minutes audios
+            audio_paths = [f"{audio_file_dir}/{constants.AudioFileKeyword.PREVIEW.value}.mp3"] + \
+                utils.FileUtils.get_one_hour_chuck_audio_paths(audio_file_dir) + \
+                utils.FileUtils.get_five_minutes_chuck_audio_paths(audio_file_dir)
+            for audio_path in audio_paths:
+                if not self._check_file_exist(audio_path):
+                    self.repair_plan.add_reexport_chuck(
+                        audio_file_dir, self._get_chuck_name(audio_path))
+
+        self._print_success_rate("Audio files created successfully")
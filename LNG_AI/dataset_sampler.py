@@ -0,0 +1,114 @@
+""" Seeded one-pass sampling of dataset portions from a stream of windows
+
+Every window gets a random key from a seeded generator, a portion is made of the
+windows with the smallest keys (a uniform sample without replacement), returned in
+key order (a uniform shuffle). Portions sharing the keys are nested: the 1% portion
+is contained in the 10% one, so learning curves compare more data, not other data.
+
+Only windows which may still belong to the largest portion are kept in memory.
+"""
+import logging
+import math
+import random
+
+# retention threshold margin in standard deviations, the sample misses windows
+# with a probability far below 1e-9
+THRESHOLD_MARGIN_IN_STD = 6
+THRESHOLD_MARGIN_IN_ITEMS = 10
+
+
+class PortionSampler():
+    """Draw all portions of a stream in one pass, memory proportional to the largest portion
+
+    uniform: smallest keys over all windows, the total number of windows is only known
+        at the end, so windows are kept while their key is below a threshold shrinking
+        towards the largest portion as the stream grows
+    stratified: every episode (stratum) contributes floor(portion * its windows + u) windows
+        of smallest keys (u uniform per episode), so a few long streams cannot dominate a
+        small portion by chance
+    """
+
+    def __init__(self, portions: list, seed: int = 0, stratified: bool = False):
+        assert all(0 < portion <= 1 for portion in portions), \
+            "portions should be between 0 and 1"
+        self.max_portion = max(portions)
+        self.stratified = stratified
+        self._rng = random.Random(seed)
+        self._num_of_items = 0
+        # (key, item, stratum index, rank of the key within the stratum)
+        self._retained = []
+        self._num_of_retained_after_pruning = 0
+
+        # stratified: items of the current stratum are buffered until it ends
+        self._stratum = None
+        self._stratum_buffer = []
+        # (number of items, rounding offset) per stratum
+        self._strata = []
+
+    def add(self, item, stratum=None):
+        """Add an item of the stream (items of a stratum must be added consecutively)"""
+        key = self._rng.random()
+        self._num_of_items += 1
+        if not self.stratified:
+            if key < self._get_threshold(self._num_of_items):
+                self._retained.append((key, item, None, None))
+                self._prune_if_needed()
+            return
+
+        if stratum != self._stratum:
+            self._flush_stratum()
+            self._stratum = stratum
+        self._stratum_buffer.append((key, item))
+
+    def get_portion(self, portion: float) -> list:
+        """Items of the portion in random order"""
+        assert 0 < portion <= self.max_portion, \
+            f"portion should be between 0 and {self.max_portion}"
+        self._flush_stratum()
+
+        if self.stratified:
+            selected = [(key, item) for key, item, stratum_idx, rank in self._retained
+                        if rank < self._get_stratum_quota(stratum_idx, portion)]
+        else:
+            num_of_items_to_select = math.ceil(self._num_of_items * portion)
+            selected = sorted(self._retained, key=lambda retained: retained[0])[
+                :num_of_items_to_select]
+            if len(selected) < num_of_items_to_select:
+                logging.warning(f"only {len(selected)}/{num_of_items_to_select} items "
+                                f"retained for portion {portion}")
+
+        return [item for _, item in sorted(
+            ((retained[0], retained[1]) for retained in selected), key=lambda pair: pair[0])]
+
+    def _get_threshold(self, num_of_items: int) -> float:
+        # number of keys below max_portion + margin exceeds ceil(max_portion * N)
+        # by THRESHOLD_MARGIN_IN_STD standard deviations, for any final N >= num_of_items
+        return self.max_portion + THRESHOLD_MARGIN_IN_STD * math.sqrt(
+            self.max_portion / num_of_items) + THRESHOLD_MARGIN_IN_ITEMS / num_of_items
+
+    def _prune_if_needed(self):
+        # amortized: prune only when the retained list doubled since the last pruning
+        if len(self._retained) < 2 * \
+                max(self._num_of_retained_after_pruning, THRESHOLD_MARGIN_IN_ITEMS):
+            return
+        threshold = self._get_threshold(self._num_of_items)
+        self._retained = [
+            retained for retained in self._retained if retained[0] < threshold]
+        self._num_of_retained_after_pruning = len(self._retained)
+
+    def _get_stratum_quota(self, stratum_idx: int, portion: float) -> int:
+        (num_of_items, rounding_offset) = self._strata[stratum_idx]
+        # randomized rounding, monotonic in portion so portions stay nested
+        return math.floor(portion * num_of_items + rounding_offset)
+
+    def _flush_stratum(self):
+        if not self._stratum_buffer:
+            return
+
+        stratum_idx = len(self._strata)
+        self._strata.append((len(self._stratum_buffer), self._rng.random()))
+        quota = self._get_stratum_quota(stratum_idx, self.max_portion)
+        self._stratum_buffer.sort(key=lambda pair: pair[0])
+        for rank, (key, item) in enumerate(self._stratum_buffer[:quota]):
+            self._retained.append((key, item, stratum_idx, rank))
+        self._stratum_buffer = []
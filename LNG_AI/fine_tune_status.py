@@ -0,0 +1,106 @@
+""" Local cache of fine-tune jobs & their events
+
+Every view/poll used to list or retrieve jobs from scratch, the cache instead
+lists all jobs at most once per max age, and only fetches events of jobs
+which are not finished yet.
+"""
+import json
+import os
+import time
+
+import openai
+
+from LNG_AI import constants
+from LNG_AI import rate_limiter
+from LNG_AI import work_lease
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+DEFAULT_MAX_AGE_IN_SECONDS = 60
+
+
+class FineTuneStatusCache():
+    """Fine-tune jobs & events, refreshed from OpenAI only when stale
+
+    Layout (json):
+        {"listed_at":...,
+         "jobs": {job_id: {"status":..., "fine_tuned_model":..., "training_file_bytes": [...],
+                           "events": [{"created_at":..., "message":...}, ...],
+                           "events_complete":...}}}
+    """
+
+    def __init__(self, cache_path: str = None):
+        if cache_path is None:
+            cache_path = os.path.join(
+                constants.RootDirectory.FINE_TUNE_ROOT.value,
+                constants.FINE_TUNE_STATUS_CACHE_FILE_NAME)
+        self.cache_path = cache_path
+        self.cache = self._load_cache()
+
+    def refresh(self, max_age_in_seconds: float = DEFAULT_MAX_AGE_IN_SECONDS):
+        """Update statuses of all jobs by one FineTune.list, if the cache is older than max age"""
+        if time.time() - self.cache["listed_at"] < max_age_in_seconds:
+            return
+
+        fine_tune_jobs = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_FINE_TUNES, openai.FineTune.list)
+        for fine_tune_job in fine_tune_jobs["data"]:
+            job = self.cache["jobs"].setdefault(
+                fine_tune_job["id"], {"events": [], "events_complete": False})
+            job["status"] = fine_tune_job["status"]
+            job["fine_tuned_model"] = fine_tune_job["fine_tuned_model"]
+            job["training_file_bytes"] = [
+                training_file["bytes"] for training_file in fine_tune_job["training_files"]]
+        self.cache["listed_at"] = time.time()
+        self._store_cache()
+
+    def get_jobs(self) -> dict:
+        """job id -> cached job"""
+        return self.cache["jobs"]
+
+    def get_job(self, job_id: str) -> dict:
+        """Cached job, refreshed once if unknown (e.g., just created), None if not found"""
+        if job_id not in self.cache["jobs"]:
+            self.refresh(max_age_in_seconds=0)
+        return self.cache["jobs"].get(job_id)
+
+    def fetch_new_events(self, job_id: str) -> list:
+        """Events of the job not seen before, no request once all events of a finished job are cached"""
+        job = self.get_job(job_id)
+        if job is None or job["events_complete"]:
+            return []
+
+        # events are returned oldest first & never change, only the ones from the last
+        # seen timestamp on are requested (events of that second may be returned again)
+        cursor = job["events"][-1]["created_at"] if job["events"] else None
+        params = {} if cursor is None else {"after": cursor}
+        events = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_FINE_TUNES, openai.FineTune.list_events, id=job_id, **params)
+        messages_seen_at_cursor = [event["message"] for event in job["events"]
+                                   if event["created_at"] == cursor]
+        new_events = []
+        for event in events["data"]:
+            if cursor is not None and event["created_at"] < cursor:
+                continue
+            if event["created_at"] == cursor and event["message"] in messages_seen_at_cursor:
+                messages_seen_at_cursor.remove(event["message"])
+                continue
+            new_events.append(
+                {"created_at": event["created_at"], "message": event["message"]})
+        job["events"].extend(new_events)
+        # the status comes from the last listing, events fetched after it are complete
+        job["events_complete"] = job["status"] in TERMINAL_STATUSES
+        self._store_cache()
+        return new_events
+
+    def _load_cache(self) -> dict:
+        cache = {"listed_at": 0, "jobs": {}}
+        if os.path.isfile(self.cache_path):
+            with open(self.cache_path, "r") as cache_file:
+                cache.update(json.load(cache_file))
+        return cache
+
+    def _store_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with work_lease.atomic_output_path(self.cache_path) as tmp_cache_path:
+            with open(tmp_cache_path, "w") as cache_file:
+                json.dump(self.cache, cache_file, indent=2)
@@ -0,0 +1,209 @@
+""" Fine-tune one model per jsonl dataset portion & evaluate them alike (learning curves) """
+import concurrent.futures
+import glob
+import json
+import os
+import time
+
+import openai
+
+from LNG_AI import constants
+from LNG_AI import fine_tune_status
+from LNG_AI import memorization_checker
+from LNG_AI import rate_limiter
+from LNG_AI import training_file_uploader
+from LNG_AI import utils
+from LNG_AI import work_lease
+
+DEFAULT_BASE_MODEL = "babbage"
+DEFAULT_MAX_CONCURRENT_UPLOADS = 2
+DEFAULT_POLL_INTERVAL_IN_SECONDS = 60
+DEFAULT_NUM_OF_SENTENCES_GENERATED = 30
+
+
+def resolve_portion_path(portion: float) -> str:
+    """Path of the jsonl dataset portion (e.g., 0.5 -> jsonl_dataset/jsonl_dataset_50_percent_29608.jsonl)"""
+    pattern = os.path.join(constants.RootDirectory.JSONL_DATASET_ROOT.value,
+                           f"jsonl_dataset_{int(portion * 100)}_percent_*.jsonl")
+    paths = glob.glob(pattern)
+    if not paths:
+        raise FileNotFoundError(
+            f"no jsonl dataset matches {pattern}, "
+            f"create it with: python3 prepare_dataset.py --portions {portion}")
+    # several datasets of the same portion, the latest one wins
+    return max(paths, key=os.path.getmtime)
+
+
+class FineTuneSweep():
+    """Upload portions with bounded concurrency, launch their fine-tunes, poll them in one
+    loop & evaluate every finished model with the same generation + memorization check
+
+    The sweep state is stored after every step, so an interrupted sweep resumes where it stopped.
+
+    State layout (json):
+        {portion in percent: {"jsonl_dataset_path":..., "file_id":..., "job_id":...,
+                              "status":..., "fine_tuned_model":..., "evaluation": {...}}}
+    """
+
+    def __init__(self, portions: list, base_model: str = DEFAULT_BASE_MODEL,
+                 max_concurrent_uploads: int = DEFAULT_MAX_CONCURRENT_UPLOADS,
+                 poll_interval_in_seconds: float = DEFAULT_POLL_INTERVAL_IN_SECONDS,
+                 num_of_sentences_generated: int = DEFAULT_NUM_OF_SENTENCES_GENERATED,
+                 sweep_path: str = None):
+        assert all(0 < portion <= 1 for portion in portions), \
+            "portions should be between 0 and 1"
+        if sweep_path is None:
+            percents = "_".join(str(int(portion * 100))
+                                for portion in sorted(portions))
+            sweep_path = os.path.join(
+                constants.RootDirectory.FINE_TUNE_ROOT.value, f"sweep_{percents}.json")
+
+        self.portions = portions
+        self.base_model = base_model
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.poll_interval_in_seconds = poll_interval_in_seconds
+        self.num_of_sentences_generated = num_of_sentences_generated
+        self.sweep_path = sweep_path
+        self.state = self._load_state()
+        self.status_cache = fine_tune_status.FineTuneStatusCache()
+        # fail before anything is uploaded if a portion was never created
+        for portion in portions:
+            self._get_run(portion)
+
+    def estimate_cost(self) -> float:
+        """Training cost of portions not launched yet + evaluation cost of all portions"""
+        estimated_cost = 0
+        for portion in self.portions:
+            run = self._get_run(portion)
+            if run["job_id"] is None:
+                estimated_cost += utils.OpenaiUtils.estimate_cost_estimation(
+                    jsonl_dataset_path=run["jsonl_dataset_path"], mode="train")
+            if run["evaluation"] is None:
+                estimated_cost += utils.OpenaiUtils.estimate_cost_estimation(
+                    num_of_sentences_generated=self.num_of_sentences_generated, mode="usage")
+        return round(estimated_cost, 4)
+
+    def run(self):
+        """Launch, poll & evaluate until every portion is finished"""
+        self._launch_jobs()
+        self._poll_until_finished()
+        self.print_summary()
+
+    def print_summary(self):
+        """One line per portion, smallest portion first"""
+        print("==> Sweep summary")
+        for portion in sorted(self.portions):
+            run = self._get_run(portion)
+            evaluation = run["evaluation"] or {}
+            print(f"{int(portion * 100)}%: {run['status']} {run['fine_tuned_model']}",
+                  {key: evaluation.get(key) for key in [
+                      "mean_overlap_ratio", "mean_longest_match_length", "distinct_2"]})
+
+    def _get_run(self, portion: float) -> dict:
+        key = str(int(portion * 100))
+        # the dataset path is resolved once, a resumed sweep keeps using the stored one
+        if key not in self.state:
+            self.state[key] = {
+                "jsonl_dataset_path": resolve_portion_path(portion),
+                "file_id": None,
+                "job_id": None,
+                "status": None,
+                "fine_tuned_model": None,
+                "evaluation": None,
+            }
+        return self.state[key]
+
+    def _launch_jobs(self):
+        runs = [self._get_run(portion) for portion in self.portions]
+        runs = [run for run in runs if run["job_id"] is None]
+        if not runs:
+            return
+
+        uploader = training_file_uploader.TrainingFileUploader()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrent_uploads) as executor:
+            futures = {executor.submit(uploader.upload, run["jsonl_dataset_path"]): run
+                       for run in runs if run["file_id"] is None}
+            # launch a job as soon as its file is uploaded
+            for future in concurrent.futures.as_completed(futures):
+                futures[future]["file_id"] = future.result()
+                self._store_state()
+                self._launch_job(futures[future])
+        for run in runs:
+            if run["job_id"] is None:
+                self._launch_job(run)
+
+    def _launch_job(self, run: dict):
+        response = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_FINE_TUNES, openai.FineTune.create,
+            training_file=run["file_id"], model=self.base_model)
+        run["job_id"] = response["id"]
+        run["status"] = response["status"]
+        self._store_state()
+        print(f"Launched {run['job_id']} on {run['jsonl_dataset_path']}")
+
+    def _poll_until_finished(self):
+        while True:
+            pending_portions = [portion for portion in self.portions if self._get_run(portion)["evaluation"] is None
+                                and self._get_run(portion)["status"] not in ("failed", "cancelled")]
+            if not pending_portions:
+                return
+
+            # one listing for all jobs per cycle, events only for jobs still running
+            self.status_cache.refresh(max_age_in_seconds=0)
+            num_of_unfinished_runs = 0
+            for portion in pending_portions:
+                run = self._get_run(portion)
+                job = self.status_cache.get_job(run["job_id"])
+                # e.g., a job just created, not listed yet
+                if job is None:
+                    print(f"{run['job_id']} not listed yet, poll it again later")
+                    num_of_unfinished_runs += 1
+                    continue
+                for event in self.status_cache.fetch_new_events(run["job_id"]):
+                    print(f"==> {int(portion * 100)}% {run['job_id']}: {event['message']}")
+                run["status"] = job["status"]
+                run["fine_tuned_model"] = job["fine_tuned_model"]
+                self._store_state()
+
+                if run["status"] == "succeeded":
+                    self._evaluate(run)
+                elif run["status"] not in fine_tune_status.TERMINAL_STATUSES:
+                    num_of_unfinished_runs += 1
+
+            if num_of_unfinished_runs == 0:
+                return
+            print(
+                f"{num_of_unfinished_runs} jobs still running, poll again in {self.poll_interval_in_seconds} seconds")
+            time.sleep(self.poll_interval_in_seconds)
+
+    def _evaluate(self, run: dict):
+        """Same generation for every model, then memorization against its own training portion"""
+        print(f"Evaluating {run['fine_tuned_model']}")
+        generated_file_path = utils.OpenaiUtils.test_fine_tune_model(
+            model_name=run["fine_tuned_model"],
+            num_of_sentences_generated=self.num_of_sentences_generated,
+            request_permission=False)
+
+        checker = memorization_checker.MemorizationChecker(
+            memorization_checker.build_jsonl_corpus(run["jsonl_dataset_path"]))
+        report = checker.check_sentences(
+            memorization_checker.read_generated_sentences(generated_file_path))
+        report_path = f"{os.path.splitext(generated_file_path)[0]}.memorization.json"
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+
+        run["evaluation"] = dict(report["summary"],
+                                 generated_file_path=generated_file_path)
+        self._store_state()
+
+    def _load_state(self) -> dict:
+        if not os.path.isfile(self.sweep_path):
+            return {}
+        with open(self.sweep_path, "r") as sweep_file:
+            return json.load(sweep_file)
+
+    def _store_state(self):
+        os.makedirs(os.path.dirname(self.sweep_path) or ".", exist_ok=True)
+        with work_lease.atomic_output_path(self.sweep_path) as tmp_sweep_path:
+            with open(tmp_sweep_path, "w") as sweep_file:
+                json.dump(self.state, sweep_file, indent=2, ensure_ascii=False)
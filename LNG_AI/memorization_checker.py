@@ -0,0 +1,214 @@
+""" Check how much of generated sentences is copied from the training corpus """
+import hashlib
+import os
+
+import numpy as np
+
+from LNG_AI import constants
+from LNG_AI import utils
+
+# separates documents in the concatenated corpus, so matches never span two documents
+DOCUMENT_SEPARATOR = "\x00"
+DEFAULT_MIN_MATCH_LENGTH = 8
+DISTINCT_N_RANGE = range(1, 5)
+
+
+def build_suffix_array(text: str) -> np.ndarray:
+    """Suffix array by prefix doubling, vectorized with numpy (O(n log^2 n))"""
+    num_of_chars = len(text)
+    if num_of_chars == 0:
+        return np.empty(0, dtype=np.int64)
+
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    _, rank = np.unique(codes, return_inverse=True)
+    rank = rank.astype(np.int64).reshape(-1)
+    step = 1
+    while True:
+        # sort by (rank of first half, rank of second half)
+        second_rank = np.full(num_of_chars, -1, dtype=np.int64)
+        second_rank[:num_of_chars - step] = rank[step:]
+        suffix_array = np.lexsort((second_rank, rank))
+
+        sorted_rank = rank[suffix_array]
+        sorted_second_rank = second_rank[suffix_array]
+        is_new_group = np.empty(num_of_chars, dtype=bool)
+        is_new_group[0] = True
+        is_new_group[1:] = (sorted_rank[1:] != sorted_rank[:-1]) | (
+            sorted_second_rank[1:] != sorted_second_rank[:-1])
+        rank = np.empty(num_of_chars, dtype=np.int64)
+        rank[suffix_array] = np.cumsum(is_new_group) - 1
+
+        if rank.max() == num_of_chars - 1 or step >= num_of_chars:
+            return suffix_array
+        step *= 2
+
+
+def build_transcript_corpus(
+        mode: constants.TranscribeMode = constants.TranscribeMode.WHISPER) -> str:
+    """Concatenate all transcripts (except duplicate chucks)"""
+    documents = []
+    for audio_file_dir in utils.FileUtils.get_audio_file_directories():
+        transcript_dir = f"{audio_file_dir}/{mode.value}"
+        if not os.path.isdir(transcript_dir):
+            continue
+        duplicate_chucks = utils.FileUtils.get_duplicate_chucks(audio_file_dir)
+        for file_name in sorted(os.listdir(transcript_dir)):
+            transcript_path = f"{transcript_dir}/{file_name}"
+            if not file_name.endswith(".txt") or utils.FileUtils.is_duplicate_chuck(
+                    transcript_path, duplicate_chucks):
+                continue
+            with open(transcript_path, "r", encoding="utf-8") as transcript_file:
+                documents.append(transcript_file.read())
+    return DOCUMENT_SEPARATOR.join(documents)
+
+
+def build_jsonl_corpus(jsonl_dataset_path: str) -> str:
+    """Concatenate windows of a jsonl dataset portion (prompt sentences + completion)"""
+    documents = []
+    for jsonl in utils.JsonlUtils.iter_jsonls(jsonl_dataset_path):
+        sentences = jsonl["prompt"].split(
+            constants.SEPARRATOR) + [jsonl["completion"]]
+        documents.append(" ".join(sentences))
+    return DOCUMENT_SEPARATOR.join(documents)
+
+
+def read_generated_sentences(generated_file_path: str) -> list:
+    """Generated sentences of a generated_files history (prompt sentences excluded)"""
+    with open(generated_file_path, "r", encoding="utf-8") as generated_file:
+        sentences = [line.rstrip("\n") for line in generated_file]
+    sentences = sentences[len(constants.PROMPT_SENTENCES):]
+    return [sentence.replace(constants.SEPARRATOR, " ").strip()
+            for sentence in sentences]
+
+
+def compute_diversity_metrics(sentences: list) -> dict:
+    """distinct-n & repetition metrics over a batch of sentences, vectorized with numpy"""
+    metrics = {}
+    text = DOCUMENT_SEPARATOR.join(sentences)
+    codes = np.frombuffer(text.encode("utf-32-le"),
+                          dtype=np.uint32).astype(np.uint64)
+    is_separator = codes == ord(DOCUMENT_SEPARATOR)
+
+    for num_of_chars in DISTINCT_N_RANGE:
+        if len(codes) < num_of_chars:
+            metrics[f"distinct_{num_of_chars}"] = 0.0
+            continue
+        # polynomial hash of every n-gram (wraps around on overflow)
+        num_of_ngrams = len(codes) - num_of_chars + 1
+        ngram_hashes = np.zeros(num_of_ngrams, dtype=np.uint64)
+        spans_separator = np.zeros(num_of_ngrams, dtype=bool)
+        with np.errstate(over="ignore"):
+            for idx in range(num_of_chars):
+                ngram_hashes = ngram_hashes * \
+                    np.uint64(1000003) + codes[idx:idx + num_of_ngrams]
+                spans_separator |= is_separator[idx:idx + num_of_ngrams]
+        ngram_hashes = ngram_hashes[~spans_separator]
+
+        unique_hashes, counts = np.unique(ngram_hashes, return_counts=True)
+        metrics[f"distinct_{num_of_chars}"] = round(
+            len(unique_hashes) / len(ngram_hashes), 4) if len(ngram_hashes) else 0.0
+        if num_of_chars == DISTINCT_N_RANGE[-1]:
+            # share of n-grams occurring more than once over the batch
+            metrics[f"repeated_{num_of_chars}gram_ratio"] = round(
+                float(counts[counts > 1].sum() / len(ngram_hashes)), 4) if len(ngram_hashes) else 0.0
+
+    _, sentence_counts = np.unique(
+        np.array(sentences, dtype=object), return_counts=True)
+    metrics["repeated_sentence_ratio"] = round(
+        float((sentence_counts - 1).sum() / len(sentences)), 4) if sentences else 0.0
+    return metrics
+
+
+class MemorizationChecker():
+    """Longest exact match of sentences against a corpus, via a suffix array"""
+
+    def __init__(self, corpus: str, cache_dir: str = None):
+        if cache_dir is None:
+            cache_dir = constants.RootDirectory.MEMORIZATION_INDEX_ROOT.value
+        self.corpus = corpus
+        self.suffix_array = self._load_or_build_suffix_array(cache_dir)
+
+    def longest_matches(self, sentence: str) -> list:
+        """Matching statistics: longest prefix of sentence[i:] occurring in the corpus, for each i"""
+        return [self._longest_prefix_match(sentence[idx:])
+                for idx in range(len(sentence))]
+
+    def check_sentences(self, sentences: list,
+                        min_match_length: int = DEFAULT_MIN_MATCH_LENGTH) -> dict:
+        """Memorization of every sentence & summary over the batch
+
+        overlap_ratio: share of characters covered by corpus matches of >= min_match_length
+        """
+        results = []
+        for sentence in sentences:
+            matches = np.array(self.longest_matches(sentence), dtype=np.int64)
+            longest_match_length = int(matches.max()) if len(matches) else 0
+
+            # mark [i, i + matches[i]) for long enough matches, via a difference array
+            coverage = np.zeros(len(sentence) + 1, dtype=np.int64)
+            starts = np.nonzero(matches >= min_match_length)[0]
+            np.add.at(coverage, starts, 1)
+            np.add.at(coverage, starts + matches[starts], -1)
+            num_of_covered_chars = int(
+                (np.cumsum(coverage)[:-1] > 0).sum()) if len(sentence) else 0
+
+            results.append({
+                "sentence": sentence,
+                "longest_match_length": longest_match_length,
+                "overlap_ratio": round(num_of_covered_chars / len(sentence), 4) if sentence else 0.0,
+            })
+
+        longest_match_lengths = np.array(
+            [result["longest_match_length"] for result in results])
+        overlap_ratios = np.array([result["overlap_ratio"]
+                                  for result in results])
+        summary = {
+            "num_of_sentences": len(results),
+            "min_match_length": min_match_length,
+            "mean_longest_match_length": round(float(longest_match_lengths.mean()), 2) if results else 0.0,
+            "mean_overlap_ratio": round(float(overlap_ratios.mean()), 4) if results else 0.0,
+            "fully_copied_ratio": round(float((overlap_ratios == 1).mean()), 4) if results else 0.0,
+        }
+        summary.update(compute_diversity_metrics(sentences))
+        return {"summary": summary, "sentences": results}
+
+    def _longest_prefix_match(self, query: str) -> int:
+        # the suffix sharing the longest prefix with the query is adjacent
+        # to the query's insertion point in the suffix array
+        low, high = 0, len(self.suffix_array)
+        while low < high:
+            mid = (low + high) // 2
+            start = self.suffix_array[mid]
+            if self.corpus[start:start + len(query)] < query:
+                low = mid + 1
+            else:
+                high = mid
+
+        longest = 0
+        for idx in (low - 1, low):
+            if 0 <= idx < len(self.suffix_array):
+                longest = max(longest, self._common_prefix_length(
+                    query, self.suffix_array[idx]))
+        return longest
+
+    def _common_prefix_length(self, query: str, start: int) -> int:
+        length = 0
+        for query_char, corpus_char in zip(
+                query, self.corpus[start:start + len(query)]):
+            if query_char != corpus_char:
+                break
+            length += 1
+        return length
+
+    def _load_or_build_suffix_array(self, cache_dir: str) -> np.ndarray:
+        corpus_hash = hashlib.sha1(
+            self.corpus.encode("utf-8")).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{corpus_hash}.npy")
+        if os.path.isfile(cache_path):
+            return np.load(cache_path)
+
+        print(f"Building suffix array over {len(self.corpus)} characters...")
+        suffix_array = build_suffix_array(self.corpus)
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_path, suffix_array)
+        return suffix_array
@@ -0,0 +1,235 @@
+""" Re-chunk mp3 files at frame boundaries without decoding """
+import mmap
+import os
+from array import array
+
+from LNG_AI import work_lease
+
+# Reference: http://www.mp3-tech.org/programmer/frame_header.html
+MPEG_VERSION_1 = 3
+MPEG_VERSION_2 = 2
+MPEG_VERSION_2_5 = 0
+
+LAYER_1 = 3
+LAYER_2 = 2
+LAYER_3 = 1
+
+BITRATES_IN_KBPS = {
+    (MPEG_VERSION_1, LAYER_1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (MPEG_VERSION_1, LAYER_2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (MPEG_VERSION_1, LAYER_3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (MPEG_VERSION_2, LAYER_1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (MPEG_VERSION_2, LAYER_2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (MPEG_VERSION_2, LAYER_3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {
+    MPEG_VERSION_1: [44100, 48000, 32000],
+    MPEG_VERSION_2: [22050, 24000, 16000],
+    MPEG_VERSION_2_5: [11025, 12000, 8000],
+}
+
+ID3V2_HEADER_SIZE = 10
+ID3V1_TAG_SIZE = 128
+FRAME_HEADER_SIZE = 4
+
+
+def parse_frame_header(header: bytes):
+    """Parse a 4-byte mp3 frame header
+
+    Returns:
+        (frame_length_in_bytes, num_of_samples, sample_rate, side_info_size)
+        or None if the header is not valid
+    """
+    if header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version = (header[1] >> 3) & 0x3
+    layer = (header[1] >> 1) & 0x3
+    bitrate_index = (header[2] >> 4) & 0xF
+    sample_rate_index = (header[2] >> 2) & 0x3
+    padding = (header[2] >> 1) & 0x1
+    is_mono = ((header[3] >> 6) & 0x3) == 3
+
+    # reserved values & free format are not supported
+    if version == 1 or layer == 0 or bitrate_index in (
+            0, 15) or sample_rate_index == 3:
+        return None
+
+    table_version = MPEG_VERSION_1 if version == MPEG_VERSION_1 else MPEG_VERSION_2
+    bitrate = BITRATES_IN_KBPS[(table_version, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == LAYER_1:
+        num_of_samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == LAYER_2 or version == MPEG_VERSION_1:
+        num_of_samples = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        num_of_samples = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+
+    if version == MPEG_VERSION_1:
+        side_info_size = 17 if is_mono else 32
+    else:
+        side_info_size = 9 if is_mono else 17
+
+    return frame_length, num_of_samples, sample_rate, side_info_size
+
+
+class Mp3FrameChunker():
+    """Slice an mp3 file into chucks of any duration at frame boundaries
+
+    Frames are copied as-is from a memory-mapped file, so no decoding/encoding is involved.
+    Note: a chuck may start with a frame referencing the bit reservoir of the previous
+    chuck, decoders render that first frame (~26ms) as silence.
+    """
+
+    def __init__(self, mp3_path: str):
+        self.mp3_path = mp3_path
+        self._file = open(mp3_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # frame_offsets[i]: byte offset of i-th audio frame, with a sentinel at the end
+        # frame_times[i]: start time (ms) of i-th audio frame, with total length at the end
+        self.frame_offsets = array("Q")
+        self.frame_times = array("d")
+        self._index_frames()
+
+    def close(self):
+        """Release the memory map"""
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_audio_length_in_milliseconds(self) -> float:
+        """Total length of the audio frames"""
+        return self.frame_times[-1]
+
+    def get_num_of_chucks(self, chuck_in_milliseconds: int) -> int:
+        """Number of chucks for the given granularity"""
+        return max(1, -(-int(self.get_audio_length_in_milliseconds()) //
+                        chuck_in_milliseconds))
+
+    def export_chucks(self, audio_file_dir: str,
+                      chuck_in_milliseconds: int, chuck_keyword: str) -> list:
+        """Export {idx}{chuck_keyword}.mp3 chucks, existing chucks are not overwritten"""
+        paths = []
+        for idx in range(self.get_num_of_chucks(chuck_in_milliseconds)):
+            export_path = f"{audio_file_dir}/{idx+1}{chuck_keyword}.mp3"
+            paths.append(export_path)
+            if os.path.isfile(export_path):
+                print(f"{export_path} already exists, avoid exporting")
+                continue
+
+            print(f"exporting audio to {export_path} (frame copy)")
+            self.export_range(idx * chuck_in_milliseconds,
+                              (idx + 1) * chuck_in_milliseconds, export_path)
+        return paths
+
+    def export_range(self, begin_in_milliseconds: float,
+                     end_in_milliseconds: float, export_path: str):
+        """Export frames starting within [begin, end) to export_path"""
+        (begin_offset, end_offset) = self.get_byte_range(
+            begin_in_milliseconds, end_in_milliseconds)
+        with work_lease.atomic_output_path(export_path) as tmp_export_path:
+            with open(tmp_export_path, "wb") as export_file:
+                export_file.write(
+                    memoryview(self._mmap)[begin_offset:end_offset])
+
+    def read_range(self, begin_in_milliseconds: float,
+                   end_in_milliseconds: float) -> bytes:
+        """Bytes of frames starting within [begin, end), a valid mp3 stream by itself"""
+        (begin_offset, end_offset) = self.get_byte_range(
+            begin_in_milliseconds, end_in_milliseconds)
+        return self._mmap[begin_offset:end_offset]
+
+    def get_byte_range(self, begin_in_milliseconds: float,
+                       end_in_milliseconds: float) -> tuple:
+        """Byte range of frames starting within [begin, end)"""
+        begin_idx = self._bisect_frame(begin_in_milliseconds)
+        end_idx = self._bisect_frame(end_in_milliseconds)
+        return self.frame_offsets[begin_idx], self.frame_offsets[end_idx]
+
+    def _bisect_frame(self, time_in_milliseconds: float) -> int:
+        # first frame starting at or after time_in_milliseconds
+        # (the sentinel index if none)
+        num_of_frames = len(self.frame_times) - 1
+        low, high = 0, num_of_frames
+        while low < high:
+            mid = (low + high) // 2
+            if self.frame_times[mid] < time_in_milliseconds:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _index_frames(self):
+        data = self._mmap
+        end = len(data)
+        if end >= ID3V1_TAG_SIZE and data[end -
+                                          ID3V1_TAG_SIZE:end - ID3V1_TAG_SIZE + 3] == b"TAG":
+            end -= ID3V1_TAG_SIZE
+
+        offset = self._skip_id3v2_tag()
+        frames_end_offset = offset
+        elapsed_in_milliseconds = 0.0
+        is_first_frame = True
+        while offset + FRAME_HEADER_SIZE <= end:
+            frame = parse_frame_header(data[offset:offset + FRAME_HEADER_SIZE])
+            if frame is None or offset + frame[0] > end:
+                offset = self._resync(offset + 1, end)
+                continue
+
+            (frame_length, num_of_samples, sample_rate, side_info_size) = frame
+            if is_first_frame:
+                is_first_frame = False
+                # Xing/Info/VBRI header frame describes the whole file, drop it
+                # so that chucks are not reported with the full file length
+                tag_offset = offset + FRAME_HEADER_SIZE + side_info_size
+                if data[tag_offset:tag_offset + 4] in (b"Xing", b"Info") or \
+                        data[offset + 36:offset + 40] == b"VBRI":
+                    offset += frame_length
+                    continue
+
+            self.frame_offsets.append(offset)
+            self.frame_times.append(elapsed_in_milliseconds)
+            elapsed_in_milliseconds += 1000 * num_of_samples / sample_rate
+            offset += frame_length
+            frames_end_offset = offset
+
+        # sentinel, trailing bytes which are not frames (e.g., APE tag) are excluded
+        self.frame_offsets.append(frames_end_offset)
+        self.frame_times.append(elapsed_in_milliseconds)
+
+    def _skip_id3v2_tag(self) -> int:
+        header = self._mmap[:ID3V2_HEADER_SIZE]
+        if len(header) < ID3V2_HEADER_SIZE or header[:3] != b"ID3":
+            return 0
+
+        # tag size is stored as a 28-bit synchsafe integer
+        size = (header[6] << 21) | (header[7] << 14) | (
+            header[8] << 7) | header[9]
+        has_footer = header[5] & 0x10
+        return ID3V2_HEADER_SIZE + size + (ID3V2_HEADER_SIZE if has_footer else 0)
+
+    def _resync(self, offset: int, end: int) -> int:
+        """Find the next offset where two consecutive valid frame headers are located"""
+        data = self._mmap
+        while True:
+            offset = data.find(b"\xFF", offset, end)
+            if offset == -1 or offset + FRAME_HEADER_SIZE > end:
+                return end
+
+            frame = parse_frame_header(data[offset:offset + FRAME_HEADER_SIZE])
+            if frame is not None:
+                next_offset = offset + frame[0]
+                if next_offset == end or (next_offset + FRAME_HEADER_SIZE <= end and parse_frame_header(
+                        data[next_offset:next_offset + FRAME_HEADER_SIZE]) is not None):
+                    return offset
+            offset += 1
@@ -0,0 +1,305 @@
+""" Shared adaptive rate limiter for requests sent to external services """
+import logging
+import random
+import threading
+import time
+
+from LNG_AI import constants
+
+# Per-service quotas
+# - rate_per_second / burst: token bucket refill rate and capacity
+# - max_concurrency: upper bound of the AIMD concurrency window
+# - target_latency_in_seconds: responses slower than this shrink the window
+DEFAULT_SERVICE_QUOTAS = {
+    constants.RequestService.YOUTUBE_DATA_API: {
+        "rate_per_second": 5.0,
+        "burst": 10,
+        "max_concurrency": 8,
+        "target_latency_in_seconds": 2.0,
+    },
+    constants.RequestService.OPENAI_WHISPER: {
+        "rate_per_second": 50 / 60,
+        "burst": 3,
+        "max_concurrency": 4,
+        "target_latency_in_seconds": 120.0,
+    },
+    constants.RequestService.OPENAI_COMPLETION: {
+        "rate_per_second": 60 / 60,
+        "burst": 5,
+        "max_concurrency": 4,
+        "target_latency_in_seconds": 10.0,
+    },
+    constants.RequestService.OPENAI_FILES: {
+        "rate_per_second": 20 / 60,
+        "burst": 2,
+        "max_concurrency": 2,
+        "target_latency_in_seconds": 300.0,
+    },
+    constants.RequestService.OPENAI_FINE_TUNES: {
+        "rate_per_second": 20 / 60,
+        "burst": 5,
+        "max_concurrency": 2,
+        "target_latency_in_seconds": 10.0,
+    },
+}
+
+ADDITIVE_INCREASE = 1.0
+RATE_LIMITED_DECREASE_FACTOR = 0.5
+SLOW_RESPONSE_DECREASE_FACTOR = 0.8
+DEFAULT_RETRY_AFTER_IN_SECONDS = 1.0
+MAX_BACKOFF_IN_SECONDS = 60.0
+
+
+class RetryableRequestError(Exception):
+    """Raised by a request callable when the same request may succeed later"""
+
+    def __init__(self, message: str = "", retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(RetryableRequestError):
+    """Raised by a request callable when the service rejects it for rate limiting (e.g., 429)"""
+
+
+class TokenBucket():
+    """Token bucket refilled continuously at a fixed rate"""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        assert rate_per_second > 0, "rate_per_second must be > 0"
+        assert capacity >= 1, "capacity must be >= 1"
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_refill_time = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill_time
+        self._tokens = min(self.capacity, self._tokens +
+                           elapsed * self.rate_per_second)
+        self._last_refill_time = now
+
+    def seconds_until_available(self, now: float) -> float:
+        """Seconds to wait before a token can be consumed (0 if available now)"""
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_second
+
+    def consume(self, now: float):
+        """Consume a token, caller must check availability first"""
+        self._refill(now)
+        self._tokens -= 1
+
+    def drain(self, now: float):
+        """Drop all tokens (e.g., after being rate limited)"""
+        self._refill(now)
+        self._tokens = min(self._tokens, 0.0)
+
+
+class ServiceLimiter():
+    """Token bucket plus AIMD concurrency window for a single service
+
+    Note: not thread-safe by itself, RequestScheduler guards it with its condition
+    """
+
+    def __init__(self, service: constants.RequestService, quota: dict):
+        self.service = service
+        self.bucket = TokenBucket(quota["rate_per_second"], quota["burst"])
+        self.max_concurrency = quota["max_concurrency"]
+        self.target_latency_in_seconds = quota["target_latency_in_seconds"]
+
+        # start with a single in-flight request and probe upwards
+        self.concurrency_limit = 1.0
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.blocked_until = 0.0
+
+        self.total_cnt = 0
+        self.rate_limited_cnt = 0
+        self.failure_cnt = 0
+        self.avg_latency_in_seconds = None
+
+    def seconds_until_available(self, now: float) -> float:
+        """Seconds to wait before another request may be sent
+
+        Returns 0 if it can go now, None if it has to wait for an in-flight request
+        """
+        if self.in_flight >= int(self.concurrency_limit):
+            # woken up by on_finish
+            return None
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return self.bucket.seconds_until_available(now)
+
+    def on_start(self, now: float):
+        """Book-keeping when a request is sent"""
+        self.bucket.consume(now)
+        self.in_flight += 1
+        self.total_cnt += 1
+
+    def on_finish(self, now: float, latency_in_seconds: float,
+                  error: BaseException = None):
+        """Adjust the concurrency window from the request outcome"""
+        self.in_flight -= 1
+
+        if isinstance(error, RateLimitedError):
+            self.rate_limited_cnt += 1
+            self.concurrency_limit = max(
+                1.0, self.concurrency_limit * RATE_LIMITED_DECREASE_FACTOR)
+            retry_after = error.retry_after or DEFAULT_RETRY_AFTER_IN_SECONDS
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.bucket.drain(now)
+            return
+
+        if error is not None:
+            # failed for other reasons, latency is not meaningful
+            self.failure_cnt += 1
+            return
+
+        if self.avg_latency_in_seconds is None:
+            self.avg_latency_in_seconds = latency_in_seconds
+        else:
+            self.avg_latency_in_seconds = 0.8 * \
+                self.avg_latency_in_seconds + 0.2 * latency_in_seconds
+
+        if latency_in_seconds > self.target_latency_in_seconds:
+            self.concurrency_limit = max(
+                1.0, self.concurrency_limit * SLOW_RESPONSE_DECREASE_FACTOR)
+        else:
+            # +1 per window worth of successful requests
+            self.concurrency_limit = min(
+                self.max_concurrency,
+                self.concurrency_limit + ADDITIVE_INCREASE / self.concurrency_limit)
+
+    def metrics(self) -> dict:
+        """Snapshot of the limiter state"""
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "total_cnt": self.total_cnt,
+            "rate_limited_cnt": self.rate_limited_cnt,
+            "failure_cnt": self.failure_cnt,
+            "avg_latency_in_seconds": self.avg_latency_in_seconds,
+        }
+
+
+class RequestScheduler():
+    """Scheduler shared by every client sending requests to external services"""
+
+    def __init__(self, quotas: dict = None, max_retries: int = 5):
+        quotas = quotas if quotas is not None else DEFAULT_SERVICE_QUOTAS
+        self.max_retries = max_retries
+        self._condition = threading.Condition()
+        self._limiters = {service: ServiceLimiter(service, quota)
+                          for service, quota in quotas.items()}
+
+    def call(self, service: constants.RequestService, func, *args, **kwargs):
+        """Send func(*args, **kwargs) once the service allows it
+
+        func should raise RateLimitedError / RetryableRequestError to request a retry,
+        the last error is re-raised when retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            self._acquire(service)
+            start_time = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except RetryableRequestError as err:
+                error = err
+            except BaseException as err:
+                self._release(service, start_time, err)
+                raise
+            else:
+                self._release(service, start_time, None)
+                return result
+            self._release(service, start_time, error)
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            backoff = error.retry_after or min(
+                MAX_BACKOFF_IN_SECONDS, (2 ** attempt) * random.uniform(0.5, 1.0))
+            logging.warning(
+                f"{service.value} request failed ({error}), retry {attempt}/{self.max_retries} in {backoff:.1f}s")
+            time.sleep(backoff)
+
+    def queue_depth(self, service: constants.RequestService = None) -> int:
+        """Number of requests waiting for the given service (all services if None)"""
+        with self._condition:
+            if service is not None:
+                return self._limiters[service].queue_depth
+            return sum(
+                limiter.queue_depth for limiter in self._limiters.values())
+
+    def metrics(self) -> dict:
+        """Snapshot of per-service limiter metrics"""
+        with self._condition:
+            return {service.value: limiter.metrics()
+                    for service, limiter in self._limiters.items()}
+
+    def _acquire(self, service: constants.RequestService):
+        with self._condition:
+            limiter = self._limiters[service]
+            limiter.queue_depth += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait_in_seconds = limiter.seconds_until_available(now)
+                    if wait_in_seconds == 0:
+                        limiter.on_start(now)
+                        return
+                    self._condition.wait(timeout=wait_in_seconds)
+            finally:
+                limiter.queue_depth -= 1
+
+    def _release(self, service: constants.RequestService,
+                 start_time: float, error: BaseException):
+        with self._condition:
+            now = time.monotonic()
+            limiter = self._limiters[service]
+            was_throttled = now < limiter.blocked_until
+            limiter.on_finish(now, now - start_time, error)
+            if isinstance(error, RateLimitedError) and not was_throttled:
+                logging.warning(
+                    f"{service.value} throttled, {limiter.queue_depth} requests queued: {limiter.metrics()}")
+            self._condition.notify_all()
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Get the process-wide request scheduler"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = RequestScheduler()
+        return _SCHEDULER
+
+
+def call_openai(service: constants.RequestService, func, *args, **kwargs):
+    """Send an openai request through the shared scheduler
+
+    Note: openai errors are translated so the scheduler can retry transient failures
+    """
+    import openai
+
+    def call_once():
+        try:
+            return func(*args, **kwargs)
+        except openai.error.RateLimitError as err:
+            raise RateLimitedError(str(err)) from err
+        except (openai.error.Timeout, openai.error.APIConnectionError,
+                openai.error.ServiceUnavailableError, openai.error.TryAgain) as err:
+            raise RetryableRequestError(str(err)) from err
+        except openai.error.APIError as err:
+            # server errors (e.g., 500, 502), other status codes are not transient
+            if err.http_status is not None and err.http_status < 500:
+                raise
+            raise RetryableRequestError(str(err)) from err
+
+    return get_scheduler().call(service, call_once)
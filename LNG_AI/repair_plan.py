@@ -0,0 +1,187 @@
+""" Targeted repairs of audio files & transcripts reported by DataIntegrityChecker
+
+The checker records failures into a RepairPlan (stored as json), RepairExecutor
+then only re-does the listed work:
+    1. re-fetch videos whose full.mp3 is missing
+    2. re-export missing chucks from full.mp3, decoding only the chuck's frames
+    3. re-transcribe missing or repetitive transcripts (optionally with other parameters)
+"""
+import io
+import json
+import os
+
+from LNG_AI import constants
+from LNG_AI import mp3_frame_chunker
+from LNG_AI import utils
+from LNG_AI import work_lease
+
+# repetitive transcripts are usually Whisper decoding loops, sampling breaks them
+REPETITIVE_TRANSCRIPT_PARAMETERS = {"temperature": 0.2}
+
+
+def get_chuck_range(chuck_name: str, audio_length_in_milliseconds: float) -> tuple:
+    """(begin, end) in milliseconds of a chuck (e.g., 3_5_mins_chuck, one_minute_preview)"""
+    if chuck_name == constants.AudioFileKeyword.PREVIEW.value:
+        return (0, min(constants.ONE_MINUTE_IN_MILLISECONDS,
+                       audio_length_in_milliseconds))
+
+    idx, chuck_keyword = chuck_name.split("_", 1)
+    chuck_in_milliseconds = utils.FileUtils.get_chuck_in_milliseconds(
+        f"_{chuck_keyword}")
+    begin = (int(idx) - 1) * chuck_in_milliseconds
+    return (begin, min(begin + chuck_in_milliseconds,
+                       audio_length_in_milliseconds))
+
+
+class RepairPlan():
+    """Videos to re-fetch, chucks to re-export & chucks to re-transcribe
+
+    Layout (json):
+        {"refetch_videos": [{"video_id":...}, ...],
+         "reexport_chucks": [{"audio_file_dir":..., "chuck_name":...,
+                              "begin_in_milliseconds":..., "end_in_milliseconds":...}, ...],
+         "retranscribe_chucks": [{"audio_file_dir":..., "chuck_name":..., "reason":...,
+                                  "transcribe_parameters": {...}}, ...]}
+    """
+
+    def __init__(self, refetch_videos: list = None, reexport_chucks: list = None,
+                 retranscribe_chucks: list = None):
+        self.refetch_videos = refetch_videos or []
+        self.reexport_chucks = reexport_chucks or []
+        self.retranscribe_chucks = retranscribe_chucks or []
+
+    def is_empty(self) -> bool:
+        """Whether there is nothing to repair"""
+        return not (self.refetch_videos or self.reexport_chucks
+                    or self.retranscribe_chucks)
+
+    def add_refetch_video(self, audio_file_dir: str):
+        """Re-fetch a video (download if needed, then create its missing audio files)"""
+        video_id = os.path.basename(audio_file_dir)
+        if all(video["video_id"] != video_id for video in self.refetch_videos):
+            self.refetch_videos.append({"video_id": video_id})
+
+    def add_reexport_chuck(self, audio_file_dir: str, chuck_name: str):
+        """Re-export a chuck from full.mp3"""
+        if self._find(self.reexport_chucks, audio_file_dir, chuck_name):
+            return
+        audio_length_in_milliseconds = utils.AudioUtils.get_audio_length_in_milliseconds(
+            f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3")
+        (begin, end) = get_chuck_range(
+            chuck_name, audio_length_in_milliseconds)
+        self.reexport_chucks.append({
+            "audio_file_dir": audio_file_dir,
+            "chuck_name": chuck_name,
+            "begin_in_milliseconds": begin,
+            "end_in_milliseconds": end,
+        })
+
+    def add_retranscribe_chuck(self, audio_file_dir: str, chuck_name: str,
+                               reason: str, transcribe_parameters: dict = None):
+        """Re-transcribe a chuck, existing transcript is overwritten"""
+        if self._find(self.retranscribe_chucks, audio_file_dir, chuck_name):
+            return
+        self.retranscribe_chucks.append({
+            "audio_file_dir": audio_file_dir,
+            "chuck_name": chuck_name,
+            "reason": reason,
+            "transcribe_parameters": transcribe_parameters or {},
+        })
+
+    def save(self, repair_plan_path: str):
+        """Store the plan as json"""
+        content = {
+            "refetch_videos": self.refetch_videos,
+            "reexport_chucks": self.reexport_chucks,
+            "retranscribe_chucks": self.retranscribe_chucks,
+        }
+        with work_lease.atomic_output_path(repair_plan_path) as tmp_path:
+            with open(tmp_path, "w") as repair_plan_file:
+                json.dump(content, repair_plan_file,
+                          indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, repair_plan_path: str):
+        """Load a plan stored by save()"""
+        with open(repair_plan_path, "r") as repair_plan_file:
+            return cls(**json.load(repair_plan_file))
+
+    def __str__(self) -> str:
+        return (f"{len(self.refetch_videos)} videos to re-fetch, "
+                f"{len(self.reexport_chucks)} chucks to re-export, "
+                f"{len(self.retranscribe_chucks)} chucks to re-transcribe")
+
+    @staticmethod
+    def _find(entries: list, audio_file_dir: str, chuck_name: str) -> bool:
+        return any(entry["audio_file_dir"] == audio_file_dir and entry["chuck_name"] == chuck_name
+                   for entry in entries)
+
+
+class RepairExecutor():
+    """Execute a RepairPlan, touching only the listed videos & chucks"""
+
+    def __init__(self, transcriber=None, fetcher=None):
+        """
+        Args:
+            transcriber: audio_transcriber.AudioTranscriber, re-transcribing is skipped if not given
+            fetcher: youtube_audio_fetecher.YoutubeAudioFetcher, re-fetching is skipped if not given
+        """
+        self.transcriber = transcriber
+        self.fetcher = fetcher
+
+    def execute(self, plan: RepairPlan):
+        """Re-fetch, then re-export, then re-transcribe (later steps need earlier outputs)"""
+        for video in plan.refetch_videos:
+            self._refetch_video(video["video_id"])
+        for chuck in plan.reexport_chucks:
+            self._reexport_chuck(chuck)
+        for chuck in plan.retranscribe_chucks:
+            self._retranscribe_chuck(chuck)
+
+    def _refetch_video(self, video_id: str):
+        if self.fetcher is None:
+            print(f"no fetcher given, skip re-fetching {video_id}")
+            return
+
+        print(f"==> re-fetching {video_id}")
+        self.fetcher.obtain_audio_info(video_id)
+        # chucks of a re-fetched video were never checked, transcribe whatever is missing
+        if self.transcriber is not None:
+            audio_file_root = constants.RootDirectory.AUDIO_FILE_ROOT.value
+            self.transcriber.transcribe_dir(
+                f"{audio_file_root}/{video_id}", is_preview_only=False)
+
+    @staticmethod
+    def _reexport_chuck(chuck: dict):
+        # imported here, only re-exporting needs ffmpeg
+        from pydub import AudioSegment
+
+        audio_file_dir = chuck["audio_file_dir"]
+        export_path = f"{audio_file_dir}/{chuck['chuck_name']}.mp3"
+        print(f"==> re-exporting {export_path}",
+              f"({chuck['begin_in_milliseconds']} - {chuck['end_in_milliseconds']} ms)")
+        with mp3_frame_chunker.Mp3FrameChunker(
+                f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3") as chunker:
+            # hour chucks are frame copies of full.mp3
+            if constants.AudioFileKeyword.HOUR_CHUCK.value in chuck["chuck_name"]:
+                chunker.export_range(chuck["begin_in_milliseconds"],
+                                     chuck["end_in_milliseconds"], export_path)
+                return
+            chuck_bytes = chunker.read_range(
+                chuck["begin_in_milliseconds"], chuck["end_in_milliseconds"])
+
+        # other chucks are sent to Whisper, re-encode only this slice with the speech profile
+        audio = AudioSegment.from_file(io.BytesIO(chuck_bytes), format="mp3")
+        utils.AudioUtils.export_audio(
+            audio, export_path, constants.AudioExportProfile.SPEECH)
+
+    def _retranscribe_chuck(self, chuck: dict):
+        if self.transcriber is None:
+            print(
+                f"no transcriber given, skip re-transcribing {chuck['chuck_name']}")
+            return
+
+        audio_path = f"{chuck['audio_file_dir']}/{chuck['chuck_name']}.mp3"
+        print(f"==> re-transcribing {audio_path} ({chuck['reason']})")
+        self.transcriber.transcribe_file(
+            audio_path, overwrite=True, transcribe_parameters=chuck["transcribe_parameters"])
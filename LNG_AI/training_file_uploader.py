@@ -0,0 +1,230 @@
+""" Upload training files to OpenAI with dedup and resumable uploads """
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import openai
+import requests
+
+from LNG_AI import constants
+from LNG_AI import rate_limiter
+
+HASH_BLOCK_SIZE_IN_BYTES = 1024 * 1024
+# Reference: https://platform.openai.com/docs/api-reference/uploads
+UPLOAD_PART_SIZE_IN_BYTES = 64 * 1024 * 1024
+UPLOAD_EXPIRE_MARGIN_IN_SECONDS = 5 * 60
+
+
+class TrainingFileUploader():
+    """Upload jsonl datasets once, then reuse the remote file id by content hash
+
+    upload() can be called from several threads, registry updates are serialized and
+    the same content is uploaded once even if requested by several threads at a time
+
+    Registry layout (json):
+        {"files": {sha256: {"file_id":..., "bytes":..., "path":..., "uploaded_at":...}},
+         "pending": {sha256: {"upload_id":..., "part_ids": [...], "expires_at":...}},
+         "hashes": {abs_path: {"size":..., "mtime":..., "sha256":...}}}
+    """
+
+    def __init__(self, registry_path: str = None):
+        if registry_path is None:
+            registry_path = os.path.join(
+                constants.RootDirectory.JSONL_DATASET_ROOT.value,
+                constants.UPLOAD_REGISTRY_FILE_NAME)
+        self.registry_path = registry_path
+        self.registry = self._load_registry()
+        self._registry_lock = threading.RLock()
+        # sha256 -> concurrent.futures.Future of the file id, while being uploaded
+        self._in_flight_uploads = {}
+
+    def upload(self, jsonl_dataset_path: str) -> str:
+        """Return the remote file id of the dataset, uploading only if needed"""
+        content_hash = self._get_content_hash(jsonl_dataset_path)
+
+        # one upload per content at a time, other threads wait for its file id
+        with self._registry_lock:
+            in_flight_upload = self._in_flight_uploads.get(content_hash)
+            is_uploading_thread = in_flight_upload is None
+            if is_uploading_thread:
+                in_flight_upload = concurrent.futures.Future()
+                self._in_flight_uploads[content_hash] = in_flight_upload
+        if not is_uploading_thread:
+            print(f"{jsonl_dataset_path} is being uploaded by another thread, wait for it")
+            return in_flight_upload.result()
+
+        try:
+            file_id = self._upload(jsonl_dataset_path, content_hash)
+        except BaseException as err:
+            in_flight_upload.set_exception(err)
+            raise
+        else:
+            in_flight_upload.set_result(file_id)
+        finally:
+            with self._registry_lock:
+                self._in_flight_uploads.pop(content_hash)
+        return file_id
+
+    def _upload(self, jsonl_dataset_path: str, content_hash: str) -> str:
+        file_id = self._get_reusable_file_id(content_hash)
+        if file_id is not None:
+            print(f"{jsonl_dataset_path} already uploaded as {file_id}, reuse it")
+            return file_id
+
+        num_of_bytes = os.path.getsize(jsonl_dataset_path)
+        print(f"Uploading {jsonl_dataset_path} ({num_of_bytes} bytes)...")
+        if num_of_bytes <= UPLOAD_PART_SIZE_IN_BYTES:
+            file_id = self._upload_whole_file(jsonl_dataset_path)
+        else:
+            file_id = self._upload_by_parts(
+                jsonl_dataset_path, content_hash, num_of_bytes)
+
+        with self._registry_lock:
+            self.registry["files"][content_hash] = {
+                "file_id": file_id,
+                "bytes": num_of_bytes,
+                "path": jsonl_dataset_path,
+                "uploaded_at": datetime.now().strftime('%Y-%m-%d_%H-%M-%S'),
+            }
+            self.registry["pending"].pop(content_hash, None)
+            self._store_registry()
+        print(f"Uploaded {jsonl_dataset_path} as {file_id}")
+        return file_id
+
+    def _get_reusable_file_id(self, content_hash: str) -> str:
+        entry = self.registry["files"].get(content_hash)
+        if entry is None:
+            return None
+
+        # the remote file could have been deleted in the meantime
+        try:
+            rate_limiter.call_openai(
+                constants.RequestService.OPENAI_FILES, openai.File.retrieve, entry["file_id"])
+        except openai.error.InvalidRequestError:
+            logging.warning(
+                f"{entry['file_id']} no longer exists remotely, upload again")
+            with self._registry_lock:
+                self.registry["files"].pop(content_hash, None)
+                self._store_registry()
+            return None
+        return entry["file_id"]
+
+    def _get_content_hash(self, file_path: str) -> str:
+        """sha256 of the file, cached by (size, mtime) to avoid re-reading large files"""
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(abs_path)
+        cached = self.registry["hashes"].get(abs_path)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+            return cached["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(abs_path, "rb") as file:
+            for block in iter(lambda: file.read(HASH_BLOCK_SIZE_IN_BYTES), b""):
+                sha256.update(block)
+        content_hash = sha256.hexdigest()
+
+        with self._registry_lock:
+            self.registry["hashes"][abs_path] = {
+                "size": stat.st_size, "mtime": stat.st_mtime, "sha256": content_hash}
+            self._store_registry()
+        return content_hash
+
+    def _upload_whole_file(self, file_path: str) -> str:
+        def create():
+            # re-open on every attempt, the file handle is streamed by the client
+            with open(file_path, "rb") as jsonl_file:
+                return openai.File.create(file=jsonl_file, purpose='fine-tune')
+
+        file_create_response = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_FILES, create)
+        return file_create_response["id"]
+
+    def _upload_by_parts(self, file_path: str,
+                         content_hash: str, num_of_bytes: int) -> str:
+        """Upload in parts, parts already sent by an earlier attempt are skipped"""
+        pending = self.registry["pending"].get(content_hash)
+        if pending is None or pending["expires_at"] - \
+                UPLOAD_EXPIRE_MARGIN_IN_SECONDS < time.time():
+            upload = self._send_upload_request("POST", "uploads", json={
+                "purpose": "fine-tune",
+                "filename": os.path.basename(file_path),
+                "bytes": num_of_bytes,
+                "mime_type": "text/jsonl",
+            })
+            pending = {"upload_id": upload["id"],
+                       "part_ids": [], "expires_at": upload["expires_at"]}
+            with self._registry_lock:
+                self.registry["pending"][content_hash] = pending
+                self._store_registry()
+        else:
+            print(f"Resume upload {pending['upload_id']} from part",
+                  f"{len(pending['part_ids']) + 1}")
+
+        num_of_parts = -(-num_of_bytes // UPLOAD_PART_SIZE_IN_BYTES)
+        with open(file_path, "rb") as jsonl_file:
+            for idx in range(len(pending["part_ids"]), num_of_parts):
+                jsonl_file.seek(idx * UPLOAD_PART_SIZE_IN_BYTES)
+                part_data = jsonl_file.read(UPLOAD_PART_SIZE_IN_BYTES)
+                part = self._send_upload_request(
+                    "POST", f"uploads/{pending['upload_id']}/parts", files={"data": part_data})
+                # persist progress so a crash resumes from the next part
+                with self._registry_lock:
+                    pending["part_ids"].append(part["id"])
+                    self._store_registry()
+                print(f"==> uploaded part {idx + 1}/{num_of_parts}")
+
+        upload = self._send_upload_request(
+            "POST", f"uploads/{pending['upload_id']}/complete", json={"part_ids": pending["part_ids"]})
+        return upload["file"]["id"]
+
+    def _send_upload_request(self, method: str, path: str, **kwargs) -> dict:
+        """Uploads API is not wrapped by openai==0.27, call it over plain HTTP"""
+        def send_once():
+            try:
+                resp = requests.request(
+                    method, f"{openai.api_base}/{path}",
+                    headers={"Authorization": f"Bearer {openai.api_key}"},
+                    timeout=600, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+                raise rate_limiter.RetryableRequestError(str(err)) from err
+            if resp.status_code == requests.codes['too_many_requests']:
+                raise rate_limiter.RateLimitedError(
+                    f"rate limited ({resp.status_code})")
+            if resp.status_code >= 500:
+                raise rate_limiter.RetryableRequestError(
+                    f"server error ({resp.status_code})")
+            resp.raise_for_status()
+            return resp.json()
+
+        return rate_limiter.get_scheduler().call(
+            constants.RequestService.OPENAI_FILES, send_once)
+
+    def _load_registry(self) -> dict:
+        registry = {"files": {}, "pending": {}, "hashes": {}}
+        if os.path.isfile(self.registry_path):
+            with open(self.registry_path, "r") as registry_file:
+                registry.update(json.load(registry_file))
+        return registry
+
+    def _store_registry(self):
+        registry_dir = os.path.dirname(self.registry_path)
+        if registry_dir:
+            os.makedirs(registry_dir, exist_ok=True)
+        with self._registry_lock:
+            # unique temporary file, so processes sharing the registry never write the same one
+            tmp_registry_fd, tmp_registry_path = tempfile.mkstemp(
+                prefix=f"{os.path.basename(self.registry_path)}.", suffix=".tmp", dir=registry_dir or ".")
+            try:
+                with os.fdopen(tmp_registry_fd, "w") as registry_file:
+                    json.dump(self.registry, registry_file, indent=2)
+                os.replace(tmp_registry_path, self.registry_path)
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_registry_path)
@@ -0,0 +1,418 @@
+""" Positional inverted index over transcripts for phrase & proximity queries """
+import bisect
+import heapq
+import json
+import os
+import re
+import unicodedata
+
+from LNG_AI import constants
+from LNG_AI import utils
+
+MANIFEST_FILE_NAME = "manifest.json"
+MAX_NUM_OF_SEGMENTS = 8
+
+# CJK ideographs, kana & hangul are indexed as overlapping character bigrams,
+# other scripts (latin, digits) as whole words
+CJK_CHARACTERS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+CJK_RUN_PATTERN = re.compile(f"[{CJK_CHARACTERS}]+")
+WORD_PATTERN = re.compile(f"[^\\W{CJK_CHARACTERS}]+")
+
+
+def normalize(text: str) -> str:
+    """Normalize text before tokenizing (full-width -> half-width, lower case)"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def tokenize(text: str) -> list:
+    """Split normalized text into (term, character offset) pairs
+
+    In a CJK run, every character starts a bigram, except the last one which is
+    indexed as a unigram, so any character of the run can be located by prefix.
+    """
+    terms = []
+    for matched in CJK_RUN_PATTERN.finditer(text):
+        run = matched.group()
+        for idx in range(len(run) - 1):
+            terms.append((run[idx:idx + 2], matched.start() + idx))
+        terms.append((run[-1], matched.end() - 1))
+    for matched in WORD_PATTERN.finditer(text):
+        terms.append((matched.group(), matched.start()))
+    terms.sort(key=lambda term: term[1])
+    return terms
+
+
+def tokenize_query(text: str) -> list:
+    """Split a query into (term, relative offset, is_prefix) triples
+
+    A single character CJK run can not be looked up as an exact term (it's the first
+    char of bigrams in transcripts), so it's matched as a prefix instead.
+    """
+    terms = []
+    for matched in CJK_RUN_PATTERN.finditer(text):
+        run = matched.group()
+        if len(run) == 1:
+            terms.append((run, matched.start(), True))
+        for idx in range(len(run) - 1):
+            terms.append((run[idx:idx + 2], matched.start() + idx, False))
+    for matched in WORD_PATTERN.finditer(text):
+        terms.append((matched.group(), matched.start(), False))
+    return terms
+
+
+def encode_varint(value: int, out: bytearray):
+    """Append an unsigned LEB128 varint"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, offset: int) -> tuple:
+    """Read an unsigned LEB128 varint, returns (value, next offset)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_positions(positions: list) -> bytes:
+    """Delta + varint encoded sorted positions"""
+    out = bytearray()
+    previous = 0
+    for position in positions:
+        encode_varint(position - previous, out)
+        previous = position
+    return bytes(out)
+
+
+def decode_positions(data) -> list:
+    """Inverse of encode_positions"""
+    positions = []
+    offset = 0
+    previous = 0
+    while offset < len(data):
+        delta, offset = decode_varint(data, offset)
+        previous += delta
+        positions.append(previous)
+    return positions
+
+
+class IndexSegment():
+    """Immutable part of the index written by one update
+
+    Files:
+        {name}.lex: json {"terms": [sorted terms], "entries": [[offset, length, doc_freq], ...]}
+        {name}.post: per term, per doc: varint(doc id delta), varint(len(positions)), positions
+    """
+
+    def __init__(self, index_root: str, name: str):
+        self.name = name
+        with open(os.path.join(index_root, f"{name}.lex"), "r", encoding="utf-8") as lexicon_file:
+            lexicon = json.load(lexicon_file)
+        self.terms = lexicon["terms"]
+        self.entries = lexicon["entries"]
+        with open(os.path.join(index_root, f"{name}.post"), "rb") as postings_file:
+            self.postings = postings_file.read()
+
+    def find_terms(self, term: str, is_prefix: bool) -> list:
+        """Indices of the term (or terms starting with it)"""
+        begin = bisect.bisect_left(self.terms, term)
+        if not is_prefix:
+            return [begin] if begin < len(
+                self.terms) and self.terms[begin] == term else []
+        end = begin
+        while end < len(self.terms) and self.terms[end].startswith(term):
+            end += 1
+        return list(range(begin, end))
+
+    def iter_postings(self, term_idx: int):
+        """Yield (doc id, encoded positions) of the term"""
+        (offset, length, _) = self.entries[term_idx]
+        end = offset + length
+        doc_id = 0
+        while offset < end:
+            delta, offset = decode_varint(self.postings, offset)
+            doc_id += delta
+            positions_length, offset = decode_varint(self.postings, offset)
+            yield doc_id, self.postings[offset:offset + positions_length]
+            offset += positions_length
+
+    @staticmethod
+    def write(index_root: str, name: str, sorted_postings):
+        """Write a segment from (term, [(doc id, encoded positions), ...]) sorted by term"""
+        terms = []
+        entries = []
+        postings = bytearray()
+        for term, doc_postings in sorted_postings:
+            offset = len(postings)
+            previous_doc_id = 0
+            for doc_id, encoded_positions in doc_postings:
+                encode_varint(doc_id - previous_doc_id, postings)
+                encode_varint(len(encoded_positions), postings)
+                postings.extend(encoded_positions)
+                previous_doc_id = doc_id
+            if len(postings) == offset:
+                continue
+            terms.append(term)
+            entries.append([offset, len(postings) - offset, len(doc_postings)])
+
+        with open(os.path.join(index_root, f"{name}.post"), "wb") as postings_file:
+            postings_file.write(postings)
+        with open(os.path.join(index_root, f"{name}.lex"), "w", encoding="utf-8") as lexicon_file:
+            json.dump({"terms": terms, "entries": entries},
+                      lexicon_file, ensure_ascii=False, separators=(",", ":"))
+
+
+class TranscriptIndex():
+    """Positional inverted index over all transcripts ({audio_file_dir}/whisper/*.txt)
+
+    Updates are incremental: new or modified transcripts are written to a new segment,
+    replaced transcripts are tombstoned, and segments are merged once there are too many.
+    """
+
+    def __init__(self, index_root: str = None,
+                 mode: constants.TranscribeMode = constants.TranscribeMode.WHISPER):
+        if index_root is None:
+            index_root = constants.RootDirectory.TRANSCRIPT_INDEX_ROOT.value
+        self.index_root = index_root
+        self.mode = mode
+        self.manifest = {"docs": [], "deleted": [],
+                         "segments": [], "next_segment_id": 0}
+        manifest_path = os.path.join(index_root, MANIFEST_FILE_NAME)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+                self.manifest = json.load(manifest_file)
+        self._deleted = set(self.manifest["deleted"])
+        self.segments = [IndexSegment(index_root, name)
+                         for name in self.manifest["segments"]]
+
+    def update(self) -> int:
+        """Index transcripts added/modified since the last update, returns # of indexed docs"""
+        indexed_docs = {doc["path"]: doc_id for doc_id, doc in enumerate(self.manifest["docs"])
+                        if doc_id not in self._deleted}
+
+        new_docs = []
+        for transcript_path in self._get_transcript_paths():
+            stat = os.stat(transcript_path)
+            doc_id = indexed_docs.pop(transcript_path, None)
+            if doc_id is not None:
+                doc = self.manifest["docs"][doc_id]
+                if doc["mtime"] == stat.st_mtime and doc["size"] == stat.st_size:
+                    continue
+                # re-transcribed, the old version is dropped
+                self._deleted.add(doc_id)
+            new_docs.append((transcript_path, stat))
+
+        # transcripts removed from disk
+        self._deleted.update(indexed_docs.values())
+
+        term_postings = {}
+        for transcript_path, stat in new_docs:
+            doc_id = len(self.manifest["docs"])
+            path_items = transcript_path.split("/")
+            self.manifest["docs"].append({
+                "path": transcript_path,
+                "episode": path_items[-3],
+                "chuck": os.path.splitext(path_items[-1])[0],
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+            })
+            with open(transcript_path, "r", encoding="utf-8") as transcript_file:
+                text = normalize(transcript_file.read())
+            for term, position in tokenize(text):
+                term_postings.setdefault(term, {}).setdefault(
+                    doc_id, []).append(position)
+
+        if term_postings:
+            name = self._get_next_segment_name()
+            os.makedirs(self.index_root, exist_ok=True)
+            IndexSegment.write(self.index_root, name, (
+                (term, [(doc_id, encode_positions(positions))
+                        for doc_id, positions in sorted(term_postings[term].items())])
+                for term in sorted(term_postings)))
+            self.segments.append(IndexSegment(self.index_root, name))
+
+        self._store_manifest()
+        if len(self.segments) > MAX_NUM_OF_SEGMENTS:
+            self.compact()
+        return len(new_docs)
+
+    def compact(self):
+        """Merge all segments into one, dropping deleted docs"""
+        if not self.segments:
+            return
+
+        # doc ids of a segment are all larger than those of earlier segments,
+        # so postings of a term are merged by concatenating them in segment order
+        def iter_segment_terms(segment_idx):
+            for term_idx, term in enumerate(self.segments[segment_idx].terms):
+                yield term, segment_idx, term_idx
+
+        def iter_merged_postings():
+            merged = heapq.merge(*[iter_segment_terms(idx)
+                                   for idx in range(len(self.segments))])
+            current_term, doc_postings = None, []
+            for term, segment_idx, term_idx in merged:
+                if term != current_term:
+                    if current_term is not None:
+                        yield current_term, doc_postings
+                    current_term, doc_postings = term, []
+                doc_postings.extend(
+                    (doc_id, positions) for doc_id, positions in self.segments[segment_idx].iter_postings(term_idx)
+                    if doc_id not in self._deleted)
+            if current_term is not None:
+                yield current_term, doc_postings
+
+        name = self._get_next_segment_name()
+        IndexSegment.write(self.index_root, name, iter_merged_postings())
+
+        old_segment_names = [segment.name for segment in self.segments]
+        self.segments = [IndexSegment(self.index_root, name)]
+        self._store_manifest()
+        for old_segment_name in old_segment_names:
+            for ext in [".lex", ".post"]:
+                os.remove(os.path.join(self.index_root, old_segment_name + ext))
+
+    def search_phrase(self, phrase: str, limit: int = None) -> list:
+        """Find occurrences of the phrase
+
+        Returns:
+            list of {"episode":..., "chuck":..., "path":..., "offset":...} sorted by doc & offset,
+            offset is the character offset in the normalized transcript
+        """
+        hits = []
+        for doc_id, offsets in sorted(self._match_phrase(phrase).items()):
+            doc = self.manifest["docs"][doc_id]
+            for offset in sorted(offsets):
+                hits.append({"episode": doc["episode"], "chuck": doc["chuck"],
+                             "path": doc["path"], "offset": offset})
+                if limit is not None and len(hits) >= limit:
+                    return hits
+        return hits
+
+    def search_proximity(self, phrase_a: str, phrase_b: str,
+                         max_distance: int, limit: int = None) -> list:
+        """Find places where both phrases occur within max_distance characters
+
+        Returns:
+            list of {"episode":..., "chuck":..., "path":..., "offset_a":..., "offset_b":...}
+        """
+        matches_a = self._match_phrase(phrase_a)
+        matches_b = self._match_phrase(
+            phrase_b, doc_filter=set(matches_a)) if matches_a else {}
+
+        hits = []
+        for doc_id in sorted(set(matches_a) & set(matches_b)):
+            doc = self.manifest["docs"][doc_id]
+            offsets_b = sorted(matches_b[doc_id])
+            for offset_a in sorted(matches_a[doc_id]):
+                begin = bisect.bisect_left(offsets_b, offset_a - max_distance)
+                end = bisect.bisect_right(offsets_b, offset_a + max_distance)
+                for offset_b in offsets_b[begin:end]:
+                    hits.append({"episode": doc["episode"], "chuck": doc["chuck"], "path": doc["path"],
+                                 "offset_a": offset_a, "offset_b": offset_b})
+                    if limit is not None and len(hits) >= limit:
+                        return hits
+        return hits
+
+    def _match_phrase(self, phrase: str, doc_filter: set = None) -> dict:
+        """doc id -> set of phrase start offsets"""
+        query = normalize(phrase).strip()
+        query_terms = tokenize_query(query)
+        if not query_terms:
+            return {}
+        # every term matches its characters exactly, so only characters not covered
+        # by any term (spaces, punctuation, ...) need to be checked against transcripts
+        covered_characters = {relative_offset + idx for term, relative_offset, _ in query_terms
+                              for idx in range(len(term))}
+        is_covered_by_terms = len(covered_characters) == len(query)
+
+        # start with the rarest term to keep candidates small
+        query_terms.sort(key=lambda query_term: self._get_doc_freq(
+            query_term[0], query_term[2]))
+        candidates = None
+        for term, relative_offset, is_prefix in query_terms:
+            postings = self._get_postings(
+                term, is_prefix, doc_filter if candidates is None else set(candidates))
+            starts = {doc_id: {position - relative_offset for position in positions}
+                      for doc_id, positions in postings.items()}
+            if candidates is None:
+                candidates = starts
+            else:
+                candidates = {doc_id: candidates[doc_id] & starts[doc_id]
+                              for doc_id in candidates if doc_id in starts}
+                candidates = {doc_id: offsets for doc_id,
+                              offsets in candidates.items() if offsets}
+            if not candidates:
+                return {}
+        if is_covered_by_terms:
+            return candidates
+
+        # terms only locate the words & CJK characters of the query, characters in
+        # between are checked against the transcripts
+        matches = {}
+        for doc_id, offsets in candidates.items():
+            text = self._read_doc_text(doc_id)
+            offsets = {offset for offset in offsets
+                       if offset >= 0 and text[offset:offset + len(query)] == query}
+            if offsets:
+                matches[doc_id] = offsets
+        return matches
+
+    def _read_doc_text(self, doc_id: int) -> str:
+        """Normalized text of the doc (offsets of postings refer to it), empty if removed"""
+        try:
+            with open(self.manifest["docs"][doc_id]["path"], "r", encoding="utf-8") as transcript_file:
+                return normalize(transcript_file.read())
+        except FileNotFoundError:
+            return ""
+
+    def _get_doc_freq(self, term: str, is_prefix: bool) -> int:
+        return sum(segment.entries[term_idx][2] for segment in self.segments
+                   for term_idx in segment.find_terms(term, is_prefix))
+
+    def _get_postings(self, term: str, is_prefix: bool,
+                      doc_filter: set = None) -> dict:
+        """doc id -> positions of the term (or terms starting with it)"""
+        postings = {}
+        for segment in self.segments:
+            for term_idx in segment.find_terms(term, is_prefix):
+                for doc_id, encoded_positions in segment.iter_postings(
+                        term_idx):
+                    if doc_id in self._deleted or (
+                            doc_filter is not None and doc_id not in doc_filter):
+                        continue
+                    postings.setdefault(doc_id, []).extend(
+                        decode_positions(encoded_positions))
+        return postings
+
+    def _get_transcript_paths(self) -> list:
+        transcript_paths = []
+        for audio_file_dir in utils.FileUtils.get_audio_file_directories():
+            transcript_dir = f"{audio_file_dir}/{self.mode.value}"
+            if not os.path.isdir(transcript_dir):
+                continue
+            transcript_paths.extend(f"{transcript_dir}/{file_name}" for file_name in sorted(
+                os.listdir(transcript_dir)) if file_name.endswith(".txt"))
+        return transcript_paths
+
+    def _get_next_segment_name(self) -> str:
+        name = f"segment_{self.manifest['next_segment_id']:06d}"
+        self.manifest["next_segment_id"] += 1
+        return name
+
+    def _store_manifest(self):
+        self.manifest["deleted"] = sorted(self._deleted)
+        self.manifest["segments"] = [
+            segment.name for segment in self.segments]
+        os.makedirs(self.index_root, exist_ok=True)
+        manifest_path = os.path.join(self.index_root, MANIFEST_FILE_NAME)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(self.manifest, manifest_file, ensure_ascii=False)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
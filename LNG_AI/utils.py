@@ -4,14 +4,15 @@ import os
 import math
 import logging
 import random
+import re
 import json
 from collections import Counter
 
 from datetime import datetime
-from mutagen.mp3 import MP3
-import openai
 
 from LNG_AI import constants
+from LNG_AI import rate_limiter
+from LNG_AI import work_lease
 
 
 class InteractionUtils():
@@ -34,9 +35,9 @@ class FileUtils():
     """Class for common file utilities"""
     @staticmethod
     def get_audio_file_directories() -> list:
-        """Get file directories for each episode"""
+        """Get file directories for each episode, sorted (os.listdir order depends on the filesystem)"""
         audio_file_root = constants.RootDirectory.AUDIO_FILE_ROOT.value
-        audio_ids = os.listdir(audio_file_root)
+        audio_ids = sorted(os.listdir(audio_file_root))
         return [f"{audio_file_root}/{audio_id}" for audio_id in audio_ids]
 
     @staticmethod
@@ -62,20 +63,19 @@ class FileUtils():
 
     @staticmethod
     def get_five_minutes_chuck_paths(
-            audio_file_dir: str, chuck_keyword: constants.AudioFileKeyword, ext_type: str) -> list:
-        """Get five minutes chuck"""
-        # only five-minutes and 1-hour chuck are supported
-        if chuck_keyword not in [
-                constants.AudioFileKeyword.FIVE_MINUTES_CHUCK, constants.AudioFileKeyword.HOUR_CHUCK]:
-            raise ValueError(f"Invalid chuck_keyword: {chuck_keyword}")
+            audio_file_dir: str, chuck_keyword, ext_type: str) -> list:
+        """Get chuck paths (chuck_keyword: constants.AudioFileKeyword or str like '_10_mins_chuck')"""
+        # only fixed-length chucks are supported
+        chuck_in_milliseconds = FileUtils.get_chuck_in_milliseconds(
+            chuck_keyword)
+        chuck_keyword_value = chuck_keyword.value if isinstance(
+            chuck_keyword, constants.AudioFileKeyword) else chuck_keyword
 
         # Get the total length of the audio file
         total_length_in_milliseconds = AudioUtils.get_audio_length_in_milliseconds(
             f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3")
 
         # Get the upper bound index
-        chuck_in_milliseconds = 5 * constants.ONE_MINUTE_IN_MILLISECONDS if chuck_keyword == constants.AudioFileKeyword.FIVE_MINUTES_CHUCK else 60 * \
-            constants.ONE_MINUTE_IN_MILLISECONDS
         upper_bound_index = math.ceil(
             total_length_in_milliseconds / chuck_in_milliseconds)
 
@@ -83,14 +83,71 @@ class FileUtils():
         paths = []
         for idx in range(1, upper_bound_index + 1):
             if ext_type == "audio":
-                path = f"{audio_file_dir}/{idx}{chuck_keyword.value}.mp3"
+                path = f"{audio_file_dir}/{idx}{chuck_keyword_value}.mp3"
             elif ext_type == "transcript":
-                path = f"{audio_file_dir}/whisper/{idx}{chuck_keyword.value}.txt"
+                path = f"{audio_file_dir}/whisper/{idx}{chuck_keyword_value}.txt"
             else:
                 raise ValueError(f"Invalid ext_type: {ext_type}")
             paths.append(path)
         return paths
 
+    @staticmethod
+    def get_chuck_keyword(chuck_in_milliseconds: int) -> str:
+        """Get chuck keyword for the given granularity (e.g., '_5_mins_chuck', '_30_secs_chuck')"""
+        assert chuck_in_milliseconds > 0 and chuck_in_milliseconds % 1000 == 0, \
+            "chuck_in_milliseconds should be a positive number of whole seconds"
+
+        for chuck_keyword, minutes in constants.CHUCK_KEYWORD_TO_MINUTES.items():
+            if minutes * constants.ONE_MINUTE_IN_MILLISECONDS == chuck_in_milliseconds:
+                return chuck_keyword.value
+        if chuck_in_milliseconds % constants.ONE_MINUTE_IN_MILLISECONDS == 0:
+            return f"_{chuck_in_milliseconds // constants.ONE_MINUTE_IN_MILLISECONDS}_mins_chuck"
+        return f"_{chuck_in_milliseconds // 1000}_secs_chuck"
+
+    @staticmethod
+    def get_chuck_in_milliseconds(chuck_keyword) -> int:
+        """Get granularity of the given chuck keyword (constants.AudioFileKeyword or str)"""
+        if isinstance(chuck_keyword, constants.AudioFileKeyword):
+            if chuck_keyword not in constants.CHUCK_KEYWORD_TO_MINUTES:
+                raise ValueError(f"Invalid chuck_keyword: {chuck_keyword}")
+            return constants.CHUCK_KEYWORD_TO_MINUTES[chuck_keyword] * \
+                constants.ONE_MINUTE_IN_MILLISECONDS
+
+        for keyword, minutes in constants.CHUCK_KEYWORD_TO_MINUTES.items():
+            if keyword.value == chuck_keyword:
+                return minutes * constants.ONE_MINUTE_IN_MILLISECONDS
+
+        matched = re.fullmatch(r"_(\d+)_(secs|mins)_chuck", chuck_keyword)
+        if matched is None or int(matched.group(1)) == 0:
+            raise ValueError(f"Invalid chuck_keyword: {chuck_keyword}")
+        unit_in_milliseconds = 1000 if matched.group(
+            2) == "secs" else constants.ONE_MINUTE_IN_MILLISECONDS
+        return int(matched.group(1)) * unit_in_milliseconds
+
+    @staticmethod
+    def get_duplicate_chucks(audio_file_dir: str) -> dict:
+        """Get chucks overlapping earlier audio (chuck name -> matched chuck info)"""
+        duplicate_chucks_path = f"{audio_file_dir}/{constants.DUPLICATE_CHUCKS_FILE_NAME}"
+        if not os.path.isfile(duplicate_chucks_path):
+            return {}
+        with open(duplicate_chucks_path, "r") as duplicate_chucks_file:
+            return json.load(duplicate_chucks_file)
+
+    @staticmethod
+    def store_duplicate_chucks(audio_file_dir: str, duplicate_chucks: dict):
+        """Store chucks overlapping earlier audio, they are skipped by transcribing & dataset"""
+        duplicate_chucks_path = f"{audio_file_dir}/{constants.DUPLICATE_CHUCKS_FILE_NAME}"
+        with work_lease.atomic_output_path(duplicate_chucks_path) as tmp_path:
+            with open(tmp_path, "w") as duplicate_chucks_file:
+                json.dump(duplicate_chucks, duplicate_chucks_file,
+                          indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def is_duplicate_chuck(chuck_path: str, duplicate_chucks: dict) -> bool:
+        """Whether the chuck audio/transcript path is marked as duplicate"""
+        chuck_name = os.path.splitext(os.path.basename(chuck_path))[0]
+        return chuck_name in duplicate_chucks
+
     @staticmethod
     def store_as_html(video_infos, store_file_path):
         '''helper function to store latest video infos in md file'''
@@ -126,9 +183,38 @@ class AudioUtils():
         """
         Note: use mutagen.mp3 instead of AudioSegment, which has much lower loading time
         """
+        from mutagen.mp3 import MP3
+
         audio = MP3(file_path)
         return audio.info.length * 1000
 
+    @staticmethod
+    def apply_export_profile(
+            audio, export_profile: constants.AudioExportProfile):
+        """Resample/downmix a pydub AudioSegment as the given export profile"""
+        parameters = constants.AUDIO_EXPORT_PROFILE_PARAMETERS[export_profile]
+        if parameters["frame_rate"] is not None:
+            audio = audio.set_frame_rate(parameters["frame_rate"])
+        if parameters["channels"] is not None:
+            audio = audio.set_channels(parameters["channels"])
+        return audio
+
+    @staticmethod
+    def export_audio(audio, export_path: str,
+                     export_profile: constants.AudioExportProfile):
+        """Export a pydub AudioSegment as mp3 with the given profile, atomically"""
+        with work_lease.atomic_output_path(export_path) as tmp_export_path:
+            if export_profile == constants.AudioExportProfile.ARCHIVAL:
+                audio.export(tmp_export_path, format="mp3")
+                return
+
+            # no-op if the audio was already converted by apply_export_profile
+            audio = AudioUtils.apply_export_profile(audio, export_profile)
+            bitrate_in_kbps = constants.AUDIO_EXPORT_PROFILE_PARAMETERS[
+                export_profile]["bitrate_in_kbps"]
+            audio.export(tmp_export_path, format="mp3",
+                         bitrate=f"{bitrate_in_kbps}k")
+
 
 class TranscriptUtils():
     """Class for common transcript utilities"""
@@ -162,49 +248,55 @@ class TranscriptUtils():
 class JsonlUtils():
     """Class for common jsonl utilities"""
     @staticmethod
-    def store_portion_jsonl(jsonls: list[dict], portion: float):
-        """Store a portion of the jsonls"""
-        assert portion > 0 and portion <= 1, "portion should be between 0 and 1"
-
-        # Get the number of jsonls to store
-        num_of_jsonls_to_store = math.ceil(len(jsonls) * portion)
-
-        # Sort the jsonls randomly
-        random.shuffle(jsonls)
-
-        # Save the jsonls to export_jsonl_path
-        os.makedirs(
-            constants.RootDirectory.JSONL_DATASET_ROOT.value,
-            exist_ok=True)
-        export_json_file = f"jsonl_dataset_{int(portion * 100)}_percent_{num_of_jsonls_to_store}.jsonl"
-        export_jsonl_path = os.path.join(
-            constants.RootDirectory.JSONL_DATASET_ROOT.value, export_json_file)
-        with open(export_jsonl_path, "w") as file:
-            for idx in range(num_of_jsonls_to_store):
-                jsonl = jsonls[idx]
-                json.dump(jsonl, file)
-                file.write('\n')
-
-            # Log
-            print(f"JSONL dataset successfully created with size (portion={portion}): "
-                  f"{num_of_jsonls_to_store} records")
+    def write_portion_jsonl(jsonls, portion: float) -> str:
+        """Write already sampled jsonls of a portion (any iterable, consumed once), return the jsonl path"""
+        jsonl_dataset_root = constants.RootDirectory.JSONL_DATASET_ROOT.value
+        os.makedirs(jsonl_dataset_root, exist_ok=True)
+        # the file name holds the number of records, only known once all are written
+        tmp_jsonl_path = os.path.join(
+            jsonl_dataset_root, f"jsonl_dataset_{int(portion * 100)}_percent.{work_lease.WORKER_ID}.tmp")
+        num_of_jsonls = 0
+        try:
+            with open(tmp_jsonl_path, "w") as file:
+                for jsonl in jsonls:
+                    json.dump(jsonl, file)
+                    file.write('\n')
+                    num_of_jsonls += 1
+            export_json_file = f"jsonl_dataset_{int(portion * 100)}_percent_{num_of_jsonls}.jsonl"
+            export_jsonl_path = os.path.join(
+                jsonl_dataset_root, export_json_file)
+            os.replace(tmp_jsonl_path, export_jsonl_path)
+        finally:
+            if os.path.exists(tmp_jsonl_path):
+                os.remove(tmp_jsonl_path)
+
+        # Log
+        print(f"JSONL dataset successfully created with size (portion={portion}): "
+              f"{num_of_jsonls} records")
+        return export_jsonl_path
 
     @staticmethod
-    def create_jsonl_database(repetitive_word_threshold: float, debug: bool):
-        """Create jsonl database"""
-        jsonl_dataset_list = []
-
-        # Get list of jsonl
+    def iter_transcript_jsonls(repetitive_word_threshold: float, debug: bool,
+                               chuck_keyword: constants.AudioFileKeyword = constants.AudioFileKeyword.FIVE_MINUTES_CHUCK):
+        """Yield (audio_file_dir, jsonl) of every prompt/completion window, episode by episode"""
+        # Get list of jsonl, episodes & chucks in a fixed order so a seed always samples the same windows
         audio_file_dirs = FileUtils.get_audio_file_directories()
         for audio_file_dir in audio_file_dirs:
-            for five_minutes_transcript_path in FileUtils.get_five_minutes_chuck_transcript_paths(
-                    audio_file_dir):
+            duplicate_chucks = FileUtils.get_duplicate_chucks(audio_file_dir)
+            # chuck paths are listed by chuck index, not by directory listing
+            for five_minutes_transcript_path in FileUtils.get_five_minutes_chuck_paths(
+                    audio_file_dir, chuck_keyword=chuck_keyword, ext_type="transcript"):
+                # overlapping content is already covered by an earlier episode
+                if FileUtils.is_duplicate_chuck(
+                        five_minutes_transcript_path, duplicate_chucks):
+                    continue
+
                 # True means okay (not repetitive)
                 if TranscriptUtils.check_transcript_repetitive_word_occurance(
                         five_minutes_transcript_path, repetitive_word_threshold, debug):
                     with open(five_minutes_transcript_path, "r") as file:
                         words = file.read().split(" ")
-                        num_of_sentences_to_consider = 3
+                        num_of_sentences_to_consider = constants.NUM_OF_SENTENCES_PER_PROMPT
                         assert len(words) >= num_of_sentences_to_consider + \
                             1, "Not enough words to create jsonl"
 
@@ -215,14 +307,48 @@ class JsonlUtils():
                             separator = constants.SEPARRATOR
                             jsonl = {"prompt": separator.join(words[idx:idx + num_of_sentences_to_consider]),
                                      "completion": words[idx + num_of_sentences_to_consider]}
-                            jsonl_dataset_list.append(jsonl)
+                            yield (audio_file_dir, jsonl)
+
+    @staticmethod
+    def create_jsonl_database(repetitive_word_threshold: float, debug: bool,
+                              chuck_keyword: constants.AudioFileKeyword = constants.AudioFileKeyword.FIVE_MINUTES_CHUCK,
+                              seed: int = 0, stratified: bool = False,
+                              portions: list = None):
+        """Create jsonl database, all portions are sampled in one pass over the transcripts
 
-        # Store a portion of the jsonl_dataset_list
-        portions = [0.005, 0.01, 0.1, 0.2, 0.3,
-                    0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]
-        for portion in portions:
-            JsonlUtils.store_portion_jsonl(
-                jsonl_dataset_list, portion)
+        seed: same seed & transcripts, same portions (smaller portions are contained in larger ones)
+        stratified: every episode contributes its share of windows to every portion
+
+        The 100% portion is streamed to disk in transcript order while sampling, only
+        windows of the largest smaller portion are kept in memory.
+        """
+        from LNG_AI import dataset_sampler
+
+        if portions is None:
+            portions = constants.DATASET_PORTIONS
+        assert all(0 < portion <= 1 for portion in portions), \
+            "portions should be between 0 and 1"
+        sampled_portions = [portion for portion in portions if portion < 1]
+        sampler = dataset_sampler.PortionSampler(
+            sampled_portions, seed=seed, stratified=stratified) if sampled_portions else None
+
+        def iter_sampled_jsonls():
+            for audio_file_dir, jsonl in JsonlUtils.iter_transcript_jsonls(
+                    repetitive_word_threshold, debug, chuck_keyword):
+                if sampler is not None:
+                    sampler.add(jsonl, audio_file_dir)
+                yield jsonl
+
+        if len(sampled_portions) < len(portions):
+            JsonlUtils.write_portion_jsonl(iter_sampled_jsonls(), 1)
+        else:
+            for _ in iter_sampled_jsonls():
+                pass
+
+        # Store a portion of the jsonl dataset
+        for portion in sampled_portions:
+            JsonlUtils.write_portion_jsonl(
+                sampler.get_portion(portion), portion)
 
     @staticmethod
     def get_jsonls(jsonl_path: str) -> list[dict]:
@@ -233,12 +359,29 @@ class JsonlUtils():
                 jsonls.append(json.loads(line))
         return jsonls
 
+    @staticmethod
+    def iter_jsonls(jsonl_path: str):
+        """Read jsonl file line by line without holding it in memory"""
+        with open(jsonl_path, "r") as file:
+            for line in file:
+                yield json.loads(line)
+
 
 class OpenaiUtils():
-    """Class for common openai utilities"""
+    """Class for common openai utilities
+
+    Note: openai (and mutagen in AudioUtils) are imported on use, so that commands
+    which do not talk to OpenAI don't pay for importing it
+    """
     @staticmethod
-    def test_fine_tune_model(model_name: str, num_of_sentences_generated: int):
-        """Test fine-tune model"""
+    def test_fine_tune_model(model_name: str, num_of_sentences_generated: int,
+                             request_permission: bool = True) -> str:
+        """Test fine-tune model, return the path of the generated chat history
+
+        request_permission: ask before spending, False for non-interactive runs (e.g., sweeps)
+        """
+        import openai
+
         assert model_name is not None, "model_name cannot be None"
         assert num_of_sentences_generated > 0, "num_of_sentences_generated must be > 0"
 
@@ -249,7 +392,7 @@ class OpenaiUtils():
         estimated_cost = OpenaiUtils.estimate_cost_estimation(
             num_of_sentences_generated=num_of_sentences_generated, mode="usage")
         print(f"Estimated cost: ${estimated_cost}")
-        if not InteractionUtils.request_continue_permission():
+        if request_permission and not InteractionUtils.request_continue_permission():
             exit()
 
         os.makedirs(
@@ -271,7 +414,9 @@ class OpenaiUtils():
 
             num_tokens = random.randint(int(constants.AVG_NUM_OF_TOKENS_PER_GENERATED_SENTENCE * 0.8),
                                         int(constants.AVG_NUM_OF_TOKENS_PER_GENERATED_SENTENCE * 1.2))
-            response = openai.Completion.create(
+            response = rate_limiter.call_openai(
+                constants.RequestService.OPENAI_COMPLETION,
+                openai.Completion.create,
                 model=model_name,
                 prompt=prompt,
                 max_tokens=num_tokens,
@@ -290,18 +435,24 @@ class OpenaiUtils():
         with open(generated_chat_history_file_path, "w") as chat_history_file:
             for sentence in chat_history:
                 chat_history_file.write(sentence + "\n")
+        return generated_chat_history_file_path
 
     @staticmethod
     def view_training_process(model_id: str):
-        """View training process for a given model_id"""
+        """View training process for a given model_id (served from the local status cache)"""
+        from LNG_AI import fine_tune_status
+
         assert model_id is not None, "model_id cannot be None"
 
         print(f"Viewing training process for model_id: {model_id}")
-        fine_tune_job_retrieve_response = openai.FineTune.retrieve(model_id)
-
-        overall_status = fine_tune_job_retrieve_response["status"]
-        print("==> Overall status: ", overall_status)
-        for event in fine_tune_job_retrieve_response["events"]:
+        status_cache = fine_tune_status.FineTuneStatusCache()
+        status_cache.refresh()
+        job = status_cache.get_job(model_id)
+        assert job is not None, f"{model_id} not found"
+        status_cache.fetch_new_events(model_id)
+
+        print("==> Overall status: ", job["status"])
+        for event in job["events"]:
             eight_hours_in_seconds = 8 * 60 * 60
             print("==>", datetime.utcfromtimestamp(
                 event["created_at"] + eight_hours_in_seconds), "Event message: ", event["message"])
@@ -311,6 +462,10 @@ class OpenaiUtils():
         """
         Note: currently it is NOT supported to fine-tune from a previous fine-tune model
         """
+        import openai
+
+        from LNG_AI import training_file_uploader
+
         estimated_cost = OpenaiUtils.estimate_cost_estimation(
             jsonl_dataset_path=jsonl_dataset_path, mode="train")
         print(f"Estimated cost: ${estimated_cost}")
@@ -318,25 +473,26 @@ class OpenaiUtils():
         if not InteractionUtils.request_continue_permission():
             exit()
 
-        with open(jsonl_dataset_path) as jsonl_file:
-            file_create_response = openai.File.create(
-                file=jsonl_file, purpose='fine-tune')
-        file_id = file_create_response["id"]
+        # same dataset content uploaded before is reused by its file id
+        uploader = training_file_uploader.TrainingFileUploader()
+        file_id = uploader.upload(jsonl_dataset_path)
 
         print("Start fine-tuning...")
-        response = openai.FineTune.create(
+        response = rate_limiter.call_openai(
+            constants.RequestService.OPENAI_FINE_TUNES, openai.FineTune.create,
             training_file=file_id, model='babbage')
         print(response)
 
     @staticmethod
     def view_fine_tune_models():
-        """View all fine-tune models"""
-        fine_tune_models_list = openai.FineTune.list()
-        for fine_tune_model in fine_tune_models_list["data"]:
-            model_name = fine_tune_model["fine_tuned_model"]
-            model_id = fine_tune_model["id"]
-            model_training_file_size_history = [
-                training_file["bytes"] for training_file in fine_tune_model["training_files"]]
+        """View all fine-tune models (served from the local status cache)"""
+        from LNG_AI import fine_tune_status
+
+        status_cache = fine_tune_status.FineTuneStatusCache()
+        status_cache.refresh()
+        for model_id, job in status_cache.get_jobs().items():
+            model_name = job["fine_tuned_model"]
+            model_training_file_size_history = job["training_file_bytes"]
             print(model_name)
             print(f"==> ID: {model_id}")
             print(
@@ -348,9 +504,8 @@ class OpenaiUtils():
         """Estimate cost estimation for a given jsonl dataset"""
 
         if mode == "train":
-            jsonls = JsonlUtils.get_jsonls(jsonl_dataset_path)
             estimated_word_count = sum(
-                [len(jsonl["prompt"]) + len(jsonl["completion"]) for jsonl in jsonls])
+                len(jsonl["prompt"]) + len(jsonl["completion"]) for jsonl in JsonlUtils.iter_jsonls(jsonl_dataset_path))
             estimated_token_count = estimated_word_count * 2
             print(f"Estimated token count: {estimated_token_count}")
             estimated_1k_token_count = estimated_token_count / 1000
@@ -0,0 +1,197 @@
+""" Lease-based work claiming & atomic outputs over a shared storage root
+
+Several workers (processes or hosts) can point at the same storage root: before
+working on a video or a chuck, a worker claims its lease, other workers skip it
+until the lease is released or expires (e.g., the worker crashed).
+
+Only atomic file system operations are relied on (O_EXCL create, rename), which
+also hold on NFS shares.
+"""
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from LNG_AI import constants
+
+DEFAULT_LEASE_IN_SECONDS = 30 * 60
+
+
+def get_worker_id() -> str:
+    """Unique id of this worker process"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+WORKER_ID = get_worker_id()
+
+
+@contextlib.contextmanager
+def atomic_output_path(output_path: str):
+    """Yield a temporary path next to output_path, renamed to output_path on success
+
+    Readers never see partially written outputs, and a crashed worker leaves
+    only a temporary file behind instead of a corrupted output.
+    """
+    # same directory (so same file system) for an atomic rename, .tmp extension
+    # so listings of .mp3/.txt files never pick partial outputs up
+    tmp_output_path = f"{output_path}.{WORKER_ID}.tmp"
+    try:
+        yield tmp_output_path
+        os.replace(tmp_output_path, output_path)
+    finally:
+        if os.path.exists(tmp_output_path):
+            os.remove(tmp_output_path)
+
+
+def write_text_atomically(output_path: str, text: str):
+    """Write a text file through atomic_output_path"""
+    with atomic_output_path(output_path) as tmp_output_path:
+        with open(tmp_output_path, "w", encoding="utf-8") as output_file:
+            output_file.write(text)
+
+
+class Lease():
+    """A claimed lease, renewed in the background while used as a context manager"""
+
+    def __init__(self, manager, lease_path: str, expires_at: float):
+        self.manager = manager
+        self.lease_path = lease_path
+        self.expires_at = expires_at
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread = None
+        # a renewal in progress would write the lease file back after release removed it
+        self._lock = threading.Lock()
+        self._released = False
+
+    def renew(self) -> bool:
+        """Extend the lease, False if it was lost (expired and claimed by another worker) or released"""
+        with self._lock:
+            if self._released:
+                return False
+            content = self.manager.read_lease(self.lease_path)
+            if content is None or content["owner"] != WORKER_ID:
+                return False
+            self.expires_at = time.time() + self.manager.lease_in_seconds
+            content["expires_at"] = self.expires_at
+            with atomic_output_path(self.lease_path) as tmp_lease_path:
+                with open(tmp_lease_path, "w") as lease_file:
+                    json.dump(content, lease_file)
+            return True
+
+    def release(self):
+        """Give the lease up (no-op if it was lost)"""
+        self._stop_heartbeat.set()
+        if self._heartbeat_thread is not None and \
+                self._heartbeat_thread is not threading.current_thread():
+            self._heartbeat_thread.join()
+        with self._lock:
+            self._released = True
+            content = self.manager.read_lease(self.lease_path)
+            if content is not None and content["owner"] == WORKER_ID:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.lease_path)
+
+    def _heartbeat(self):
+        while not self._stop_heartbeat.wait(self.manager.lease_in_seconds / 3):
+            if not self.renew():
+                print(f"lease lost: {self.lease_path}")
+                return
+
+    def __enter__(self):
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat, daemon=True)
+        self._heartbeat_thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class LeaseManager():
+    """Claim per-video / per-chuck leases stored as files under {storage root}/leases"""
+
+    def __init__(self, lease_root: str = None,
+                 lease_in_seconds: float = DEFAULT_LEASE_IN_SECONDS):
+        if lease_root is None:
+            lease_root = constants.RootDirectory.LEASE_ROOT.value
+        self.lease_root = lease_root
+        self.lease_in_seconds = lease_in_seconds
+
+    def try_claim(self, kind: constants.LeaseKind, key: str) -> Lease:
+        """Claim the lease of kind/key, None if another worker holds it"""
+        lease_dir = os.path.join(self.lease_root, kind.value)
+        os.makedirs(lease_dir, exist_ok=True)
+        lease_path = os.path.join(lease_dir, key.replace("/", "__") + ".lease")
+
+        for _ in range(2):
+            lease = self._create_lease(lease_path)
+            if lease is not None:
+                return lease
+            if not self._break_expired_lease(lease_path):
+                return None
+        return None
+
+    def claim(self, kind: constants.LeaseKind, key: str,
+              timeout_in_seconds: float = None, poll_in_seconds: float = 1.0) -> Lease:
+        """Wait until the lease of kind/key is claimed, None on timeout"""
+        start_time = time.time()
+        while True:
+            lease = self.try_claim(kind, key)
+            if lease is not None:
+                return lease
+            if timeout_in_seconds is not None and time.time() - \
+                    start_time > timeout_in_seconds:
+                return None
+            time.sleep(poll_in_seconds)
+
+    @staticmethod
+    def read_lease(lease_path: str) -> dict:
+        """Content of the lease file, None if it does not exist (or is being written)"""
+        try:
+            with open(lease_path, "r") as lease_file:
+                return json.load(lease_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _create_lease(self, lease_path: str) -> Lease:
+        expires_at = time.time() + self.lease_in_seconds
+        try:
+            file_descriptor = os.open(
+                lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(file_descriptor, "w") as lease_file:
+            json.dump({"owner": WORKER_ID, "claimed_at": time.time(),
+                       "expires_at": expires_at}, lease_file)
+        return Lease(self, lease_path, expires_at)
+
+    def _break_expired_lease(self, lease_path: str) -> bool:
+        """Remove the lease if expired, True if the caller may try to claim again"""
+        content = self.read_lease(lease_path)
+        if content is None:
+            # released in the meantime (or just being created)
+            return os.path.exists(lease_path) is False
+        if content["expires_at"] > time.time():
+            return False
+
+        # only one worker can move the expired lease away
+        stale_lease_path = f"{lease_path}.{WORKER_ID}.stale"
+        try:
+            os.rename(lease_path, stale_lease_path)
+        except FileNotFoundError:
+            return True
+
+        # another worker may have replaced the expired lease right before the rename
+        stale_content = self.read_lease(stale_lease_path)
+        if stale_content is not None and stale_content["expires_at"] > time.time():
+            with contextlib.suppress(FileExistsError):
+                os.link(stale_lease_path, lease_path)
+            os.remove(stale_lease_path)
+            return False
+
+        print(f"break expired lease of {content['owner']}: {lease_path}")
+        os.remove(stale_lease_path)
+        return True
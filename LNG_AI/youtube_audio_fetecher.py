@@ -1,4 +1,5 @@
 """ Fetcher to grab audio files based on latest videos of the given Youtube channel"""
+import contextlib
 import logging
 import os
 import requests
@@ -7,14 +8,49 @@ from pydub import AudioSegment
 import pytube
 
 from LNG_AI import constants
+from LNG_AI import mp3_frame_chunker
+from LNG_AI import rate_limiter
+from LNG_AI import utils
+from LNG_AI import work_lease
 
 
 class YoutubeAudioFetcher():
     """Fetcher to grab audio files based on latest videos of the given Youtube channel"""
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, query_timeout_in_seconds: float = 5,
+                 transcribe_export_profile: constants.AudioExportProfile = constants.AudioExportProfile.SPEECH,
+                 transcribe_chuck_keyword: constants.AudioFileKeyword = constants.AudioFileKeyword.FIVE_MINUTES_CHUCK,
+                 fingerprint_index=None, lease_manager=None):
+        """
+        Args:
+            transcribe_export_profile: mp3 profile of the preview & chucks sent to Whisper
+            transcribe_chuck_keyword: chuck granularity sent to Whisper, longer chucks
+                are allowed as long as they fit the Whisper API file size limit (1-hour
+                chucks are frame-copied from full.mp3 in the archival profile, so they never fit)
+            fingerprint_index: audio_fingerprinter.AudioFingerprintIndex, if given, 5-minutes
+                chucks overlapping indexed audio are marked as duplicates
+            lease_manager: work_lease.LeaseManager, if given, videos are claimed before
+                being downloaded & segmented, so several workers can share the storage root
+        """
         self.base_url = "https://www.googleapis.com/youtube/v3"
         self.api_key = api_key
+        self.query_timeout_in_seconds = query_timeout_in_seconds
+
+        self.transcribe_export_profile = transcribe_export_profile
+        self.transcribe_chuck_keyword = transcribe_chuck_keyword
+
+        # Check the chuck fits Whisper API with the profile it is actually written in
+        chuck_export_profile = self._get_chuck_export_profile(
+            transcribe_chuck_keyword)
+        bitrate_in_kbps = constants.AUDIO_EXPORT_PROFILE_PARAMETERS[
+            chuck_export_profile]["bitrate_in_kbps"]
+        chuck_in_seconds = constants.CHUCK_KEYWORD_TO_MINUTES[transcribe_chuck_keyword] * 60
+        estimated_chuck_size_in_bytes = chuck_in_seconds * bitrate_in_kbps * 1000 / 8
+        if estimated_chuck_size_in_bytes > constants.WHISPER_API_FILE_SIZE_LIMIT_IN_BYTES:
+            raise ValueError(f"{transcribe_chuck_keyword} exceeds Whisper API file size limit "
+                             f"with {chuck_export_profile} profile")
+        self.fingerprint_index = fingerprint_index
+        self.lease_manager = lease_manager
 
         os.makedirs(
             constants.RootDirectory.RAW_3GG_FILE_ROOT.value, exist_ok=True)
@@ -50,6 +86,10 @@ class YoutubeAudioFetcher():
         video_ids = self._parse_playlistitems_api_response(resp_json)
         return video_ids
 
+    def obtain_audio_info(self, video_id: str):
+        """Fetches the audio information of a video & (re)creates its missing audio files"""
+        return self._get_audio(video_id)
+
     def _get_audio(self, video_id: str):
         query_url = self.__construct_videos_api_query_url(video_id)
         resp_json = self._send_query(query_url)
@@ -77,7 +117,31 @@ class YoutubeAudioFetcher():
         return query_url
 
     def _send_query(self, query_url: str):
-        resp = requests.get(query_url, timeout=5)
+        try:
+            return rate_limiter.get_scheduler().call(
+                constants.RequestService.YOUTUBE_DATA_API, self._send_query_once, query_url)
+        except rate_limiter.RetryableRequestError as err:
+            logging.error(f"query failed after retries: {err}")
+            return None
+
+    def _send_query_once(self, query_url: str):
+        try:
+            resp = requests.get(
+                query_url, timeout=self.query_timeout_in_seconds)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+            raise rate_limiter.RetryableRequestError(str(err)) from err
+
+        # Reference: https://developers.google.com/youtube/v3/docs/errors
+        if resp.status_code == requests.codes['too_many_requests'] or (
+                resp.status_code == requests.codes['forbidden'] and "rateLimitExceeded" in resp.text):
+            retry_after = resp.headers.get("Retry-After")
+            raise rate_limiter.RateLimitedError(
+                f"rate limited ({resp.status_code})",
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if resp.status_code >= 500:
+            raise rate_limiter.RetryableRequestError(
+                f"server error ({resp.status_code})")
+
         return resp.json(
         ) if resp.status_code == requests.codes['ok'] else None
 
@@ -101,14 +165,21 @@ class YoutubeAudioFetcher():
         audio_file_dir = f"{audio_file_root}/{item['id']}"
         raw_3gg_file_path = f"{raw_3gg_file_root}/{item['id']}.3gg"
 
-        if self._download_audio_file(youtube_video_url, raw_3gg_file_path):
-            print(f"Successfully downloaded {item['snippet']['title']}")
-            # transfer video to audio & cut audio as well
-            self._transfer_raw_to_audio_file(raw_3gg_file_path, audio_file_dir)
-        else:
+        lease = self._try_claim_video(item['id'])
+        if lease is None:
             print(
-                f"Something wrong while downloading {item['snippet']['title']}")
-            audio_file_dir = ''
+                f"{item['snippet']['title']} is claimed by another worker, skip it")
+        else:
+            with lease:
+                if self._download_audio_file(youtube_video_url, raw_3gg_file_path):
+                    print(f"Successfully downloaded {item['snippet']['title']}")
+                    # transfer video to audio & cut audio as well
+                    self._transfer_raw_to_audio_file(
+                        raw_3gg_file_path, audio_file_dir)
+                else:
+                    print(
+                        f"Something wrong while downloading {item['snippet']['title']}")
+                    audio_file_dir = ''
 
         audio_info = {
             'id': item['id'],
@@ -119,6 +190,11 @@ class YoutubeAudioFetcher():
         }
         return audio_info
 
+    def _try_claim_video(self, video_id: str):
+        if self.lease_manager is None:
+            return contextlib.nullcontext()
+        return self.lease_manager.try_claim(constants.LeaseKind.VIDEO, video_id)
+
     def _download_audio_file(self, youtube_video_url: str,
                              raw_3gg_file_path: str) -> bool:
         if os.path.isfile(raw_3gg_file_path):
@@ -128,10 +204,10 @@ class YoutubeAudioFetcher():
         # Only download if not exist
         try:
             # known issue: https://github.com/pytube/pytube/issues/1498
-            items = raw_3gg_file_path.split('/')
-            file_dir, file_name = items[0], items[1]
-            _ = pytube.YouTube(youtube_video_url).streams.first().download(
-                output_path=file_dir, filename=file_name)
+            with work_lease.atomic_output_path(raw_3gg_file_path) as tmp_file_path:
+                file_dir, file_name = os.path.split(tmp_file_path)
+                _ = pytube.YouTube(youtube_video_url).streams.first().download(
+                    output_path=file_dir, filename=file_name)
         # lazy to specify exception type(s) for now
         # catch all potential errors
         except BaseException:
@@ -148,55 +224,87 @@ class YoutubeAudioFetcher():
         audio = AudioSegment.from_file(raw_3gg_file_path)
         self._export_if_not_exist(audio, f"{audio_file_dir}/full.mp3")
 
+        # Resample/downmix once, then every chuck sent to Whisper is sliced from it
+        speech_audio = utils.AudioUtils.apply_export_profile(
+            audio, self.transcribe_export_profile)
+
         # 1-minute preview
         print("processing 1-minute preview audio")
-        one_minute_preview_audio = audio[:constants.ONE_MINUTE_IN_MILLISECONDS]
+        one_minute_preview_audio = speech_audio[:constants.ONE_MINUTE_IN_MILLISECONDS]
         self._export_if_not_exist(
-            one_minute_preview_audio, f"{audio_file_dir}/one_minute_preview.mp3")
-
-        # TODO: below two code snippets (1-hour and 5-miutes are highly similar)
-        # https://github.com/tkuo-tkuo/LNG_AI/issues/7
+            one_minute_preview_audio, f"{audio_file_dir}/one_minute_preview.mp3",
+            self.transcribe_export_profile)
 
-        # 1-hour audio chucks
+        # 1-hour audio chucks, archival profile as full.mp3, so frames are copied without re-encoding
         print("processing audio chucks by hours")
-        total_length_in_milliseconds = len(audio)
-        one_hour_in_milliseconds = 60 * constants.ONE_MINUTE_IN_MILLISECONDS
-        i = 0
-        # next hour still not yet finish
-        while (i + 1) * one_hour_in_milliseconds < total_length_in_milliseconds:
-            begin = i * one_hour_in_milliseconds
-            end = (i + 1) * one_hour_in_milliseconds
-            one_hour_chuck_audio = audio[begin:end]
-            self._export_if_not_exist(
-                one_hour_chuck_audio, f"{audio_file_dir}/{i+1}_hour_chuck.mp3")
-            i += 1
-
-        last_hour_check_audio = audio[i * one_hour_in_milliseconds:]
-        self._export_if_not_exist(
-            last_hour_check_audio, f"{audio_file_dir}/{i+1}_hour_chuck.mp3")
+        with mp3_frame_chunker.Mp3FrameChunker(f"{audio_file_dir}/full.mp3") as chunker:
+            chunker.export_chucks(audio_file_dir,
+                                  60 * constants.ONE_MINUTE_IN_MILLISECONDS, constants.AudioFileKeyword.HOUR_CHUCK.value)
 
         # 5-minutes audio chucks
         print("processing audio chucks per 5 minutes ")
+        self._export_chucks(speech_audio, audio_file_dir,
+                            constants.AudioFileKeyword.FIVE_MINUTES_CHUCK, self.transcribe_export_profile)
+
+        # mark 5-minutes chucks overlapping earlier episodes (re-streams, highlights...)
+        if self.fingerprint_index is not None:
+            self._index_fingerprints(speech_audio, audio_file_dir)
+
+        # longer chucks for transcribing (if configured, 1-hour chucks are rejected by __init__)
+        if self.transcribe_chuck_keyword != constants.AudioFileKeyword.FIVE_MINUTES_CHUCK:
+            print(
+                f"processing audio chucks for transcribing ({self.transcribe_chuck_keyword.value})")
+            self._export_chucks(speech_audio, audio_file_dir,
+                                self.transcribe_chuck_keyword, self.transcribe_export_profile)
+
+    def _index_fingerprints(self, speech_audio, audio_file_dir: str):
+        # the index is shared by all workers, only one of them updates it at a time
+        lease = contextlib.nullcontext() if self.lease_manager is None else \
+            self.lease_manager.claim(constants.LeaseKind.FINGERPRINT_INDEX, "index")
+        with lease:
+            if self.lease_manager is not None:
+                self.fingerprint_index.reload()
+            if self.fingerprint_index.is_indexed(audio_file_dir):
+                return
+
+            print("processing audio fingerprints")
+            duplicate_chucks = self.fingerprint_index.index_episode(
+                speech_audio, audio_file_dir, constants.AudioFileKeyword.FIVE_MINUTES_CHUCK)
+            self.fingerprint_index.save()
+        utils.FileUtils.store_duplicate_chucks(
+            audio_file_dir, duplicate_chucks)
+        print(f"{len(duplicate_chucks)} duplicate chucks found")
+
+    def _get_chuck_export_profile(
+            self, chuck_keyword: constants.AudioFileKeyword) -> constants.AudioExportProfile:
+        # 1-hour chucks share their names with the archival frame-copied chucks
+        if chuck_keyword == constants.AudioFileKeyword.HOUR_CHUCK:
+            return constants.AudioExportProfile.ARCHIVAL
+        return self.transcribe_export_profile
+
+    def _export_chucks(self, audio, audio_file_dir: str,
+                       chuck_keyword: constants.AudioFileKeyword,
+                       export_profile: constants.AudioExportProfile):
         total_length_in_milliseconds = len(audio)
-        five_minutes_in_milliseconds = 5 * constants.ONE_MINUTE_IN_MILLISECONDS
+        chuck_in_milliseconds = constants.CHUCK_KEYWORD_TO_MINUTES[chuck_keyword] * \
+            constants.ONE_MINUTE_IN_MILLISECONDS
         i = 0
-        # next hour still not yet finish
-        while (i + 1) * five_minutes_in_milliseconds < total_length_in_milliseconds:
-            begin = i * five_minutes_in_milliseconds
-            end = (i + 1) * five_minutes_in_milliseconds
-            one_hour_chuck_audio = audio[begin:end]
+        # next chuck still not yet finish
+        while (i + 1) * chuck_in_milliseconds < total_length_in_milliseconds:
+            begin = i * chuck_in_milliseconds
+            end = (i + 1) * chuck_in_milliseconds
             self._export_if_not_exist(
-                one_hour_chuck_audio, f"{audio_file_dir}/{i+1}_5_mins_chuck.mp3")
+                audio[begin:end], f"{audio_file_dir}/{i+1}{chuck_keyword.value}.mp3", export_profile)
             i += 1
 
-        last_hour_check_audio = audio[i * five_minutes_in_milliseconds:]
         self._export_if_not_exist(
-            last_hour_check_audio, f"{audio_file_dir}/{i+1}_5_mins_chuck.mp3")
+            audio[i * chuck_in_milliseconds:], f"{audio_file_dir}/{i+1}{chuck_keyword.value}.mp3", export_profile)
 
-    def _export_if_not_exist(self, audio, export_path):
+    def _export_if_not_exist(self, audio, export_path,
+                             export_profile: constants.AudioExportProfile = constants.AudioExportProfile.ARCHIVAL):
         if os.path.isfile(export_path):
             print(f"{export_path} already exists, avoid exporting")
             return
 
-        print(f"exporting audio to {export_path}")
-        audio.export(export_path, format="mp3")
+        print(f"exporting audio to {export_path} ({export_profile.value})")
+        utils.AudioUtils.export_audio(audio, export_path, export_profile)
@@ -0,0 +1,48 @@
+"""Python script for fingerprinting already downloaded audio files"""
+import os
+
+from pydub import AudioSegment
+
+from LNG_AI import audio_fingerprinter
+from LNG_AI import constants
+from LNG_AI import utils
+from LNG_AI import work_lease
+
+
+def main():
+    """Index episodes oldest first, marking chucks overlapping earlier episodes"""
+    fingerprint_index = audio_fingerprinter.AudioFingerprintIndex()
+    lease_manager = work_lease.LeaseManager()
+
+    # earlier downloads are treated as the originals
+    audio_file_dirs = [audio_file_dir for audio_file_dir in utils.FileUtils.get_audio_file_directories()
+                       if os.path.isfile(f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3")]
+    audio_file_dirs.sort(key=lambda audio_file_dir: os.path.getmtime(
+        f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3"))
+
+    for audio_file_dir in audio_file_dirs:
+        if fingerprint_index.is_indexed(audio_file_dir):
+            print(f"{audio_file_dir} already indexed, skip")
+            continue
+
+        print(f"==> fingerprinting {audio_file_dir}")
+        # decoding is slow, other workers keep updating the index meanwhile
+        audio = AudioSegment.from_file(
+            f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3")
+
+        # the index is shared with fetchers, only one of them updates it at a time
+        with lease_manager.claim(constants.LeaseKind.FINGERPRINT_INDEX, "index"):
+            fingerprint_index.reload()
+            if fingerprint_index.is_indexed(audio_file_dir):
+                print(f"{audio_file_dir} indexed by another worker, skip")
+                continue
+            duplicate_chucks = fingerprint_index.index_episode(
+                audio, audio_file_dir, constants.AudioFileKeyword.FIVE_MINUTES_CHUCK)
+            fingerprint_index.save()
+        utils.FileUtils.store_duplicate_chucks(
+            audio_file_dir, duplicate_chucks)
+        print(f"{len(duplicate_chucks)} duplicate chucks found")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,11 @@
 """Python script for checking data integrity"""
-from dotenv import load_dotenv
-
-from LNG_AI import data_integrity_checker
+from LNG_AI import cli
 
 
 def main():
-    """Check data integrity"""
-    load_dotenv()
-    checker = data_integrity_checker.DataIntegrityChecker()
-    checker.check_audio_files_creation()
-    checker.check_transcripts_creation()
-    checker.check_transcripts_repetitive_word_occurance()
+    """Check data integrity & store a repair plan of failures (see repair_data.py)"""
+    # same arguments as `python -m LNG_AI check`
+    return cli.run_command("check")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+"""Python script for checking memorization of generated sentences"""
+import argparse
+import json
+import os
+
+from LNG_AI import constants
+from LNG_AI import memorization_checker
+
+
+def main():
+    """Compare generated_files histories against the transcripts or a jsonl dataset portion"""
+    # parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--generated_file_paths",
+        type=str,
+        nargs="*",
+        help="generated chat histories (default: all files in generated_files)",
+        default=None)
+    parser.add_argument(
+        "--jsonl_dataset_path",
+        type=str,
+        help="compare against a jsonl dataset portion instead of all transcripts",
+        default=None)
+    parser.add_argument(
+        "--min_match_length",
+        type=int,
+        default=memorization_checker.DEFAULT_MIN_MATCH_LENGTH)
+    args = parser.parse_args()
+
+    generated_file_root = constants.RootDirectory.GENERATED_FILE_ROOT.value
+    generated_file_paths = args.generated_file_paths
+    if not generated_file_paths:
+        generated_file_paths = [os.path.join(generated_file_root, file_name)
+                                for file_name in sorted(os.listdir(generated_file_root)) if file_name.endswith(".txt")]
+
+    if args.jsonl_dataset_path is None:
+        corpus = memorization_checker.build_transcript_corpus()
+    else:
+        corpus = memorization_checker.build_jsonl_corpus(
+            args.jsonl_dataset_path)
+    checker = memorization_checker.MemorizationChecker(corpus)
+
+    for generated_file_path in generated_file_paths:
+        sentences = memorization_checker.read_generated_sentences(
+            generated_file_path)
+        report = checker.check_sentences(sentences, args.min_match_length)
+        print(f"==> {generated_file_path}: {report['summary']}")
+
+        report_path = f"{os.path.splitext(generated_file_path)[0]}.memorization.json"
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Python script for re-chunking downloaded audio files without decoding"""
+import argparse
+import os
+
+from LNG_AI import constants
+from LNG_AI import mp3_frame_chunker
+from LNG_AI import utils
+
+
+def main():
+    """Slice full.mp3 of every episode into chucks of the given duration"""
+    # parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--chuck_seconds",
+        type=int,
+        help="chuck duration in seconds (e.g., 600 for 10-minute chucks, 30 for review clips)",
+        default=600)
+    args = parser.parse_args()
+
+    # check valid duration
+    assert args.chuck_seconds > 0
+
+    chuck_in_milliseconds = args.chuck_seconds * 1000
+    chuck_keyword = utils.FileUtils.get_chuck_keyword(chuck_in_milliseconds)
+    for audio_file_dir in utils.FileUtils.get_audio_file_directories():
+        full_audio_path = f"{audio_file_dir}/{constants.AudioFileKeyword.FULL.value}.mp3"
+        if not os.path.isfile(full_audio_path):
+            print(f"{full_audio_path} not exist, skip")
+            continue
+
+        with mp3_frame_chunker.Mp3FrameChunker(full_audio_path) as chunker:
+            chunker.export_chucks(
+                audio_file_dir, chuck_in_milliseconds, chuck_keyword)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""Python script for repairing only the failures listed by data_integrity_check.py"""
+from LNG_AI import cli
+
+
+def main():
+    """Re-fetch videos, re-export chucks & re-transcribe chucks of the repair plan"""
+    # same arguments as `python -m LNG_AI repair`
+    return cli.run_command("repair")
+
+
+if __name__ == "__main__":
+    main()
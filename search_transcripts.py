@@ -0,0 +1,45 @@
+"""Python script for searching phrases over all transcripts"""
+import argparse
+import time
+
+from LNG_AI import transcript_index
+
+
+def main():
+    """Update the transcript index incrementally, then run a phrase/proximity query"""
+    # parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phrase", type=str, help="phrase to search (e.g., 早安)", required=True)
+    parser.add_argument(
+        "--near",
+        type=str,
+        help="second phrase, hits only if it occurs within --max_distance characters",
+        default=None)
+    parser.add_argument("--max_distance", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument(
+        "--skip_update",
+        action="store_true",
+        help="query the index as is, without indexing new transcripts")
+    args = parser.parse_args()
+
+    index = transcript_index.TranscriptIndex()
+    if not args.skip_update:
+        num_of_indexed_docs = index.update()
+        print(f"{num_of_indexed_docs} new/modified transcripts indexed")
+
+    start_time = time.perf_counter()
+    if args.near is None:
+        hits = index.search_phrase(args.phrase, limit=args.limit)
+    else:
+        hits = index.search_proximity(
+            args.phrase, args.near, args.max_distance, limit=args.limit)
+    elapsed_in_milliseconds = 1000 * (time.perf_counter() - start_time)
+
+    for hit in hits:
+        print(hit)
+    print(f"{len(hits)} hits in {elapsed_in_milliseconds:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
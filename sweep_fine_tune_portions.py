@@ -0,0 +1,15 @@
+"""Python script for fine-tuning & evaluating one model per jsonl dataset portion"""
+from LNG_AI import cli
+
+
+def main():
+    """Upload portions, launch fine-tunes, poll them & evaluate finished models in one run
+
+    An interrupted sweep resumes from its state file when run again with the same portions.
+    """
+    # same arguments as `python -m LNG_AI sweep`
+    return cli.run_command("sweep")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import sys
+import types
+
+import pytest
+
+import LNG_AI
+from LNG_AI import constants
+from LNG_AI import rate_limiter
+
+# modules binding openai / requests at import time, re-imported against the stubs
+OPENAI_CLIENT_MODULES = ["LNG_AI.fine_tune_status",
+                         "LNG_AI.fine_tune_sweep", "LNG_AI.training_file_uploader"]
+
+
+def _build_openai_stub() -> types.ModuleType:
+    """openai==0.27 surface used by LNG_AI, every resource method is set by the test"""
+    openai = types.ModuleType("openai")
+    openai.api_key = "sk-test"
+    openai.api_base = "https://api.openai.test/v1"
+
+    error = types.ModuleType("openai.error")
+
+    class OpenAIError(Exception):
+        def __init__(self, message=None, http_status=None):
+            super().__init__(message)
+            self.http_status = http_status
+
+    error.OpenAIError = OpenAIError
+    for name in ["APIError", "Timeout", "TryAgain", "APIConnectionError", "InvalidRequestError",
+                 "RateLimitError", "ServiceUnavailableError"]:
+        setattr(error, name, type(name, (OpenAIError,), {}))
+    openai.error = error
+
+    for resource in ["FineTune", "File", "Completion"]:
+        setattr(openai, resource, type(resource, (), {}))
+    return openai
+
+
+def _build_requests_stub() -> types.ModuleType:
+    requests = types.ModuleType("requests")
+    requests.exceptions = types.SimpleNamespace(
+        Timeout=type("Timeout", (Exception,), {}),
+        ConnectionError=type("ConnectionError", (Exception,), {}))
+    requests.codes = {"too_many_requests": 429}
+    return requests
+
+
+@pytest.fixture
+def openai_stub(monkeypatch):
+    """Stub openai & requests modules, requests go through an unthrottled scheduler"""
+    openai = _build_openai_stub()
+    monkeypatch.setitem(sys.modules, "openai", openai)
+    monkeypatch.setitem(sys.modules, "openai.error", openai.error)
+    monkeypatch.setitem(sys.modules, "requests", _build_requests_stub())
+    for module_name in OPENAI_CLIENT_MODULES:
+        monkeypatch.delitem(sys.modules, module_name, raising=False)
+        monkeypatch.delattr(LNG_AI, module_name.split(".")[-1], raising=False)
+
+    quota = {"rate_per_second": 1000.0, "burst": 1000,
+             "max_concurrency": 8, "target_latency_in_seconds": 10.0}
+    monkeypatch.setattr(rate_limiter, "_SCHEDULER", rate_limiter.RequestScheduler(
+        {service: quota for service in constants.RequestService}))
+    return openai
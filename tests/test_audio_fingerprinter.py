@@ -0,0 +1,101 @@
+import numpy as np
+
+from LNG_AI import audio_fingerprinter
+from LNG_AI import constants
+
+SAMPLE_RATE = audio_fingerprinter.FINGERPRINT_SAMPLE_RATE
+
+
+def _random_audio(seconds: float, seed: int) -> np.ndarray:
+    """Tone bursts at random frequencies, peaky like speech/music"""
+    rng = np.random.default_rng(seed)
+    samples = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    time = np.arange(int(0.2 * SAMPLE_RATE)) / SAMPLE_RATE
+    for begin in range(0, len(samples) - len(time), len(time) // 2):
+        for frequency in rng.uniform(100, 3900, size=3):
+            samples[begin:begin + len(time)] += np.sin(
+                2 * np.pi * frequency * time).astype(np.float32) * rng.uniform(0.1, 1)
+    return samples + rng.normal(0, 0.01, len(samples)).astype(np.float32)
+
+
+def _index_with(index, samples: np.ndarray, audio_file_dir: str, chuck_name: str):
+    hashes, anchor_frames = audio_fingerprinter.compute_fingerprint(samples)
+    index.chucks.append(
+        {"audio_file_dir": audio_file_dir, "chuck_name": chuck_name})
+    index._add(hashes, np.full(len(hashes), len(index.chucks) - 1, dtype=np.int32),
+               anchor_frames)
+
+
+def _find_overlap(index, samples: np.ndarray):
+    return index.find_overlap(*audio_fingerprinter.compute_fingerprint(samples))
+
+
+def test_copy_is_found_with_its_offset(tmp_path):
+    index = audio_fingerprinter.AudioFingerprintIndex(str(tmp_path))
+    original = _random_audio(300, seed=0)
+    _index_with(index, original, "audio_files/a", "1_5_mins_chuck")
+    _index_with(index, _random_audio(300, seed=1),
+                "audio_files/b", "1_5_mins_chuck")
+
+    # cut off the hop grid & slightly noisy, like a re-upload of the same stream
+    begin = 60 * SAMPLE_RATE + 123
+    copy = original[begin:] + np.random.default_rng(2).normal(
+        0, 0.01, len(original) - begin).astype(np.float32)
+    matched = _find_overlap(index, copy)
+    assert matched["audio_file_dir"] == "audio_files/a"
+    assert abs(matched["offset_in_seconds"] - 60) < 0.1
+    assert matched["aligned_duration_in_seconds"] > 200
+
+
+def test_unrelated_audio_is_not_a_duplicate(tmp_path):
+    index = audio_fingerprinter.AudioFingerprintIndex(str(tmp_path))
+    _index_with(index, _random_audio(300, seed=0),
+                "audio_files/a", "1_5_mins_chuck")
+    assert _find_overlap(index, _random_audio(300, seed=3)) is None
+
+
+def test_shared_intro_does_not_mark_a_chuck(tmp_path):
+    index = audio_fingerprinter.AudioFingerprintIndex(str(tmp_path))
+    jingle = _random_audio(30, seed=4)
+    _index_with(index, np.concatenate([jingle, _random_audio(270, seed=0)]),
+                "audio_files/a", "1_5_mins_chuck")
+    assert _find_overlap(index, np.concatenate(
+        [jingle, _random_audio(270, seed=5)])) is None
+
+
+def test_add_keeps_hashes_sorted(tmp_path):
+    index = audio_fingerprinter.AudioFingerprintIndex(str(tmp_path))
+    rng = np.random.default_rng(0)
+    added = []
+    for chuck_id in range(5):
+        hashes = rng.integers(0, 1000, 200).astype(np.uint32)
+        index._add(hashes, np.full(200, chuck_id, dtype=np.int32),
+                   np.arange(200, dtype=np.int32))
+        added.extend(zip(hashes.tolist(), [chuck_id] * 200, range(200)))
+    assert list(zip(index.hashes.tolist(), index.chuck_ids.tolist(),
+                    index.anchor_frames.tolist())) == sorted(added)
+
+
+def test_save_and_reload(tmp_path):
+    index = audio_fingerprinter.AudioFingerprintIndex(str(tmp_path))
+    _index_with(index, _random_audio(20, seed=0),
+                "audio_files/a", "1_5_mins_chuck")
+    index.save()
+
+    reloaded = audio_fingerprinter.AudioFingerprintIndex(str(tmp_path))
+    assert reloaded.is_indexed("audio_files/a")
+    assert not reloaded.is_indexed("audio_files/b")
+    np.testing.assert_array_equal(reloaded.hashes, index.hashes)
+    np.testing.assert_array_equal(reloaded.chuck_ids, index.chuck_ids)
+
+
+def test_half_hour_chuck_is_duplicate_when_all_its_chucks_are():
+    info = {"audio_file_dir": "audio_files/a", "chuck_name": "1_5_mins_chuck"}
+    # 13 five minutes chucks: 3 half hour & 2 hour chucks, the last ones cover 1 chuck
+    duplicates = {f"{idx}_5_mins_chuck": info for idx in [1, 2, 3, 4, 5, 6, 8, 13]}
+    covering = audio_fingerprinter.get_covering_duplicate_chucks(
+        duplicates, constants.AudioFileKeyword.FIVE_MINUTES_CHUCK, 13)
+    assert sorted(covering) == [
+        "1_30_mins_chuck", "2_hour_chuck", "3_30_mins_chuck"]
+    assert covering["3_30_mins_chuck"]["covered_chucks"] == ["13_5_mins_chuck"]
+    assert covering["1_30_mins_chuck"]["audio_file_dir"] == "audio_files/a"
@@ -0,0 +1,52 @@
+from LNG_AI import audio_packing
+from LNG_AI import constants
+
+MINUTE = constants.ONE_MINUTE_IN_MILLISECONDS
+
+
+def test_segments_go_to_the_file_containing_their_midpoint():
+    segments = [{"start": 0.0, "end": 4.0, "text": " 早晨"},
+                {"start": 4.0, "end": 9.5, "text": " 你好"},
+                {"start": 10.2, "end": 14.0, "text": " 再見"}]
+    assert audio_packing.split_packed_segments(
+        segments, [0, 10000]) == ["早晨 你好", "再見"]
+
+
+def test_file_without_segments_falls_back():
+    # regression: such files used to get an empty transcript, which broke the dataset
+    segments = [{"start": 0.0, "end": 4.0, "text": " 早晨"},
+                {"start": 21.0, "end": 24.0, "text": " "}]
+    assert audio_packing.split_packed_segments(
+        segments, [0, 10000, 20000]) == ["早晨", None, None]
+
+
+def test_packs_fit_one_whisper_request():
+    max_pack_in_milliseconds = audio_packing.get_max_pack_in_milliseconds(
+        constants.AudioExportProfile.SPEECH)
+    bitrate_in_kbps = constants.AUDIO_EXPORT_PROFILE_PARAMETERS[
+        constants.AudioExportProfile.SPEECH]["bitrate_in_kbps"]
+    # previews, final chucks of any length & 5-minutes chucks (too long to be packed)
+    audio_lengths = [(f"{idx}.mp3", [MINUTE, 2 * MINUTE, 1500, 5 * MINUTE][idx % 4])
+                     for idx in range(400)]
+
+    packs = audio_packing.group_into_packs(audio_lengths, max_pack_in_milliseconds)
+    lengths = dict(audio_lengths)
+    assert len(packs) > 1
+    for pack in packs:
+        pack_in_milliseconds = sum(lengths[audio_path] for audio_path in pack) + \
+            (len(pack) - 1) * audio_packing.PACK_SILENCE_GAP_IN_MILLISECONDS
+        assert pack_in_milliseconds <= max_pack_in_milliseconds
+        assert pack_in_milliseconds * bitrate_in_kbps / 8 < constants.WHISPER_API_FILE_SIZE_LIMIT_IN_BYTES
+    # every short file is packed once, in the given order
+    assert [audio_path for pack in packs for audio_path in pack] == [
+        audio_path for audio_path, length in audio_lengths
+        if length <= audio_packing.PACKABLE_AUDIO_MAX_IN_MILLISECONDS]
+
+
+def test_pack_is_closed_exactly_at_the_limit():
+    gap = audio_packing.PACK_SILENCE_GAP_IN_MILLISECONDS
+    audio_lengths = [("a.mp3", 1000), ("b.mp3", 1000), ("c.mp3", 1000)]
+    assert audio_packing.group_into_packs(audio_lengths, 2000 + gap) == [
+        ["a.mp3", "b.mp3"], ["c.mp3"]]
+    assert audio_packing.group_into_packs(audio_lengths, 2000 + gap - 1) == [
+        ["a.mp3"], ["b.mp3"], ["c.mp3"]]
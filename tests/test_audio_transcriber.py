@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pydub")
+
+from LNG_AI import audio_packing  # noqa: E402
+from LNG_AI import audio_transcriber  # noqa: E402
+from LNG_AI import constants  # noqa: E402
+from LNG_AI import utils  # noqa: E402
+
+
+def test_only_short_files_without_transcript_are_packed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("episode/whisper")
+    with open("episode/whisper/1_5_mins_chuck.txt", "w") as transcript_file:
+        transcript_file.write("早晨")
+    lengths = {"episode/one_minute_preview.mp3": constants.ONE_MINUTE_IN_MILLISECONDS,
+               "episode/1_5_mins_chuck.mp3": 1000,
+               "episode/2_5_mins_chuck.mp3": 5 * constants.ONE_MINUTE_IN_MILLISECONDS,
+               "episode/3_5_mins_chuck.mp3": 1000}
+    monkeypatch.setattr(utils.AudioUtils, "get_audio_length_in_milliseconds",
+                        staticmethod(lambda audio_path: lengths[audio_path]))
+    monkeypatch.setattr(audio_packing, "get_max_pack_in_milliseconds",
+                        lambda export_profile: constants.ONE_MINUTE_IN_MILLISECONDS + 1000)
+
+    transcriber = audio_transcriber.AudioTranscriber(
+        constants.TranscribeMode.WHISPER, {"openai_api_key": "sk-test"})
+    assert transcriber._pack_short_audios(list(lengths)) == [
+        ["episode/one_minute_preview.mp3"], ["episode/3_5_mins_chuck.mp3"]]
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from LNG_AI import cli
+from LNG_AI import constants
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# fails the run as soon as one of the heavy dependencies is imported
+IMPORT_GUARD = """
+import sys
+
+HEAVY_MODULES = ("openai", "pydub", "pytube")
+
+
+class ImportGuard():
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in HEAVY_MODULES:
+            raise ImportError(f"{name} imported")
+        return None
+
+
+sys.meta_path.insert(0, ImportGuard())
+from LNG_AI import cli
+sys.exit(cli.main(sys.argv[1:]))
+"""
+
+
+def _run_guarded(argv: list, cwd: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-c", IMPORT_GUARD] + argv, cwd=cwd,
+                          env=dict(os.environ, PYTHONPATH=REPO_ROOT),
+                          capture_output=True, text=True, check=False)
+
+
+@pytest.mark.parametrize("argv", [
+    ["--help"],
+    ["check", "--help"],
+    ["check"],
+    ["dataset", "--portions", "0.5", "1"],
+])
+def test_light_sub_commands_do_not_import_heavy_dependencies(argv, tmp_path):
+    os.makedirs(tmp_path / constants.RootDirectory.AUDIO_FILE_ROOT.value)
+    completed = _run_guarded(argv, str(tmp_path))
+    assert completed.returncode == 0, completed.stderr
+
+
+def test_sub_command_and_script_parsers_agree():
+    for command in cli.COMMANDS:
+        sub_command_parser = cli.build_parser()._subparsers._group_actions[0].choices[command]
+        command_parser = cli.build_command_parser(command)
+        assert {action.dest for action in sub_command_parser._actions} | {
+            "profile_imports", "storage_root"} == {action.dest for action in command_parser._actions}
+
+
+def test_parse_sweep_arguments():
+    args = cli.build_parser().parse_args(
+        ["--storage_root", "/mnt/lng", "sweep", "--portions", "0.1", "1", "--base_model", "curie"])
+    assert args.func is cli.sweep
+    assert args.storage_root == "/mnt/lng"
+    assert args.portions == [0.1, 1.0]
+    assert args.base_model == "curie"
+    assert args.num_of_sentences_generated is None
+
+
+def test_parse_fetch_defaults():
+    args = cli.build_command_parser("fetch").parse_args([])
+    assert args.channel_ids == [constants.LNG_CHANNEL_ID]
+    assert args.storage_root == "."
+
+
+def test_parse_chuck_keywords():
+    args = cli.build_command_parser("fetch").parse_args(
+        ["--transcribe_chuck_keyword", "HALF_HOUR_CHUCK"])
+    assert args.transcribe_chuck_keyword == "HALF_HOUR_CHUCK"
+    # 1-hour chucks are archival, too large for Whisper API
+    with pytest.raises(SystemExit):
+        cli.build_command_parser("fetch").parse_args(
+            ["--transcribe_chuck_keyword", "HOUR_CHUCK"])
+
+    args = cli.build_parser().parse_args(["dataset", "--chuck_keyword", "HALF_HOUR_CHUCK"])
+    assert args.chuck_keyword == constants.AudioFileKeyword.HALF_HOUR_CHUCK
+    args = cli.build_parser().parse_args(["transcribe", "--chuck_keyword", "_10_mins_chuck"])
+    assert args.chuck_keyword == "_10_mins_chuck"
+    args = cli.build_parser().parse_args(["transcribe"])
+    assert args.chuck_keyword == constants.AudioFileKeyword.FIVE_MINUTES_CHUCK
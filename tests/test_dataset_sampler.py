@@ -0,0 +1,90 @@
+import math
+import os
+
+import pytest
+
+from LNG_AI import dataset_sampler
+from LNG_AI import utils
+
+
+def _sample(portions, seed=0, stratified=False, num_of_strata=20, num_of_items_per_stratum=500):
+    sampler = dataset_sampler.PortionSampler(
+        portions, seed=seed, stratified=stratified)
+    for stratum in range(num_of_strata):
+        for idx in range(num_of_items_per_stratum):
+            sampler.add((stratum, idx), stratum)
+    return sampler
+
+
+@pytest.mark.parametrize("stratified", [False, True])
+def test_same_seed_same_portions(stratified):
+    portions = [0.01, 0.1, 0.5]
+    sampler_a = _sample(portions, seed=7, stratified=stratified)
+    sampler_b = _sample(portions, seed=7, stratified=stratified)
+    for portion in portions:
+        assert sampler_a.get_portion(portion) == sampler_b.get_portion(portion)
+    assert _sample(portions, seed=8, stratified=stratified).get_portion(
+        0.1) != sampler_a.get_portion(0.1)
+
+
+def test_uniform_portions_have_exact_sizes():
+    portions = [0.005, 0.01, 0.1, 0.5]
+    sampler = _sample(portions)
+    for portion in portions:
+        selected = sampler.get_portion(portion)
+        assert len(selected) == math.ceil(10000 * portion)
+        assert len(set(selected)) == len(selected)
+
+
+@pytest.mark.parametrize("stratified", [False, True])
+def test_portions_are_nested(stratified):
+    portions = [0.01, 0.1, 0.5]
+    sampler = _sample(portions, stratified=stratified)
+    previous = set()
+    for portion in portions:
+        selected = set(sampler.get_portion(portion))
+        assert previous <= selected
+        previous = selected
+
+
+def test_stratified_portion_takes_share_of_every_stratum():
+    sampler = _sample([0.1], stratified=True)
+    selected = sampler.get_portion(0.1)
+    for stratum in range(20):
+        assert sum(1 for item in selected if item[0] == stratum) == 50
+
+
+def test_only_largest_portion_is_retained():
+    sampler = _sample([0.01], num_of_strata=1, num_of_items_per_stratum=100000)
+    assert len(sampler._retained) < 0.02 * 100000
+
+
+def test_full_portion_is_streamed(tmp_path, monkeypatch):
+    def iter_transcript_jsonls(*_):
+        for episode in range(10):
+            for idx in range(100):
+                yield (f"audio/{episode}", {"prompt": f"{episode}-{idx}", "completion": "."})
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils.JsonlUtils, "iter_transcript_jsonls",
+                        staticmethod(iter_transcript_jsonls))
+    utils.JsonlUtils.create_jsonl_database(
+        0.1, debug=False, portions=[0.1, 0.5, 1])
+
+    assert sorted(os.listdir("jsonl_dataset")) == [
+        "jsonl_dataset_100_percent_1000.jsonl",
+        "jsonl_dataset_10_percent_100.jsonl",
+        "jsonl_dataset_50_percent_500.jsonl"]
+    full_portion = list(utils.JsonlUtils.iter_jsonls(
+        "jsonl_dataset/jsonl_dataset_100_percent_1000.jsonl"))
+    assert full_portion == [jsonl for _, jsonl in iter_transcript_jsonls()]
+
+
+def test_episodes_are_listed_in_a_fixed_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for audio_id in ["b", "c", "a"]:
+        os.makedirs(f"audio_files/{audio_id}")
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: list(reversed(sorted(listdir(path)))))
+    assert utils.FileUtils.get_audio_file_directories() == [
+        "audio_files/a", "audio_files/b", "audio_files/c"]
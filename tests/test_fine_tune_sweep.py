@@ -0,0 +1,188 @@
+import importlib
+import json
+import os
+
+import pytest
+
+from LNG_AI import constants
+from LNG_AI import utils
+
+
+class FakeFineTuneApi():
+    """In-memory fine-tune jobs, every listing moves visible jobs one status further"""
+
+    STATUSES = ["pending", "running", "succeeded"]
+
+    def __init__(self, num_of_listings_until_visible: int = 0):
+        self.num_of_listings_until_visible = num_of_listings_until_visible
+        self.jobs = {}
+        self.list_cnt = 0
+        self.list_events_calls = []
+
+    def add_job(self, job_id: str, status: str = "pending"):
+        self.jobs[job_id] = {"id": job_id, "status": status, "fine_tuned_model": None,
+                             "training_files": [{"bytes": 100}], "events": [],
+                             "num_of_listings_until_visible": self.num_of_listings_until_visible}
+        self.add_event(job_id, f"created {job_id}")
+        return self.jobs[job_id]
+
+    def add_event(self, job_id: str, message: str, created_at: int = None):
+        events = self.jobs[job_id]["events"]
+        if created_at is None:
+            created_at = events[-1]["created_at"] + 1 if events else 1
+        events.append({"created_at": created_at, "message": message})
+
+    def create(self, training_file: str, model: str):
+        job = self.add_job(f"ft-{len(self.jobs)}")
+        job["training_file"] = training_file
+        return {"id": job["id"], "status": job["status"]}
+
+    def list(self):
+        self.list_cnt += 1
+        listed_jobs = []
+        for job in self.jobs.values():
+            if job["num_of_listings_until_visible"] > 0:
+                job["num_of_listings_until_visible"] -= 1
+                continue
+            status_idx = self.STATUSES.index(job["status"])
+            if status_idx + 1 < len(self.STATUSES):
+                job["status"] = self.STATUSES[status_idx + 1]
+                self.add_event(job["id"], f"{job['status']} {job['id']}")
+            if job["status"] == "succeeded":
+                job["fine_tuned_model"] = f"babbage:{job['id']}"
+            listed_jobs.append({key: job[key] for key in [
+                "id", "status", "fine_tuned_model", "training_files"]})
+        return {"data": listed_jobs}
+
+    def list_events(self, id, after=None):
+        self.list_events_calls.append((id, after))
+        return {"data": [event for event in self.jobs[id]["events"]
+                         if after is None or event["created_at"] >= after]}
+
+
+@pytest.fixture
+def fine_tune_api(openai_stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = FakeFineTuneApi()
+    openai_stub.FineTune.create = api.create
+    openai_stub.FineTune.list = api.list
+    openai_stub.FineTune.list_events = api.list_events
+    return api
+
+
+def _write_portion(percent: int, num_of_windows: int) -> str:
+    os.makedirs(constants.RootDirectory.JSONL_DATASET_ROOT.value, exist_ok=True)
+    path = os.path.join(constants.RootDirectory.JSONL_DATASET_ROOT.value,
+                        f"jsonl_dataset_{percent}_percent_{num_of_windows}.jsonl")
+    with open(path, "w", encoding="utf-8") as jsonl_file:
+        for idx in range(num_of_windows):
+            jsonl_file.write(json.dumps({"prompt": constants.SEPARRATOR.join(["早安", "開了", f"第{idx}句"]),
+                                         "completion": "欸"}, ensure_ascii=False) + "\n")
+    return path
+
+
+def test_status_cache_lists_jobs_once_per_max_age(fine_tune_api):
+    fine_tune_status = importlib.import_module("LNG_AI.fine_tune_status")
+    fine_tune_api.add_job("ft-a")
+    status_cache = fine_tune_status.FineTuneStatusCache()
+
+    status_cache.refresh()
+    status_cache.refresh()
+    assert fine_tune_api.list_cnt == 1
+    assert status_cache.get_job("ft-a")["status"] == "running"
+
+    # an unknown job is looked up once, even if the cache is fresh
+    fine_tune_api.add_job("ft-b")
+    assert status_cache.get_job("ft-b")["status"] == "running"
+    assert fine_tune_api.list_cnt == 2
+    # the cache is shared with later processes
+    assert set(fine_tune_status.FineTuneStatusCache().get_jobs()) == {"ft-a", "ft-b"}
+
+
+def test_events_are_fetched_from_the_last_seen_timestamp(fine_tune_api):
+    fine_tune_status = importlib.import_module("LNG_AI.fine_tune_status")
+    fine_tune_api.add_job("ft-a")
+    status_cache = fine_tune_status.FineTuneStatusCache()
+    status_cache.refresh()
+
+    messages = [event["message"] for event in status_cache.fetch_new_events("ft-a")]
+    assert messages == ["created ft-a", "running ft-a"]
+    assert fine_tune_api.list_events_calls == [("ft-a", None)]
+
+    # events of the last seen second are returned again, but reported once
+    fine_tune_api.add_event("ft-a", "epoch 1", created_at=2)
+    fine_tune_api.add_event("ft-a", "epoch 2", created_at=3)
+    messages = [event["message"] for event in status_cache.fetch_new_events("ft-a")]
+    assert messages == ["epoch 1", "epoch 2"]
+    assert fine_tune_api.list_events_calls[-1] == ("ft-a", 3 - 1)
+
+    # events of a finished job are complete, no more requests
+    status_cache.refresh(max_age_in_seconds=0)
+    assert [event["message"] for event in status_cache.fetch_new_events("ft-a")] == ["succeeded ft-a"]
+    num_of_list_events_calls = len(fine_tune_api.list_events_calls)
+    assert status_cache.fetch_new_events("ft-a") == []
+    assert len(fine_tune_api.list_events_calls) == num_of_list_events_calls
+    assert len(status_cache.get_job("ft-a")["events"]) == 5
+
+
+def test_sweep_launches_polls_and_evaluates_every_portion(fine_tune_api, openai_stub):
+    fine_tune_sweep = importlib.import_module("LNG_AI.fine_tune_sweep")
+    # jobs show up in listings a while after they are created
+    fine_tune_api.num_of_listings_until_visible = 3
+    _write_portion(10, 20)
+    _write_portion(100, 200)
+
+    uploaded_files = []
+
+    def create_file(file, purpose):
+        uploaded_files.append(file.name)
+        return {"id": f"file-{len(uploaded_files)}"}
+
+    openai_stub.File.create = create_file
+    openai_stub.Completion.create = lambda **_: {"choices": [{"text": "早安"}]}
+
+    portion_sweep = fine_tune_sweep.FineTuneSweep(
+        [0.1, 1], poll_interval_in_seconds=0, num_of_sentences_generated=3)
+    portion_sweep.run()
+
+    assert len(uploaded_files) == 2
+    with open(portion_sweep.sweep_path, "r") as sweep_file:
+        state = json.load(sweep_file)
+    assert set(state) == {"10", "100"}
+    for run in state.values():
+        assert run["status"] == "succeeded"
+        assert run["fine_tuned_model"] == f"babbage:{run['job_id']}"
+        assert fine_tune_api.jobs[run["job_id"]]["training_file"] == run["file_id"]
+        assert os.path.isfile(run["evaluation"]["generated_file_path"])
+
+    # a finished sweep resumes without any request
+    num_of_listings = fine_tune_api.list_cnt
+    fine_tune_sweep.FineTuneSweep([0.1, 1], poll_interval_in_seconds=0).run()
+    assert fine_tune_api.list_cnt == num_of_listings
+    assert len(uploaded_files) == 2
+
+
+def test_cost_is_estimated_for_unfinished_steps_only(fine_tune_api):
+    fine_tune_sweep = importlib.import_module("LNG_AI.fine_tune_sweep")
+    small_portion_path = _write_portion(10, 20)
+    _write_portion(100, 200)
+
+    def training_cost(jsonl_dataset_path):
+        num_of_chars = sum(len(jsonl["prompt"]) + len(jsonl["completion"])
+                           for jsonl in utils.JsonlUtils.iter_jsonls(jsonl_dataset_path))
+        # 2 tokens per character, 4 epochs
+        return num_of_chars * 2 / 1000 * constants.OpenaiBabbageCost.TRAINING_PER_1K_TOKENS.value * 4
+
+    usage_cost = 30 * constants.AVG_NUM_OF_TOKENS_PER_GENERATED_SENTENCE / 1000 * \
+        constants.OpenaiBabbageCost.USAGE_PER_1K_TOKENS.value
+
+    portion_sweep = fine_tune_sweep.FineTuneSweep(
+        [0.1, 1], num_of_sentences_generated=30)
+    assert portion_sweep.estimate_cost() == pytest.approx(
+        sum(training_cost(run["jsonl_dataset_path"]) for run in portion_sweep.state.values())
+        + 2 * usage_cost, abs=1e-4)
+
+    # the 100% job was launched & evaluated by an earlier run
+    portion_sweep.state["100"].update(job_id="ft-0", evaluation={})
+    assert portion_sweep.estimate_cost() == pytest.approx(
+        training_cost(small_portion_path) + usage_cost, abs=1e-4)
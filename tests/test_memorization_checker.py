@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from LNG_AI import memorization_checker
+
+
+def _random_text(rng, length: int, alphabet: str = "ab早說\x00") -> str:
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_suffix_array_matches_sorted_suffixes(seed):
+    rng = random.Random(seed)
+    text = _random_text(rng, rng.randint(0, 200))
+    assert memorization_checker.build_suffix_array(text).tolist() == sorted(
+        range(len(text)), key=lambda start: text[start:])
+
+
+def test_suffix_array_of_repetitive_text():
+    text = "早" * 100
+    assert memorization_checker.build_suffix_array(
+        text).tolist() == list(range(99, -1, -1))
+
+
+def _brute_force_longest_match(corpus: str, query: str) -> int:
+    length = 0
+    while length < len(query) and query[:length + 1] in corpus:
+        length += 1
+    return length
+
+
+def test_longest_matches_match_brute_force(tmp_path):
+    rng = random.Random(0)
+    corpus = _random_text(rng, 500)
+    checker = memorization_checker.MemorizationChecker(
+        corpus, cache_dir=str(tmp_path))
+    for _ in range(50):
+        sentence = _random_text(rng, 30, alphabet="ab早說")
+        assert checker.longest_matches(sentence) == [
+            _brute_force_longest_match(corpus, sentence[idx:]) for idx in range(len(sentence))]
+
+
+def test_matches_never_span_documents(tmp_path):
+    corpus = memorization_checker.DOCUMENT_SEPARATOR.join(["早晨你好", "再見"])
+    checker = memorization_checker.MemorizationChecker(
+        corpus, cache_dir=str(tmp_path))
+    assert checker.longest_matches("你好再見") == [2, 1, 2, 1]
+
+
+def test_check_sentences_reports_overlap(tmp_path):
+    corpus = "今日天氣好好 我哋去行山啦"
+    checker = memorization_checker.MemorizationChecker(
+        corpus, cache_dir=str(tmp_path))
+    report = checker.check_sentences(
+        ["我哋去行山啦", "完全唔同嘅句子"], min_match_length=4)
+    (copied, original) = report["sentences"]
+    assert copied["overlap_ratio"] == 1.0
+    assert copied["longest_match_length"] == 6
+    assert original["overlap_ratio"] == 0.0
+    assert report["summary"]["fully_copied_ratio"] == 0.5
+
+
+def test_suffix_array_is_cached(tmp_path):
+    memorization_checker.MemorizationChecker("早晨", cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    checker = memorization_checker.MemorizationChecker(
+        "早晨", cache_dir=str(tmp_path))
+    assert checker.suffix_array.tolist() == [0, 1]
+
+
+def test_diversity_metrics():
+    metrics = memorization_checker.compute_diversity_metrics(
+        ["abab", "abab"])
+    assert metrics["distinct_1"] == 0.25
+    assert metrics["distinct_2"] == pytest.approx(2 / 6, abs=1e-4)
+    assert metrics["repeated_sentence_ratio"] == 0.5
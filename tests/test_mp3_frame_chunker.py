@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from LNG_AI import mp3_frame_chunker
+
+# MPEG-1 layer III, 128 kbps, 44.1 kHz, joint stereo, no padding
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x44])
+FRAME_LENGTH = 144 * 128000 // 44100
+FRAME_IN_MILLISECONDS = 1000 * 1152 / 44100
+
+
+def _frame(idx: int) -> bytes:
+    # payload tagged with the frame index, so copies can be checked
+    payload = idx.to_bytes(4, "big") * ((FRAME_LENGTH - 4) // 4)
+    return FRAME_HEADER + payload.ljust(FRAME_LENGTH - 4, b"\x00")
+
+
+def _xing_frame() -> bytes:
+    # Xing tag right after the side info (32 bytes for stereo MPEG-1)
+    body = bytes(32) + b"Xing"
+    return FRAME_HEADER + body.ljust(FRAME_LENGTH - 4, b"\x00")
+
+
+def _write_mp3(path, num_of_frames: int, garbage_after: int = None) -> list:
+    """Write an mp3 with ID3v2/ID3v1 tags & a Xing frame, returns the audio frames"""
+    frames = [_frame(idx) for idx in range(num_of_frames)]
+    id3v2 = b"ID3" + bytes([4, 0, 0, 0, 0, 0, 20]) + bytes(20)
+    body = b""
+    for idx, frame in enumerate(frames):
+        body += frame
+        if idx == garbage_after:
+            body += b"\xFF\x00garbage\xFF"
+    with open(path, "wb") as mp3_file:
+        mp3_file.write(id3v2 + _xing_frame() + body +
+                       b"TAG" + bytes(mp3_frame_chunker.ID3V1_TAG_SIZE - 3))
+    return frames
+
+
+def test_parse_frame_header():
+    assert mp3_frame_chunker.parse_frame_header(FRAME_HEADER) == (
+        FRAME_LENGTH, 1152, 44100, 32)
+    assert mp3_frame_chunker.parse_frame_header(b"\x00\x00\x00\x00") is None
+    # free format bitrate is not supported
+    assert mp3_frame_chunker.parse_frame_header(
+        bytes([0xFF, 0xFB, 0x00, 0x44])) is None
+
+
+def test_frames_are_indexed_without_tags(tmp_path):
+    mp3_path = str(tmp_path / "full.mp3")
+    frames = _write_mp3(mp3_path, 100)
+    with mp3_frame_chunker.Mp3FrameChunker(mp3_path) as chunker:
+        assert len(chunker.frame_offsets) == 100 + 1
+        assert chunker.get_audio_length_in_milliseconds() == pytest.approx(
+            100 * FRAME_IN_MILLISECONDS)
+        assert chunker.read_range(0, 10 ** 9) == b"".join(frames)
+
+
+def test_resync_after_garbage(tmp_path):
+    mp3_path = str(tmp_path / "full.mp3")
+    frames = _write_mp3(mp3_path, 50, garbage_after=20)
+    with mp3_frame_chunker.Mp3FrameChunker(mp3_path) as chunker:
+        assert len(chunker.frame_offsets) == 50 + 1
+        assert chunker.read_range(
+            20.5 * FRAME_IN_MILLISECONDS, 10 ** 9) == b"".join(frames[21:])
+
+
+def test_range_holds_frames_starting_within_it(tmp_path):
+    mp3_path = str(tmp_path / "full.mp3")
+    frames = _write_mp3(mp3_path, 100)
+    with mp3_frame_chunker.Mp3FrameChunker(mp3_path) as chunker:
+        # frames 0..38 start before 1 second
+        assert chunker.read_range(0, 1000) == b"".join(frames[:39])
+        assert chunker.read_range(1000, 2000) == b"".join(frames[39:77])
+        assert chunker.read_range(5000, 6000) == b""
+
+
+def test_export_chucks_covers_all_frames_once(tmp_path):
+    mp3_path = str(tmp_path / "full.mp3")
+    frames = _write_mp3(mp3_path, 100)
+    with mp3_frame_chunker.Mp3FrameChunker(mp3_path) as chunker:
+        paths = chunker.export_chucks(str(tmp_path), 1000, "_1_sec_chuck")
+    assert [os.path.basename(path) for path in paths] == [
+        f"{idx}_1_sec_chuck.mp3" for idx in range(1, 4)]
+
+    exported = b""
+    for path in paths:
+        with open(path, "rb") as chuck_file:
+            exported += chuck_file.read()
+    assert exported == b"".join(frames)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from LNG_AI import constants
+from LNG_AI import rate_limiter
+
+SERVICE = constants.RequestService.OPENAI_COMPLETION
+
+
+def _quota(**overrides):
+    quota = {"rate_per_second": 1000.0, "burst": 1000,
+             "max_concurrency": 4, "target_latency_in_seconds": 1.0}
+    quota.update(overrides)
+    return quota
+
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = rate_limiter.TokenBucket(rate_per_second=2.0, capacity=3)
+    now = bucket._last_refill_time
+    for _ in range(3):
+        assert bucket.seconds_until_available(now) == 0
+        bucket.consume(now)
+    assert bucket.seconds_until_available(now) == pytest.approx(0.5)
+    assert bucket.seconds_until_available(now + 0.5) == 0
+
+    bucket.drain(now + 0.5)
+    assert bucket.seconds_until_available(now + 0.5) == pytest.approx(0.5)
+    # never refilled above capacity
+    bucket.seconds_until_available(now + 100)
+    assert bucket._tokens == 3
+
+
+def test_aimd_window_grows_on_success_and_halves_when_rate_limited():
+    limiter = rate_limiter.ServiceLimiter(SERVICE, _quota())
+    now = time.monotonic()
+    for _ in range(20):
+        limiter.on_start(now)
+        limiter.on_finish(now, 0.1)
+    assert limiter.concurrency_limit == 4
+
+    limiter.on_start(now)
+    limiter.on_finish(now, 0.1, rate_limiter.RateLimitedError(
+        "429", retry_after=3))
+    assert limiter.concurrency_limit == 2
+    assert limiter.seconds_until_available(now + 1) == pytest.approx(2)
+    assert limiter.metrics()["rate_limited_cnt"] == 1
+
+    # slow responses shrink the window too
+    limiter.on_start(now + 5)
+    limiter.on_finish(now + 5, 2.0)
+    assert limiter.concurrency_limit == pytest.approx(1.6)
+
+
+def test_in_flight_requests_are_bounded_by_the_window():
+    limiter = rate_limiter.ServiceLimiter(SERVICE, _quota())
+    now = time.monotonic()
+    limiter.on_start(now)
+    assert limiter.seconds_until_available(now) is None
+    limiter.on_finish(now, 0.1)
+    assert limiter.seconds_until_available(now) == 0
+
+
+def test_scheduler_retries_retryable_errors_only():
+    scheduler = rate_limiter.RequestScheduler({SERVICE: _quota()}, max_retries=2)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise rate_limiter.RetryableRequestError("503", retry_after=0.01)
+        return "ok"
+
+    assert scheduler.call(SERVICE, flaky) == "ok"
+    assert len(attempts) == 3
+
+    def always_failing():
+        raise rate_limiter.RetryableRequestError("503", retry_after=0.01)
+
+    with pytest.raises(rate_limiter.RetryableRequestError):
+        scheduler.call(SERVICE, always_failing)
+
+    def broken():
+        raise ValueError("not retried")
+
+    with pytest.raises(ValueError):
+        scheduler.call(SERVICE, broken)
+    assert scheduler.metrics()[SERVICE.value]["failure_cnt"] == 6
+
+
+def test_scheduler_bounds_concurrency_across_threads():
+    scheduler = rate_limiter.RequestScheduler(
+        {SERVICE: _quota(max_concurrency=2)})
+    lock = threading.Lock()
+    in_flight = [0]
+    max_in_flight = [0]
+
+    def request():
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+    threads = [threading.Thread(target=scheduler.call, args=(SERVICE, request))
+               for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_in_flight[0] <= 2
+    assert scheduler.queue_depth() == 0
+    assert scheduler.metrics()[SERVICE.value]["total_cnt"] == 16
+
+
+def test_openai_server_errors_are_retried(openai_stub, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "MAX_BACKOFF_IN_SECONDS", 0)
+    errors = [openai_stub.error.APIError("bad gateway", http_status=502),
+              openai_stub.error.ServiceUnavailableError("overloaded")]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert rate_limiter.call_openai(SERVICE, flaky) == "ok"
+
+    attempts = []
+
+    def rejected(error):
+        attempts.append(error)
+        raise error
+
+    for error in [openai_stub.error.APIError("conflict", http_status=400),
+                  openai_stub.error.InvalidRequestError("no such model")]:
+        with pytest.raises(type(error)):
+            rate_limiter.call_openai(SERVICE, rejected, error)
+    assert len(attempts) == 2
@@ -0,0 +1,66 @@
+import pytest
+
+from LNG_AI import repair_plan
+from LNG_AI import utils
+
+MINUTE = 60 * 1000
+
+
+@pytest.mark.parametrize("chuck_name, expected_range", [
+    ("one_minute_preview", (0, MINUTE)),
+    ("1_5_mins_chuck", (0, 5 * MINUTE)),
+    ("3_5_mins_chuck", (10 * MINUTE, 15 * MINUTE)),
+    ("2_30_mins_chuck", (30 * MINUTE, 42 * MINUTE)),
+    ("1_hour_chuck", (0, 42 * MINUTE)),
+])
+def test_get_chuck_range(chuck_name, expected_range):
+    assert repair_plan.get_chuck_range(chuck_name, 42 * MINUTE) == expected_range
+
+
+def test_plan_round_trip_without_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.AudioUtils, "get_audio_length_in_milliseconds",
+                        staticmethod(lambda _: 12 * MINUTE))
+    plan = repair_plan.RepairPlan()
+    assert plan.is_empty()
+
+    for _ in range(2):
+        plan.add_refetch_video("audio_files/video_a")
+        plan.add_reexport_chuck("audio_files/video_b", "3_5_mins_chuck")
+        plan.add_retranscribe_chuck(
+            "audio_files/video_b", "1_5_mins_chuck", "repetitive",
+            repair_plan.REPETITIVE_TRANSCRIPT_PARAMETERS)
+    assert str(plan) == ("1 videos to re-fetch, 1 chucks to re-export, "
+                         "1 chucks to re-transcribe")
+    assert plan.reexport_chucks[0]["begin_in_milliseconds"] == 10 * MINUTE
+    assert plan.reexport_chucks[0]["end_in_milliseconds"] == 12 * MINUTE
+
+    plan_path = str(tmp_path / "repair_plan.json")
+    plan.save(plan_path)
+    loaded = repair_plan.RepairPlan.load(plan_path)
+    assert loaded.refetch_videos == [{"video_id": "video_a"}]
+    assert loaded.reexport_chucks == plan.reexport_chucks
+    assert loaded.retranscribe_chucks == plan.retranscribe_chucks
+
+
+class _RecordingTranscriber():
+    def __init__(self):
+        self.calls = []
+
+    def transcribe_file(self, audio_path, overwrite=False, transcribe_parameters=None):
+        self.calls.append((audio_path, overwrite, transcribe_parameters))
+
+
+def test_executor_retranscribes_with_plan_parameters():
+    plan = repair_plan.RepairPlan()
+    plan.add_retranscribe_chuck(
+        "audio_files/video_b", "1_5_mins_chuck", "repetitive",
+        repair_plan.REPETITIVE_TRANSCRIPT_PARAMETERS)
+    plan.add_retranscribe_chuck(
+        "audio_files/video_b", "2_5_mins_chuck", "missing")
+
+    transcriber = _RecordingTranscriber()
+    repair_plan.RepairExecutor(transcriber=transcriber).execute(plan)
+    assert transcriber.calls == [
+        ("audio_files/video_b/1_5_mins_chuck.mp3", True, {"temperature": 0.2}),
+        ("audio_files/video_b/2_5_mins_chuck.mp3", True, {}),
+    ]
@@ -0,0 +1,126 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+
+class FakeResponse():
+    def __init__(self, json_body: dict, status_code: int = 200):
+        self.json_body = json_body
+        self.status_code = status_code
+
+    def json(self):
+        return self.json_body
+
+    def raise_for_status(self):
+        assert self.status_code < 400
+
+
+@pytest.fixture
+def uploader_module(openai_stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    uploader_module = importlib.import_module("LNG_AI.training_file_uploader")
+
+    created_files = []
+
+    def create_file(file, purpose):
+        created_files.append(file.read())
+        # slow enough for concurrent uploads to overlap
+        time.sleep(0.05)
+        return {"id": f"file-{len(created_files)}"}
+
+    openai_stub.File.create = create_file
+    openai_stub.File.retrieve = lambda file_id: {"id": file_id}
+    uploader_module.created_files = created_files
+    return uploader_module
+
+
+def _write_dataset(path: str, content: bytes) -> str:
+    with open(path, "wb") as dataset_file:
+        dataset_file.write(content)
+    return path
+
+
+def test_same_content_is_uploaded_once(uploader_module, openai_stub):
+    dataset_path = _write_dataset("dataset.jsonl", b'{"prompt": "a", "completion": "b"}\n')
+    copy_path = _write_dataset("copy.jsonl", b'{"prompt": "a", "completion": "b"}\n')
+
+    assert uploader_module.TrainingFileUploader("registry.json").upload(dataset_path) == "file-1"
+    # the registry is shared with later processes, identical content is reused by hash
+    uploader = uploader_module.TrainingFileUploader("registry.json")
+    assert uploader.upload(copy_path) == "file-1"
+    assert len(uploader_module.created_files) == 1
+    assert [name for name in os.listdir(".") if name.endswith(".tmp")] == []
+
+    # a file deleted remotely is uploaded again
+    def retrieve(file_id):
+        raise openai_stub.error.InvalidRequestError(f"no such file: {file_id}")
+
+    openai_stub.File.retrieve = retrieve
+    assert uploader.upload(dataset_path) == "file-2"
+
+
+def test_content_hash_is_cached_by_size_and_mtime(uploader_module, monkeypatch):
+    dataset_path = _write_dataset("dataset.jsonl", b"first")
+    uploader = uploader_module.TrainingFileUploader("registry.json")
+    content_hash = uploader._get_content_hash(dataset_path)
+
+    # unchanged file, the hash is not computed again
+    sha256 = uploader_module.hashlib.sha256
+    monkeypatch.setattr(uploader_module.hashlib, "sha256", None)
+    assert uploader_module.TrainingFileUploader(
+        "registry.json")._get_content_hash(dataset_path) == content_hash
+
+    monkeypatch.setattr(uploader_module.hashlib, "sha256", sha256)
+    _write_dataset(dataset_path, b"second!")
+    assert uploader._get_content_hash(dataset_path) != content_hash
+
+
+def test_upload_by_parts_resumes_from_the_next_part(uploader_module, monkeypatch):
+    monkeypatch.setattr(uploader_module, "UPLOAD_PART_SIZE_IN_BYTES", 4)
+    dataset_path = _write_dataset("dataset.jsonl", b"0123456789")
+    requests = []
+    is_interrupted = [True]
+
+    def request(method, url, **kwargs):
+        path = url.split("/v1/")[-1]
+        requests.append(path)
+        if path == "uploads":
+            return FakeResponse({"id": "upload-1", "expires_at": time.time() + 3600})
+        if path.endswith("/parts"):
+            # the connection drops for good after the first part
+            if len(requests) == 3 and is_interrupted[0]:
+                raise RuntimeError("connection dropped")
+            return FakeResponse({"id": f"part-{kwargs['files']['data'].decode()}"})
+        return FakeResponse({"file": {"id": "file-parts"}, "part_ids": kwargs["json"]["part_ids"]})
+
+    monkeypatch.setattr(sys.modules["requests"], "request", request, raising=False)
+    with pytest.raises(RuntimeError):
+        uploader_module.TrainingFileUploader("registry.json").upload(dataset_path)
+    assert requests == ["uploads", "uploads/upload-1/parts", "uploads/upload-1/parts"]
+
+    is_interrupted[0] = False
+    requests.clear()
+    uploader = uploader_module.TrainingFileUploader("registry.json")
+    assert uploader.upload(dataset_path) == "file-parts"
+    assert requests == ["uploads/upload-1/parts", "uploads/upload-1/parts", "uploads/upload-1/complete"]
+    assert uploader.registry["pending"] == {}
+    assert uploader_module.created_files == []
+
+
+def test_concurrent_uploads_of_the_same_content_are_deduplicated(uploader_module):
+    dataset_path = _write_dataset("dataset.jsonl", b'{"prompt": "a", "completion": "b"}\n')
+    uploader = uploader_module.TrainingFileUploader("registry.json")
+
+    file_ids = []
+    threads = [threading.Thread(target=lambda: file_ids.append(uploader.upload(dataset_path)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert file_ids == ["file-1"] * 4
+    assert len(uploader_module.created_files) == 1
@@ -0,0 +1,116 @@
+import os
+import random
+import re
+
+import pytest
+
+from LNG_AI import transcript_index
+
+NON_CJK_WORD_PATTERN = re.compile(
+    f"[^\\W{transcript_index.CJK_CHARACTERS}]")
+
+
+def _write_transcript(episode: str, chuck: str, text: str):
+    transcript_dir = f"audio_files/{episode}/whisper"
+    os.makedirs(transcript_dir, exist_ok=True)
+    with open(f"{transcript_dir}/{chuck}.txt", "w", encoding="utf-8") as transcript_file:
+        transcript_file.write(text)
+
+
+def _brute_force_phrase(texts: dict, phrase: str) -> list:
+    """Occurrences of the phrase which do not cut a latin word at either end"""
+    query = transcript_index.normalize(phrase).strip()
+
+    def is_word_char(char):
+        return NON_CJK_WORD_PATTERN.fullmatch(char) is not None
+
+    hits = []
+    for (episode, chuck), text in sorted(texts.items()):
+        text = transcript_index.normalize(text)
+        for offset in range(len(text) - len(query) + 1):
+            if text[offset:offset + len(query)] != query:
+                continue
+            if is_word_char(query[0]) and offset > 0 and is_word_char(text[offset - 1]):
+                continue
+            end = offset + len(query)
+            if is_word_char(query[-1]) and end < len(text) and is_word_char(text[end]):
+                continue
+            hits.append((episode, chuck, offset))
+    return hits
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("audio_files")
+    return transcript_index.TranscriptIndex(index_root="transcript_index")
+
+
+def test_phrase_search_matches_brute_force(index):
+    rng = random.Random(0)
+    alphabet = ["a", "b", "ab", " ", " ", ",", "早", "說", "晨", "你好"]
+    texts = {}
+    # several updates, so queries span segments (and a compaction)
+    for update in range(transcript_index.MAX_NUM_OF_SEGMENTS + 2):
+        for chuck in range(3):
+            key = (f"episode_{update}", f"{chuck + 1}_5_mins_chuck")
+            texts[key] = "".join(rng.choice(alphabet) for _ in range(60))
+            _write_transcript(*key, texts[key])
+        index.update()
+
+    queries = []
+    for _ in range(300):
+        text = rng.choice(list(texts.values()))
+        begin = rng.randrange(len(text))
+        queries.append(text[begin:begin + rng.randint(1, 6)])
+    queries += ["a b", "早 說", "a說早", "ab,"]
+    for query in queries:
+        if not transcript_index.tokenize_query(transcript_index.normalize(query).strip()):
+            continue
+        hits = [(hit["episode"], hit["chuck"], hit["offset"])
+                for hit in index.search_phrase(query)]
+        assert hits == _brute_force_phrase(texts, query), query
+
+
+def test_phrase_search_checks_characters_between_terms(index):
+    _write_transcript("episode", "1_5_mins_chuck", "hello說world a說早")
+    index.update()
+    assert index.search_phrase("hello world") == []
+    assert index.search_phrase("a 早") == []
+    assert [hit["offset"] for hit in index.search_phrase("hello說world")] == [0]
+    assert [hit["offset"] for hit in index.search_phrase("a說早")] == [12]
+
+
+def test_queries_covered_by_terms_do_not_read_transcripts(index, monkeypatch):
+    _write_transcript("episode", "1_5_mins_chuck", "早晨你好 hello說world")
+    index.update()
+
+    def read_doc_text(doc_id):
+        raise AssertionError("transcript read")
+
+    monkeypatch.setattr(index, "_read_doc_text", read_doc_text)
+    assert [hit["offset"] for hit in index.search_phrase("早晨你好")] == [0]
+    assert [hit["offset"] for hit in index.search_phrase("晨")] == [1]
+    assert [hit["offset"] for hit in index.search_phrase("hello說world")] == [5]
+    with pytest.raises(AssertionError):
+        index.search_phrase("你好 hello")
+
+
+def test_retranscribed_doc_replaces_old_version(index):
+    _write_transcript("episode", "1_5_mins_chuck", "早晨 hello")
+    index.update()
+    assert len(index.search_phrase("早晨")) == 1
+
+    _write_transcript("episode", "1_5_mins_chuck", "hello world")
+    os.utime("audio_files/episode/whisper/1_5_mins_chuck.txt", (0, 0))
+    assert index.update() == 1
+    assert index.search_phrase("早晨") == []
+    assert len(index.search_phrase("hello world")) == 1
+
+
+def test_proximity_search(index):
+    _write_transcript("episode", "1_5_mins_chuck", "早晨 hello there world 早晨")
+    index.update()
+    hits = index.search_proximity("hello", "world", max_distance=12)
+    assert [(hit["offset_a"], hit["offset_b"]) for hit in hits] == [(3, 15)]
+    assert index.search_proximity("hello", "world", max_distance=5) == []
@@ -0,0 +1,98 @@
+import contextlib
+import os
+import time
+
+import pytest
+
+from LNG_AI import constants
+from LNG_AI import work_lease
+
+KIND = constants.LeaseKind.CHUCK
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return work_lease.LeaseManager(str(tmp_path / "leases"), lease_in_seconds=0.2)
+
+
+def test_lease_is_held_until_released(manager):
+    lease = manager.try_claim(KIND, "video/1_5_mins_chuck/whisper")
+    assert lease is not None
+    assert os.path.basename(lease.lease_path) == "video__1_5_mins_chuck__whisper.lease"
+    assert manager.try_claim(KIND, "video/1_5_mins_chuck/whisper") is None
+    # other keys are independent
+    assert manager.try_claim(KIND, "video/2_5_mins_chuck/whisper") is not None
+
+    lease.release()
+    assert manager.try_claim(KIND, "video/1_5_mins_chuck/whisper") is not None
+
+
+def test_expired_lease_is_taken_over(manager, monkeypatch):
+    crashed_lease = manager.try_claim(KIND, "video")
+    time.sleep(0.3)
+
+    # another worker breaks the expired lease & claims it
+    monkeypatch.setattr(work_lease, "WORKER_ID", "other-worker")
+    lease = manager.try_claim(KIND, "video")
+    assert lease is not None
+    assert manager.read_lease(lease.lease_path)["owner"] == "other-worker"
+    assert not [name for name in os.listdir(os.path.dirname(lease.lease_path))
+                if name.endswith(".stale")]
+
+    # the first worker has lost it: no renewal, releasing keeps the new owner's lease
+    monkeypatch.undo()
+    assert not crashed_lease.renew()
+    crashed_lease.release()
+    assert manager.read_lease(lease.lease_path)["owner"] == "other-worker"
+
+
+def test_heartbeat_keeps_a_lease_alive(manager, monkeypatch):
+    with manager.try_claim(KIND, "video") as lease:
+        time.sleep(0.5)
+        monkeypatch.setattr(work_lease, "WORKER_ID", "other-worker")
+        assert manager.try_claim(KIND, "video") is None
+        monkeypatch.undo()
+    assert not os.path.exists(lease.lease_path)
+
+
+def test_release_waits_for_a_renewal_in_progress(manager, monkeypatch):
+    atomic_output_path = work_lease.atomic_output_path
+
+    @contextlib.contextmanager
+    def slow_atomic_output_path(path):
+        with atomic_output_path(path) as tmp_path:
+            yield tmp_path
+            time.sleep(0.05)
+
+    # renewal every 10ms, each one still writing when the lease is released
+    manager.lease_in_seconds = 0.03
+    monkeypatch.setattr(work_lease, "atomic_output_path", slow_atomic_output_path)
+    for _ in range(5):
+        with manager.try_claim(KIND, "video") as lease:
+            time.sleep(0.02)
+        time.sleep(0.1)
+        assert not os.path.exists(lease.lease_path)
+        assert not lease.renew()
+
+
+def test_claim_times_out(manager):
+    manager.lease_in_seconds = 60
+    manager.try_claim(KIND, "video")
+    assert manager.claim(KIND, "video", timeout_in_seconds=0.05,
+                         poll_in_seconds=0.01) is None
+
+
+def test_atomic_output_is_replaced_on_success_only(tmp_path):
+    output_path = str(tmp_path / "1_5_mins_chuck.txt")
+    work_lease.write_text_atomically(output_path, "早晨")
+    with open(output_path, "r", encoding="utf-8") as output_file:
+        assert output_file.read() == "早晨"
+
+    with pytest.raises(RuntimeError):
+        with work_lease.atomic_output_path(output_path) as tmp_output_path:
+            with open(tmp_output_path, "w", encoding="utf-8") as output_file:
+                output_file.write("partial")
+            raise RuntimeError("crashed while writing")
+    with open(output_path, "r", encoding="utf-8") as output_file:
+        assert output_file.read() == "早晨"
+    assert os.listdir(tmp_path) == ["1_5_mins_chuck.txt"]